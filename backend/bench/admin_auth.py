@@ -0,0 +1,66 @@
+"""
+Admin request latency by credential: the session cookie (no database), a
+bearer token with the user cache, and a bearer token that reads the user
+from Mongo on every request (AUTH_USER_TTL_S=0, the old behaviour). Runs
+in-process against MONGO_URL / DB_NAME, creating a throwaway user.
+
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m bench.admin_auth --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+async def measure(cx: httpx.AsyncClient, n: int, **kwargs) -> list:
+    timings = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        r = await cx.get("/api/diag/cache", **kwargs)
+        r.raise_for_status()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+
+def report(label: str, timings: list):
+    timings = sorted(timings)
+    p = lambda q: timings[min(int(q * len(timings)), len(timings) - 1)]
+    print(f"{label:<28} p50 {p(0.50):6.3f} ms  p95 {p(0.95):6.3f} ms  p99 {p(0.99):6.3f} ms  mean {statistics.mean(timings):6.3f} ms")
+
+
+async def run(args):
+    import server
+
+    server.connect_mongo()
+    if server.db is None:
+        raise SystemExit("Set MONGO_URL (and DB_NAME) to a Mongo instance to run this benchmark.")
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    await server.db.users.insert_one({"email": email, "role": "admin", "hashed_password": "-"})
+    try:
+        bearer = {"Authorization": f"Bearer {server.create_access_token({'sub': email})}"}
+        cookie = {"session": server._create_token("admin")}
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as cx:
+            await measure(cx, 50, cookies=cookie)  # warm up
+            report("session cookie", await measure(cx, args.requests, cookies=cookie))
+            report("bearer, user cached", await measure(cx, args.requests, headers=bearer))
+            server.AUTH_USER_TTL_S = 0
+            report("bearer, DB lookup each", await measure(cx, args.requests, headers=bearer))
+    finally:
+        await server.db.users.delete_one({"email": email})
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=2000)
+    args = ap.parse_args()
+    os.environ.setdefault("JWT_SECRET", "bench")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Caption burst: fires concurrent /api/ai/caption requests at the API (backed
+by a fake OpenAI with a fixed delay) and samples /health latency meanwhile.
+A blocking provider call would push /health latency up to the provider delay.
+Each caption asks about a different artwork so the cache and single-flight
+cannot fold the burst into one upstream call. Exits 1 if a caption fails, the
+provider saw fewer calls than were sent, or /health p99 exceeds --max-p99-ms.
+
+    cd backend && python -m bench.caption_burst --captions 8 --latency 2 --max-p99-ms 250
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+from bench.fakes import fake_openai, serve
+
+
+def caption_body(i: int) -> dict:
+    return {"title": f"Red Sun {i}", "year": 2000 + i % 25, "medium": "Acrylic", "dimensions": f"{60 + i}x80 cm"}
+
+
+async def run(api: str, captions: int, duration_s: float, provider_calls: dict, max_p99_ms: float) -> bool:
+    async with httpx.AsyncClient(base_url=api, timeout=120) as cx:
+        burst = [asyncio.create_task(cx.post("/api/ai/caption", json=caption_body(i))) for i in range(captions)]
+        samples = []
+        end = time.perf_counter() + duration_s
+        while time.perf_counter() < end:
+            t0 = time.perf_counter()
+            r = await cx.get("/health")
+            r.raise_for_status()
+            samples.append((time.perf_counter() - t0) * 1000)
+            await asyncio.sleep(0.05)
+        statuses = [r.status_code for r in await asyncio.gather(*burst)]
+    samples.sort()
+    p99 = samples[max(int(len(samples) * 0.99) - 1, 0)]
+    print(f"captions: {captions} -> statuses {sorted(set(statuses))}, provider calls {provider_calls['n']}")
+    print(f"/health samples: {len(samples)}  p50 {statistics.median(samples):.1f} ms  "
+          f"p99 {p99:.1f} ms  max {samples[-1]:.1f} ms")
+
+    failures = []
+    if any(s != 200 for s in statuses):
+        failures.append("some captions failed")
+    if provider_calls["n"] < captions:
+        failures.append(f"provider saw {provider_calls['n']} calls for {captions} distinct captions")
+    if p99 > max_p99_ms:
+        failures.append(f"/health p99 {p99:.1f} ms is over {max_p99_ms:.0f} ms")
+    for f in failures:
+        print(f"FAIL: {f}")
+    return not failures
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--captions", type=int, default=8)
+    ap.add_argument("--latency", type=float, default=2.0, help="fake provider delay in seconds")
+    ap.add_argument("--max-p99-ms", type=float, default=250.0, help="fail if /health p99 is above this")
+    args = ap.parse_args()
+
+    provider_app = fake_openai(args.latency)
+    provider = serve(provider_app)
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    os.environ["OPENAI_BASE_URL"] = provider + "/v1"
+    os.environ.setdefault("JWT_SECRET", "bench")
+
+    import server
+    api = serve(server.app)
+    ok = asyncio.run(run(api, args.captions, args.latency * 1.5, provider_app.state.calls, args.max_p99_ms))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Checkout burst: several buyers race for one original while each double-clicks
+"buy", against a local fake Stripe with a slow create call. Reports how many
+Stripe sessions were created (one expected), the status codes buyers saw,
+create-session latency, and /health latency during the burst (which stays flat
+now that the Stripe call runs off the event loop). Then checks the hold
+outlives the Stripe session, backdates the hold to let it lapse, and checks the
+artwork is released.
+
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m bench.checkout_burst --buyers 8 --clicks 3
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from bench.fakes import fake_stripe, serve
+
+
+def pct(samples: list, q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(q * len(samples)), len(samples) - 1)] if samples else 0.0
+
+
+async def buy(cx: httpx.AsyncClient, art_id: str, email: str, out: list):
+    t0 = time.perf_counter()
+    r = await cx.post("/api/checkout/create-session", data={"artworkId": art_id, "buyerEmail": email})
+    out.append((email, r.status_code, r.json().get("id"), (time.perf_counter() - t0) * 1000))
+
+
+async def health(cx: httpx.AsyncClient, stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        (await cx.get("/health")).raise_for_status()
+        samples.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(0.02)
+
+
+async def run(args, server, fake_state: dict):
+    art = await server.db.artworks.insert_one({**server.new_doc_ids(), "title": "Bench original", "priceCents": 120000, "category": "Painting", "status": "available"})
+    art_id = str(art.inserted_id)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=60) as cx:
+            stop, lag = asyncio.Event(), []
+            sampler = asyncio.create_task(health(cx, stop, lag))
+            results = []
+            await asyncio.gather(*(
+                buy(cx, art_id, f"buyer{b}@example.com", results)
+                for b in range(args.buyers) for _ in range(args.clicks)
+            ))
+            stop.set()
+            await sampler
+
+            statuses = {}
+            for _, code, _, _ in results:
+                statuses[code] = statuses.get(code, 0) + 1
+            winners = {email for email, code, _, _ in results if code == 200}
+            sessions = {sid for _, code, sid, _ in results if code == 200}
+            ms = [t for *_, t in results]
+            print(f"requests {len(results)}  statuses {dict(sorted(statuses.items()))}")
+            print(f"winning buyers {len(winners)}  distinct sessions {len(sessions)}  stripe calls {fake_state['calls']}  created {fake_state['created']}")
+            print(f"create-session p50 {pct(ms, 0.5):7.1f} ms  p99 {pct(ms, 0.99):7.1f} ms")
+            print(f"/health during burst p50 {pct(lag, 0.5):7.1f} ms  p99 {pct(lag, 0.99):7.1f} ms  (n={len(lag)})")
+
+            doc = await server.db.artworks.find_one({"_id": art.inserted_id})
+            print(f"artwork status after burst: {doc.get('status')}")
+            hold_end = doc["reservation"]["expiresAt"].replace(tzinfo=timezone.utc).timestamp()
+            session_end = max(s["expires_at"] for s in fake_state["sessions"].values())
+            print(f"hold outlives the session by {hold_end - session_end:.0f}s")
+            await server.db.artworks.update_one(
+                {"_id": art.inserted_id}, {"$set": {"reservation.expiresAt": datetime.utcnow() - timedelta(seconds=1)}},
+            )
+            released = await server.release_expired_reservations()
+            doc = await server.db.artworks.find_one({"_id": art.inserted_id})
+            print(f"after the hold lapsed: released {released}, status {doc.get('status')}")
+    finally:
+        await server.db.artworks.delete_one({"_id": art.inserted_id})
+        await server.db.checkouts.delete_many({"artworkId": art_id})
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--buyers", type=int, default=8)
+    ap.add_argument("--clicks", type=int, default=3, help="concurrent create-session calls per buyer")
+    ap.add_argument("--stripe-latency", type=float, default=1.0)
+    args = ap.parse_args()
+
+    fake = fake_stripe(latency_s=args.stripe_latency)
+    os.environ.setdefault("JWT_SECRET", "bench")
+    os.environ["STRIPE_SECRET_KEY"] = "sk_test_bench"
+    os.environ["STRIPE_API_BASE"] = serve(fake)
+    import server
+
+    server.connect_mongo()
+    if server.db is None:
+        raise SystemExit("Set MONGO_URL (and DB_NAME) to a Mongo instance to run this benchmark.")
+    asyncio.run(run(args, server, fake.state.stripe))
+
+
+if __name__ == "__main__":
+    main()
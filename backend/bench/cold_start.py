@@ -0,0 +1,87 @@
+"""
+Cold start: boots `uvicorn server:app` in a fresh interpreter several times
+and measures time from process spawn to the first 200 from /health, the
+number autoscaled instances and worker restarts pay. --eager-sdks preloads
+the provider SDKs (openai, google.genai, stripe, PIL) before uvicorn imports the
+app, which reproduces the old module-level imports for a before/after run.
+--profile also prints the app's STARTUP_PROFILE line from the last boot.
+
+    cd backend && python -m bench.cold_start --runs 5
+    cd backend && python -m bench.cold_start --runs 5 --eager-sdks
+"""
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+EAGER_SDKS = ("openai", "google.genai", "stripe", "PIL.Image")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _health_ok(port: int) -> bool:
+    # http.client rather than httpx: a poll every few ms must stay cheap, or the
+    # poller competes with the booting server for CPU.
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=0.5)
+    try:
+        conn.request("GET", "/health")
+        return conn.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        conn.close()
+
+
+def boot_once(eager: bool, profile: bool, timeout_s: float) -> tuple:
+    port = _free_port()
+    preload = "".join(f"import {m}; " for m in EAGER_SDKS) if eager else ""
+    code = f"{preload}import uvicorn; uvicorn.run('server:app', host='127.0.0.1', port={port}, log_level='info')"
+    env = {**os.environ, "JWT_SECRET": os.environ.get("JWT_SECRET", "bench"), "STARTUP_PROFILE": "1" if profile else "0"}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise SystemExit(f"server exited early:\n{proc.stdout.read()}")
+            if _health_ok(port):
+                elapsed = time.perf_counter() - t0
+                break
+            if time.perf_counter() - t0 > timeout_s:
+                raise SystemExit("timed out waiting for /health")
+            time.sleep(0.005)
+    finally:
+        proc.terminate()
+        out, _ = proc.communicate(timeout=10)
+    profile_line = next((line for line in out.splitlines() if "Startup profile" in line), "")
+    return elapsed, profile_line
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--eager-sdks", action="store_true", help="import the provider SDKs up front, as before")
+    ap.add_argument("--profile", action="store_true", help="run with STARTUP_PROFILE=1 and show its report")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    args = ap.parse_args()
+
+    times, line = [], ""
+    for _ in range(args.runs):
+        elapsed, line = boot_once(args.eager_sdks, args.profile, args.timeout)
+        times.append(elapsed * 1000)
+    label = "eager SDK imports" if args.eager_sdks else "lazy SDK imports"
+    print(f"{label}: time to first /health  median {statistics.median(times):6.0f} ms  "
+          f"min {min(times):6.0f} ms  max {max(times):6.0f} ms  (n={len(times)})")
+    if args.profile and line:
+        print(line.split(" - ")[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Local stand-ins for the upstream providers the API talks to, so the bench
+scripts run without network access or API keys.
+
+Each fake is a tiny Starlette app; serve() runs it with uvicorn on a free
+localhost port in a background thread and returns its base URL.
+"""
+import asyncio
+import socket
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(app, port: int = 0) -> str:
+    port = port or _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("fake server did not start")
+        time.sleep(0.02)
+    return f"http://127.0.0.1:{port}"
+
+
+def _upload_delay(body: bytes, bytes_per_s: float) -> float:
+    return len(body) / bytes_per_s if bytes_per_s else 0.0
+
+
+def fake_openai(latency_s: float = 2.0, bytes_per_s: float = 0):
+    """
+    Chat completions endpoint that answers in the DESC/TAGS format after
+    latency_s, plus len(body)/bytes_per_s to model upload bandwidth.
+    """
+    calls = {"n": 0, "bytes": 0}
+
+    async def completions(request: Request):
+        calls["n"] += 1
+        body = await request.body()
+        calls["bytes"] = len(body)
+        await asyncio.sleep(latency_s + _upload_delay(body, bytes_per_s))
+        return JSONResponse({
+            "id": f"chatcmpl-{calls['n']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "fake",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {
+                    "role": "assistant",
+                    "content": "DESC: Acrylic on canvas, painted in 2024.\nTAGS: #one #two #three #four #five",
+                },
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    app = Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+    app.state.calls = calls
+    return app
+
+
+def _tiny_png() -> bytes:
+    from io import BytesIO
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.new("RGB", (64, 80), (200, 180, 150)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def fake_gemini(latency_s: float = 3.0, bytes_per_s: float = 0):
+    """
+    generateContent endpoint that returns a small PNG as inline_data after
+    latency_s, plus len(body)/bytes_per_s to model upload bandwidth.
+    """
+    import base64
+
+    calls = {"n": 0, "bytes": 0}
+    png_b64 = base64.b64encode(_tiny_png()).decode("ascii")
+
+    async def generate(request: Request):
+        calls["n"] += 1
+        body = await request.body()
+        calls["bytes"] = len(body)
+        await asyncio.sleep(latency_s + _upload_delay(body, bytes_per_s))
+        return JSONResponse({
+            "candidates": [{"content": {"parts": [
+                {"text": "staged"},
+                {"inlineData": {"mimeType": "image/png", "data": png_b64}},
+            ]}}],
+        })
+
+    app = Starlette(routes=[Route("/v1beta/models/{model}", generate, methods=["POST"])])
+    app.state.calls = calls
+    return app
+
+
+def fake_make(fail_first: int = 0, fail_status: int = 500, latency_s: float = 0.0):
+    """Make webhook receiver: fails the first fail_first calls with fail_status, then accepts."""
+    state = {"calls": 0, "received": [], "keys": []}
+
+    async def hook(request: Request):
+        state["calls"] += 1
+        body = await request.json()
+        await asyncio.sleep(latency_s)
+        if state["calls"] <= fail_first:
+            return JSONResponse({"error": "temporarily unavailable"}, status_code=fail_status)
+        state["received"].append(body)
+        state["keys"].append(request.headers.get("idempotency-key"))
+        return JSONResponse({"accepted": True})
+
+    app = Starlette(routes=[Route("/hook", hook, methods=["POST"])])
+    app.state.hook = state
+    return app
+
+
+def fake_stripe(latency_s: float = 0.5):
+    """
+    Checkout Sessions endpoint (set STRIPE_API_BASE to its URL). Replays the
+    stored response for a repeated Idempotency-Key the way Stripe does, rejects
+    an expires_at less than 30 minutes out like Stripe, and counts how many
+    sessions were actually created.
+    """
+    state = {"calls": 0, "created": 0, "sessions": {}, "by_key": {}}
+
+    async def create_session(request: Request):
+        state["calls"] += 1
+        form = await request.form()
+        await asyncio.sleep(latency_s)
+        key = request.headers.get("idempotency-key")
+        if key and key in state["by_key"]:
+            return JSONResponse(state["by_key"][key], headers={"idempotent-replayed": "true"})
+        expires_at = int(form.get("expires_at") or time.time() + 1800)
+        if expires_at < time.time() + 1800:
+            return JSONResponse({"error": {
+                "type": "invalid_request_error", "param": "expires_at",
+                "message": "The `expires_at` timestamp must be at least 30 minutes from Checkout Session creation.",
+            }}, status_code=400)
+        state["created"] += 1
+        sid = f"cs_test_{state['created']:06d}"
+        session = {
+            "id": sid,
+            "object": "checkout.session",
+            "url": f"https://checkout.stripe.test/pay/{sid}",
+            "status": "open",
+            "expires_at": expires_at,
+            "client_reference_id": form.get("client_reference_id"),
+            "metadata": {k[9:-1]: v for k, v in form.items() if k.startswith("metadata[")},
+        }
+        state["sessions"][sid] = session
+        if key:
+            state["by_key"][key] = session
+        return JSONResponse(session)
+
+    app = Starlette(routes=[Route("/v1/checkout/sessions", create_session, methods=["POST"])])
+    app.state.stripe = state
+    return app
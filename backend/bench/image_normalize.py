@@ -0,0 +1,80 @@
+"""
+Image normalization before/after: stages a synthetic full-size phone photo
+through /api/ai/stage against a fake Gemini whose response time grows with
+the uploaded bytes, once with IMAGE_NORMALIZE off and once on.
+
+    cd backend && python -m bench.image_normalize --mbps 20 --runs 3
+"""
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import tempfile
+import time
+from io import BytesIO
+
+import httpx
+from PIL import Image
+
+from bench.fakes import fake_gemini, serve
+
+
+def phone_photo(width: int = 4032, height: int = 3024) -> bytes:
+    """A noisy 12 MP JPEG tagged with EXIF orientation 6, like a portrait phone shot."""
+    noise = Image.effect_noise((width, height), 48)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    im = Image.merge("RGB", (noise, gradient, noise.transpose(Image.FLIP_LEFT_RIGHT)))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    out = BytesIO()
+    im.save(out, "JPEG", quality=95, exif=exif)
+    return out.getvalue()
+
+
+async def stage(api: str, data_url: str, runs: int) -> list:
+    timings = []
+    async with httpx.AsyncClient(base_url=api, timeout=300) as cx:
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            r = await cx.post("/api/ai/stage", json={"imageData": data_url, "scene": "wall"})
+            r.raise_for_status()
+            timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mbps", type=float, default=20.0, help="modelled upload bandwidth to the provider, Mbit/s")
+    ap.add_argument("--latency", type=float, default=0.5, help="fixed fake provider latency in seconds")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    gemini = fake_gemini(args.latency, bytes_per_s=args.mbps * 1_000_000 / 8)
+    provider = serve(gemini)
+    os.environ.update(
+        GOOGLE_API_KEY="fake",
+        GEMINI_IMAGE_ENDPOINT=provider + "/v1beta/models/fake:generateContent",
+        MEDIA_DIR=tempfile.mkdtemp(prefix="bench-media-"),
+    )
+    os.environ.setdefault("JWT_SECRET", "bench")
+
+    import server
+    api = serve(server.app)
+
+    photo = phone_photo()
+    data_url = "data:image/jpeg;base64," + base64.b64encode(photo).decode("ascii")
+    print(f"source: {len(photo) / 1e6:.1f} MB JPEG, request body {len(data_url) / 1e6:.1f} MB")
+
+    for enabled in (False, True):
+        server.IMAGE_NORMALIZE = enabled
+        server.normalized_images.clear()
+        timings = asyncio.run(stage(api, data_url, args.runs))
+        label = "normalized" if enabled else "original  "
+        print(f"{label}: provider payload {gemini.state.calls['bytes'] / 1e6:6.2f} MB  "
+              f"first {timings[0]:7.0f} ms  median {statistics.median(timings):7.0f} ms")
+    server.shutdown_image_pool()
+
+
+if __name__ == "__main__":
+    main()
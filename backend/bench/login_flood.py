@@ -0,0 +1,87 @@
+"""
+Login flood: concurrent wrong-password /api/auth/login attempts while
+sampling a catalog read. Run once with --inline (bcrypt on the event loop,
+the old behaviour) and once without (bounded bcrypt pool + login limiter) to
+compare catalog latency under the flood.
+
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m bench.login_flood --attackers 16
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m bench.login_flood --attackers 16 --inline
+
+Without MONGO_URL the sampled route is /health, which still shows event-loop
+stalls but not catalog reads.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from bench.fakes import serve
+
+
+def pct(samples: list, q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+async def sample(cx: httpx.AsyncClient, path: str, duration_s: float) -> list:
+    samples = []
+    end = time.perf_counter() + duration_s
+    while time.perf_counter() < end:
+        t0 = time.perf_counter()
+        (await cx.get(path)).raise_for_status()
+        samples.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(0.02)
+    return samples
+
+
+async def attacker(cx: httpx.AsyncClient, stop: asyncio.Event, statuses: dict):
+    while not stop.is_set():
+        r = await cx.post("/api/auth/login", json={"password": "wrong-guess"})
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+
+async def run(api: str, path: str, attackers: int, duration_s: float):
+    limits = httpx.Limits(max_connections=attackers + 4)
+    async with httpx.AsyncClient(base_url=api, timeout=60, limits=limits) as cx:
+        idle = await sample(cx, path, duration_s / 2)
+        stop, statuses = asyncio.Event(), {}
+        flood = [asyncio.create_task(attacker(cx, stop, statuses)) for _ in range(attackers)]
+        loaded = await sample(cx, path, duration_s)
+        stop.set()
+        await asyncio.gather(*flood)
+    for label, s in (("idle", idle), ("under flood", loaded)):
+        print(f"{path} {label:<12} n={len(s):<4} p50 {pct(s, 0.5):7.1f} ms  p95 {pct(s, 0.95):7.1f} ms  p99 {pct(s, 0.99):7.1f} ms")
+    print(f"login statuses: {dict(sorted(statuses.items()))}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--attackers", type=int, default=16, help="concurrent login loops")
+    ap.add_argument("--duration", type=float, default=6.0, help="seconds to sample under the flood")
+    ap.add_argument("--inline", action="store_true", help="hash on the event loop, as before the bcrypt pool existed")
+    ap.add_argument("--no-limit", action="store_true", help="disable the per-IP/per-account login limiter")
+    args = ap.parse_args()
+
+    os.environ.setdefault("JWT_SECRET", "bench")
+    if args.no_limit or args.inline:
+        for name in ("LOGIN_MAX_PER_IP", "LOGIN_MAX_PER_ACCOUNT", "LOGIN_MAX_PER_ACCOUNT_GLOBAL"):
+            os.environ[name] = "0"
+    import server
+
+    server.connect_mongo()
+    server.ADMIN_PASSWORD_HASH = server.PWD_CTX.hash("bench-secret")
+    if args.inline:
+        async def on_loop(fn, *a):
+            return fn(*a)
+        server._password_call = on_loop
+
+    path = "/api/artworks?limit=50" if server.db is not None else "/health"
+    api = serve(server.app)
+    print(f"mode: {'inline bcrypt' if args.inline else 'bcrypt pool'}{', no limiter' if args.no_limit or args.inline else ''}")
+    asyncio.run(run(api, path, args.attackers, args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Catalog serialization before/after: CPU time to turn Mongo rows into the
+GET /api/artworks body, via the old path (an Artwork model per row, then
+FastAPI's response_model validation and JSONResponse) and via the lean
+artwork_row + json_dumps path. Both bodies are compared byte for byte.
+
+    cd backend && python -m bench.serialize_artworks --sizes 500 5000 --runs 20
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+
+
+def synthetic_rows(n: int, seed: int = 7) -> list:
+    """Rows shaped like what Mongo returns for ARTWORK_READ_PROJECTION."""
+    rnd = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    rows = []
+    for i in range(n):
+        created = base + timedelta(seconds=rnd.randrange(10**7), milliseconds=rnd.randrange(1000))
+        rows.append({
+            "_id": ObjectId(),
+            "title": f"Étude n°{i} – {rnd.choice(['Blue', 'Red', 'Quiet', 'Storm'])}",
+            "priceCents": rnd.randrange(5_000, 500_000),
+            "category": rnd.choice(["Painting", "Sketch", "Print"]),
+            "imageUrl": f"https://cdn.example.com/art/{i}.jpg" if i % 5 else None,
+            "year": rnd.choice([None, 2019, 2021, 2023]),
+            "medium": "Oil on canvas",
+            "dimensions": "50 x 70 cm",
+            "status": rnd.choice(["available", "sold"]),
+            "createdAt": created,
+            "updatedAt": created,
+        })
+    return rows
+
+
+def cpu_ms(fn, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        t0 = time.process_time()
+        fn()
+        timings.append((time.process_time() - t0) * 1000)
+    return timings
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[500, 5000])
+    ap.add_argument("--runs", type=int, default=20)
+    args = ap.parse_args()
+
+    os.environ.setdefault("JWT_SECRET", "bench")
+    import asyncio
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    import server
+
+    field = create_response_field(name="Response_list_artworks", type_=List[server.Artwork])
+
+    def before(rows):
+        items = []
+        for r in rows:
+            r = dict(r)
+            r["id"] = str(r.get("_id"))
+            items.append(server._artwork_model(r))
+        content = asyncio.run(serialize_response(field=field, response_content=items))
+        return JSONResponse(content).body
+
+    def after(rows):
+        return server.json_dumps([server.artwork_row(r) for r in rows])
+
+    print(f"encoder: {'orjson' if server.orjson else 'stdlib json'}")
+    for n in args.sizes:
+        rows = synthetic_rows(n)
+        same = before(rows) == after(rows)
+        old = cpu_ms(lambda: before(rows), args.runs)
+        new = cpu_ms(lambda: after(rows), args.runs)
+        print(
+            f"{n:>6} rows  before p50 {statistics.median(old):7.1f} ms  "
+            f"after p50 {statistics.median(new):7.1f} ms  "
+            f"x{statistics.median(old) / max(statistics.median(new), 1e-6):.1f}  byte-identical: {same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Staging fan-out: wall time for N scenes as N sequential /api/ai/stage calls
+(the composer's old flow, re-sending the painting each time) versus one
+/api/ai/stage/batch stream, against a fake Gemini with a fixed delay. Also
+prints when each batch result arrived, to show results streaming in as they
+complete rather than all at the end.
+
+    cd backend && python -m bench.stage_fanout --latency 3 --scenes easel wall gallery studio
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import time
+from io import BytesIO
+
+import httpx
+
+from bench.fakes import fake_gemini, serve
+
+
+def painting_data_url(px: int) -> str:
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.effect_noise((px, int(px * 1.25)), 64).convert("RGB").save(buf, "JPEG", quality=90)
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+async def sequential(cx: httpx.AsyncClient, image: str, scenes: list) -> float:
+    t0 = time.perf_counter()
+    for scene in scenes:
+        (await cx.post("/api/ai/stage", json={"imageData": image, "scene": scene})).raise_for_status()
+    return time.perf_counter() - t0
+
+
+async def batch(cx: httpx.AsyncClient, image: str, scenes: list) -> tuple:
+    t0, arrivals, event = time.perf_counter(), [], None
+    async with cx.stream("POST", "/api/ai/stage/batch", json={"imageData": image, "scenes": scenes}) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "scene":
+                result = json.loads(line[6:])
+                arrivals.append((result["scene"], result["ok"], time.perf_counter() - t0))
+    return time.perf_counter() - t0, arrivals
+
+
+async def run(args, server, gemini_calls: dict):
+    image = painting_data_url(args.px)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=300) as cx:
+        seq = await sequential(cx, image, args.scenes)
+        before = gemini_calls["n"]
+        wall, arrivals = await batch(cx, image, args.scenes)
+    n = len(args.scenes)
+    print(f"{n} scenes, provider latency {args.latency:.1f}s, GEMINI_CONCURRENCY={server.GEMINI_CONCURRENCY}, source {len(image) / 1024:.0f} KiB")
+    print(f"sequential /ai/stage x{n}: {seq:6.2f}s")
+    print(f"/ai/stage/batch:          {wall:6.2f}s  (x{seq / wall:.1f} faster, {gemini_calls['n'] - before} provider calls)")
+    for scene, ok, at in arrivals:
+        print(f"  {scene:<10} {'ok' if ok else 'FAILED':<6} at {at:5.2f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenes", nargs="+", default=["easel", "wall", "gallery", "studio"])
+    ap.add_argument("--latency", type=float, default=3.0, help="fake Gemini delay in seconds")
+    ap.add_argument("--px", type=int, default=1600, help="width of the synthetic painting")
+    args = ap.parse_args()
+
+    fake = fake_gemini(args.latency)
+    os.environ["GOOGLE_API_KEY"] = "fake"
+    os.environ["GEMINI_IMAGE_ENDPOINT"] = serve(fake) + "/v1beta/models/gemini-2.5-flash-image:generateContent"
+    os.environ["MEDIA_DIR"] = tempfile.mkdtemp(prefix="stage-fanout-")
+    os.environ.setdefault("JWT_SECRET", "bench")
+    import server
+
+    asyncio.run(run(args, server, fake.state.calls))
+
+
+if __name__ == "__main__":
+    main()
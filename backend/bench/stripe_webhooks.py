@@ -0,0 +1,151 @@
+"""
+Stripe webhook replay: signs fixture checkout events with STRIPE_WEBHOOK_SECRET
+and posts them to /api/checkout/webhook the way Stripe's burst redelivery
+does (every event several times, concurrently, shuffled). Reports ack
+latency and throughput, then waits for the background worker and checks each
+artwork ended up sold/available as its events dictate, with one order per
+paid session.
+
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m bench.stripe_webhooks --sessions 200 --redeliveries 3
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import time
+
+import httpx
+
+
+SECRET = "whsec_bench"
+
+
+def sign(payload: bytes, secret: str = SECRET, at: int = 0) -> str:
+    """Stripe-Signature header for payload: t=<ts>,v1=HMAC_SHA256(secret, "<ts>.<payload>")."""
+    ts = at or int(time.time())
+    mac = hmac.new(secret.encode(), f"{ts}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={ts},v1={mac}"
+
+
+def fixture_event(n: int, etype: str, art_id: str, payment_status: str = "paid") -> dict:
+    sid = f"cs_test_bench_{n:06d}"
+    return {
+        "id": f"evt_bench_{etype.rsplit('.', 1)[-1]}_{n:06d}",
+        "object": "event",
+        "type": etype,
+        "created": int(time.time()),
+        "livemode": False,
+        "data": {"object": {
+            "id": sid,
+            "object": "checkout.session",
+            "client_reference_id": art_id,
+            "metadata": {"artworkId": art_id, "checkoutKey": f"bench{n}"},
+            "payment_status": payment_status,
+            "payment_intent": f"pi_bench_{n:06d}",
+            "amount_total": 120000,
+            "currency": "eur",
+            "customer_details": {"email": f"buyer{n}@example.com"},
+        }},
+    }
+
+
+def pct(samples: list, q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(q * len(samples)), len(samples) - 1)] if samples else 0.0
+
+
+async def run(args, server):
+    ids = [server.new_doc_ids() for _ in range(args.sessions)]
+    await server.db.artworks.insert_many([
+        {**d, "title": f"Bench {i}", "priceCents": 120000, "category": "Painting", "status": "reserved",
+         "reservation": {"key": f"bench{i}", "expiresAt": server.datetime.utcnow() + server.timedelta(hours=1)}}
+        for i, d in enumerate(ids)
+    ])
+    # Every third session expires unpaid; the rest complete.
+    events, expect = [], {}
+    for i, d in enumerate(ids):
+        if i % 3 == 2:
+            events.append(fixture_event(i, "checkout.session.expired", d["id"], "unpaid"))
+            expect[d["id"]] = "available"
+        else:
+            events.append(fixture_event(i, "checkout.session.completed", d["id"]))
+            expect[d["id"]] = "sold"
+    deliveries = [e for e in events for _ in range(args.redeliveries)]
+    random.shuffle(deliveries)
+
+    try:
+        sem = asyncio.Semaphore(args.concurrency)
+        acks, statuses = [], {}
+
+        async def deliver(cx, event):
+            body = json.dumps(event).encode()
+            async with sem:
+                t0 = time.perf_counter()
+                r = await cx.post("/api/checkout/webhook", content=body,
+                                  headers={"Stripe-Signature": sign(body), "Content-Type": "application/json"})
+                acks.append((time.perf_counter() - t0) * 1000)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        limits = httpx.Limits(max_connections=args.concurrency + 2)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=60, limits=limits) as cx:
+            bad = json.dumps(events[0]).encode()
+            r = await cx.post("/api/checkout/webhook", content=bad, headers={"Stripe-Signature": sign(bad, "whsec_wrong")})
+            print(f"bad signature -> {r.status_code}")
+            t0 = time.perf_counter()
+            await asyncio.gather(*(deliver(cx, e) for e in deliveries))
+            wall = time.perf_counter() - t0
+        print(f"{len(deliveries)} deliveries of {len(events)} events in {wall:.2f}s ({len(deliveries) / wall:.0f}/s)  statuses {statuses}")
+        print(f"ack p50 {pct(acks, 0.5):6.1f} ms  p95 {pct(acks, 0.95):6.1f} ms  p99 {pct(acks, 0.99):6.1f} ms")
+
+        t0 = time.perf_counter()
+        event_ids = [e["id"] for e in events]
+        while await server.db.stripe_events.count_documents({"_id": {"$in": event_ids}, "status": {"$ne": "done"}}):
+            if time.perf_counter() - t0 > args.timeout:
+                raise SystemExit("timed out waiting for the event worker")
+            await asyncio.sleep(0.05)
+        print(f"processed all events {time.perf_counter() - t0:.2f}s after the last ack")
+
+        wrong = 0
+        async for a in server.db.artworks.find({"id": {"$in": list(expect)}}, {"id": 1, "status": 1}):
+            wrong += a.get("status") != expect[a["id"]]
+        paid = sum(1 for s in expect.values() if s == "sold")
+        orders = await server.db.orders.count_documents({"artworkId": {"$in": list(expect)}})
+        print(f"artworks in the wrong state: {wrong}  orders {orders} (expected {paid})")
+    finally:
+        art_ids = [d["id"] for d in ids]
+        await server.db.artworks.delete_many({"id": {"$in": art_ids}})
+        await server.db.orders.delete_many({"artworkId": {"$in": art_ids}})
+        await server.db.stripe_events.delete_many({"_id": {"$regex": "^evt_bench_"}})
+
+
+async def main_async(args, server):
+    await server.start_stripe_event_workers()
+    try:
+        await run(args, server)
+    finally:
+        await server.stop_stripe_event_workers()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=200)
+    ap.add_argument("--redeliveries", type=int, default=3, help="times each event is delivered")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    args = ap.parse_args()
+
+    os.environ.setdefault("JWT_SECRET", "bench")
+    os.environ["STRIPE_WEBHOOK_SECRET"] = SECRET
+    import server
+
+    server.connect_mongo()
+    if server.db is None:
+        raise SystemExit("Set MONGO_URL (and DB_NAME) to a Mongo instance to run this benchmark.")
+    asyncio.run(main_async(args, server))
+
+
+if __name__ == "__main__":
+    main()
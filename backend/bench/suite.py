@@ -0,0 +1,336 @@
+"""
+Benchmark suite: boots the app in-process against a seeded synthetic catalog
+and local fakes for every upstream (OpenAI, Gemini, Make, Stripe), runs
+scripted scenarios, and reports p50/p95/p99 latency and throughput per route.
+
+Scenarios:
+  gallery   visitors paging, filtering, searching and revalidating the catalog
+  admin     an admin editing/patching/creating artworks while visitors browse
+  captions  a caption storm plus staging, Instagram queueing and checkouts
+
+Mongo is MONGO_URL when set (a throwaway database that is dropped afterwards),
+otherwise the in-memory mongomock-motor stand-in (pip install -r bench/requirements.txt).
+The stand-in is pure Python: at 100k artworks it measures itself more than the
+app, so use a local mongod for numbers worth comparing across machines.
+
+    cd backend && python -m bench.suite --sizes 1000 10000 --duration 15 --json bench-results.json
+    cd backend && python -m bench.suite --sizes 1000 --baseline bench/baseline.json --fail-on-regression
+
+--json writes the results; any earlier results file works as --baseline (alias
+--compare). bench/baseline.json is a mongomock run of the second command above,
+so regenerate it with --json on your own machine before trusting the deltas.
+Routes whose p95 grew by more than --tolerance (and by at least --min-delta-ms)
+are reported as regressions.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+from bench.fakes import _tiny_png, fake_gemini, fake_make, fake_openai, fake_stripe, serve
+from bench.serialize_artworks import synthetic_rows
+
+OK_STATUSES = {200, 201, 202, 304}
+SEARCH_TERMS = ["blue", "red", "qui", "storm", "étude"]
+CATEGORIES = ["Painting", "Sketch", "Print"]
+SORTS = ["priceAsc", "priceDesc", "nameAZ", "categoryAZ"]
+
+
+def pct(samples: list, q: float) -> float:
+    return samples[min(int(q * len(samples)), len(samples) - 1)] if samples else 0.0
+
+
+class Recorder:
+    """Latency samples and error counts per route label, e.g. "GET /api/artworks/{art_id}"."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, cx: httpx.AsyncClient, label: str, method: str, url: str, ok=OK_STATUSES, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            r = await cx.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            return None
+        self.samples[label].append((time.perf_counter() - t0) * 1000)
+        if r.status_code not in ok:
+            self.errors[label] += 1
+        return r
+
+    def summary(self, wall_s: float) -> dict:
+        out = {}
+        for label in sorted(set(self.samples) | set(self.errors)):
+            s = sorted(self.samples[label])
+            out[label] = {
+                "count": len(s),
+                "errors": self.errors[label],
+                "rps": round(len(s) / wall_s, 2),
+                "p50_ms": round(pct(s, 0.50), 2),
+                "p95_ms": round(pct(s, 0.95), 2),
+                "p99_ms": round(pct(s, 0.99), 2),
+                "max_ms": round(s[-1], 2) if s else 0.0,
+            }
+        return out
+
+
+async def think(ctx):
+    await asyncio.sleep(random.uniform(0, ctx["think_s"]))
+
+
+async def gallery_user(cx, rec: Recorder, ctx, stop: asyncio.Event):
+    etag = None
+    while not stop.is_set():
+        params = {"limit": 24, "sort": random.choice(SORTS)}
+        roll = random.random()
+        if roll < 0.3:
+            params["category"] = random.choice(CATEGORIES)
+        elif roll < 0.45:
+            params["status_f"] = "available"
+        elif roll < 0.6:
+            params["query"] = random.choice(SEARCH_TERMS)
+        headers = {"If-None-Match": etag} if etag and random.random() < 0.3 else {}
+        r = await rec.call(cx, "GET /api/artworks", "GET", "/api/artworks", params=params, headers=headers)
+        if r is not None:
+            etag = r.headers.get("etag", etag)
+            cursor = r.headers.get("x-next-cursor")
+            if cursor and random.random() < 0.4:
+                await rec.call(cx, "GET /api/artworks", "GET", "/api/artworks", params={**params, "cursor": cursor})
+        await rec.call(cx, "GET /api/artworks/{art_id}", "GET", f"/api/artworks/{random.choice(ctx['ids'])}")
+        if random.random() < 0.2:
+            await rec.call(cx, "GET /api/artworks/facets", "GET", "/api/artworks/facets", params={k: v for k, v in params.items() if k in ("category", "status_f", "query")})
+        if random.random() < 0.2:
+            await rec.call(cx, "GET /api/catalog/version", "GET", "/api/catalog/version")
+        await think(ctx)
+
+
+async def admin_user(cx, rec: Recorder, ctx, stop: asyncio.Event):
+    cookies = {"session": ctx["admin_session"]}
+    while not stop.is_set():
+        roll = random.random()
+        if roll < 0.5:
+            await rec.call(cx, "PUT /api/artworks/{art_id}", "PUT", f"/api/artworks/{random.choice(ctx['ids'])}",
+                           json={"priceCents": random.randrange(5_000, 500_000)}, cookies=cookies)
+        elif roll < 0.8:
+            items = [{"id": i, "status": random.choice(["available", "sold"])} for i in random.sample(ctx["ids"], min(20, len(ctx["ids"])))]
+            await rec.call(cx, "PATCH /api/artworks", "PATCH", "/api/artworks", json={"items": items}, cookies=cookies)
+        else:
+            await rec.call(cx, "POST /api/artworks", "POST", "/api/artworks", cookies=cookies, json={
+                "title": f"Bench new {random.randrange(10**6)}", "priceCents": 99_000, "category": random.choice(CATEGORIES),
+            })
+        await rec.call(cx, "GET /api/artworks", "GET", "/api/artworks", params={"limit": 50, "status_f": "sold"}, cookies=cookies)
+        await think(ctx)
+
+
+async def ai_user(cx, rec: Recorder, ctx, stop: asyncio.Event):
+    while not stop.is_set():
+        roll = random.random()
+        if roll < 0.5:
+            # A small title pool so repeats exercise the caption cache.
+            await rec.call(cx, "POST /api/ai/caption", "POST", "/api/ai/caption", json={
+                "title": f"Study {random.randrange(20)}", "year": 2024, "medium": "Acrylic", "dimensions": "60x80 cm",
+            })
+        elif roll < 0.65:
+            await rec.call(cx, "POST /api/ai/stage", "POST", "/api/ai/stage", json={"imageData": ctx["png_data_url"], "scene": "wall"})
+        elif roll < 0.85:
+            n = random.randrange(10**9)
+            await rec.call(cx, "POST /api/instagram/queue", "POST", "/api/instagram/queue", json={
+                "images": [f"https://cdn.example.com/{n}-a.jpg", f"https://cdn.example.com/{n}-b.jpg"], "caption": f"post {n}",
+            })
+        else:
+            # 409 is the expected answer when another buyer holds the piece.
+            await rec.call(cx, "POST /api/checkout/create-session", "POST", "/api/checkout/create-session", ok=OK_STATUSES | {400, 409},
+                           data={"artworkId": random.choice(ctx["ids"]), "buyerEmail": f"b{random.randrange(50)}@example.com"})
+        await think(ctx)
+
+
+SCENARIOS = {
+    "gallery": lambda a: [(gallery_user, a.users)],
+    "admin": lambda a: [(admin_user, a.admins), (gallery_user, a.users)],
+    "captions": lambda a: [(ai_user, a.users), (gallery_user, max(1, a.users // 4))],
+}
+
+
+async def seed(server, n: int) -> list:
+    db = server.db
+    await db.artworks.delete_many({})
+    ids = []
+    for start in range(0, n, 5000):
+        rows = synthetic_rows(min(5000, n - start), seed=start + 1)
+        for r in rows:
+            r["id"] = str(r["_id"])
+            r["searchTokens"] = server._artwork_search_tokens(r["title"])
+            ids.append(r["id"])
+        await db.artworks.insert_many(rows)
+    await server.catalog_revision.bump()
+    return ids
+
+
+async def run_scenario(name: str, cx, ctx, args) -> dict:
+    rec, stop = Recorder(), asyncio.Event()
+    users = [asyncio.create_task(fn(cx, rec, ctx, stop)) for fn, count in SCENARIOS[name](args) for _ in range(count)]
+    t0 = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*users)
+    wall = time.perf_counter() - t0
+    return {"wall_s": round(wall, 2), "routes": rec.summary(wall)}
+
+
+async def run(args, server, ctx) -> dict:
+    results = {}
+    await server.app.router.startup()
+    try:
+        limits = httpx.Limits(max_connections=None)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120, limits=limits) as cx:
+            for size in args.sizes:
+                t0 = time.perf_counter()
+                ctx["ids"] = await seed(server, size)
+                print(f"seeded {size} artworks in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+                for name in args.scenarios:
+                    results.setdefault(str(size), {})[name] = out = await run_scenario(name, cx, ctx, args)
+                    print_table(size, name, out)
+    finally:
+        await server.app.router.shutdown()
+    return results
+
+
+def print_table(size: int, name: str, out: dict):
+    print(f"\n== {name} @ {size} artworks ({out['wall_s']}s)")
+    print(f"{'route':<38} {'n':>6} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for label, st in out["routes"].items():
+        print(f"{label:<38} {st['count']:>6} {st['errors']:>4} {st['rps']:>8.1f} {st['p50_ms']:>8.1f} {st['p95_ms']:>8.1f} {st['p99_ms']:>8.1f}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """(size, scenario, route, base p95, new p95) for every route whose p95 regressed."""
+    regressions = []
+    for size, scenarios in results.items():
+        for name, out in scenarios.items():
+            base_routes = baseline.get("results", {}).get(size, {}).get(name, {}).get("routes", {})
+            for label, st in out["routes"].items():
+                base = base_routes.get(label)
+                if not base or not base["count"]:
+                    continue
+                if st["p95_ms"] > base["p95_ms"] * (1 + tolerance) and st["p95_ms"] - base["p95_ms"] >= min_delta_ms:
+                    regressions.append((size, name, label, base["p95_ms"], st["p95_ms"]))
+    return regressions
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def configure_env(args, workdir: str):
+    png_b64 = base64.b64encode(_tiny_png()).decode("ascii")
+    openai_url = serve(fake_openai(args.openai_latency))
+    gemini_url = serve(fake_gemini(args.gemini_latency))
+    make_url = serve(fake_make(latency_s=args.make_latency))
+    stripe_url = serve(fake_stripe(args.stripe_latency))
+    os.environ.update({
+        "JWT_SECRET": os.environ.get("JWT_SECRET", "bench"),
+        "OPENAI_API_KEY": "sk-fake", "OPENAI_BASE_URL": openai_url + "/v1",
+        "GOOGLE_API_KEY": "fake", "GEMINI_IMAGE_ENDPOINT": gemini_url + "/v1beta/models/gemini-2.5-flash-image:generateContent",
+        "MAKE_IG_WEBHOOK": make_url + "/hook", "OUTBOX_RATE_PER_MIN": "0",
+        "STRIPE_SECRET_KEY": "sk_test_bench", "STRIPE_API_BASE": stripe_url,
+        "CATALOG_CHANGE_STREAMS": "0",
+        "MEDIA_DIR": os.path.join(workdir, "media"), "DERIVATIVE_DIR": os.path.join(workdir, "derivatives"),
+        "CATALOG_SNAPSHOT_DIR": os.path.join(workdir, "snapshots"), "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "OUTBOX_SQLITE_PATH": os.path.join(workdir, "outbox.sqlite3"),
+    })
+    if os.environ.get("MONGO_URL"):
+        os.environ["DB_NAME"] = args.db_name
+    return {"think_s": args.think, "png_data_url": "data:image/png;base64," + png_b64}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=["gallery", "admin", "captions"])
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds per scenario and size")
+    ap.add_argument("--users", type=int, default=16, help="concurrent visitors (and AI users in captions)")
+    ap.add_argument("--admins", type=int, default=2)
+    ap.add_argument("--think", type=float, default=0.05, help="max random pause between a user's steps (s)")
+    ap.add_argument("--openai-latency", type=float, default=1.0)
+    ap.add_argument("--gemini-latency", type=float, default=2.0)
+    ap.add_argument("--make-latency", type=float, default=0.2)
+    ap.add_argument("--stripe-latency", type=float, default=0.4)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--db-name", default="artbench_suite", help="database used (then dropped) with MONGO_URL")
+    ap.add_argument("--json", help="write results here")
+    ap.add_argument("--baseline", "--compare", help="results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95 growth")
+    ap.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore p95 changes smaller than this")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+    random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="artbench-")
+    ctx = configure_env(args, workdir)
+    import server
+
+    server.connect_mongo()
+    store = "mongodb"
+    if server.db is None:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("Set MONGO_URL or pip install -r bench/requirements.txt to run the suite.")
+        server.client = AsyncMongoMockClient()
+        server.db = server.client[args.db_name]
+        store = "mongomock"
+    ctx["admin_session"] = server._create_token("admin")
+
+    async def go():
+        try:
+            return await run(args, server, ctx)
+        finally:
+            if store == "mongodb":
+                await server.client.drop_database(args.db_name)
+
+    results = asyncio.run(go())
+    doc = {
+        "meta": {
+            "started": datetime.utcnow().isoformat() + "Z", "git": _git_rev(), "store": store,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline", "fail_on_regression")},
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"\nwrote {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("store") != store:
+            print(f"note: baseline store is {baseline.get('meta', {}).get('store')}, this run used {store}")
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        print(f"\nvs baseline {args.baseline} ({baseline.get('meta', {}).get('git') or 'unknown rev'}): "
+              f"{len(regressions)} p95 regression(s) beyond {args.tolerance:.0%}")
+        for size, name, label, old, new in regressions:
+            print(f"  {name} @ {size}: {label}  p95 {old:.1f} -> {new:.1f} ms")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Backfills the legacy string `id` field on artworks and categories from
+their ObjectId, then creates the unique `id` indexes, so lookups by either
+form of id are index-backed.
+
+    cd backend && python migrate_ids.py [--dry-run] [--batch-size 500]
+
+Uses the same MONGO_URL / DB_NAME environment (.env) as the API.
+"""
+import argparse
+import asyncio
+
+import server
+
+
+async def main(dry_run: bool, batch_size: int):
+    server.connect_mongo()
+    _db = server.require_db()
+    for name in ("artworks", "categories"):
+        n = await server.backfill_legacy_ids(_db[name], batch_size=batch_size, dry_run=dry_run)
+        print(f"{name}: {n} document(s) {'would be ' if dry_run else ''}backfilled")
+    if not dry_run:
+        await server.ensure_id_indexes()
+        print("unique `id` indexes ensured")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--batch-size", type=int, default=500)
+    args = ap.parse_args()
+    asyncio.run(main(args.dry_run, args.batch_size))
@@ -1,31 +1,69 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Form, UploadFile, File, Request, Response
-from fastapi.responses import JSONResponse
+import builtins
+import os
+import sys
+import time
+
+# STARTUP_PROFILE=1 logs, once startup finishes, how long each top-level package
+# took to import and how long the startup hooks ran (python -X importtime has the
+# full tree). The provider SDKs are imported on first use, see lazy_module().
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "0") == "1"
+BOOT_T0 = time.perf_counter()
+import_times = {}
+_builtin_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    top = name.partition(".")[0]
+    if level or top in sys.modules:
+        return _builtin_import(name, globals, locals, fromlist, level)
+    t0 = time.perf_counter()
+    try:
+        return _builtin_import(name, globals, locals, fromlist, level)
+    finally:
+        import_times[top] = import_times.get(top, 0.0) + time.perf_counter() - t0
+
+
+if STARTUP_PROFILE:
+    builtins.__import__ = _timed_import
+
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Form, UploadFile, File, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from pymongo import InsertOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+import asyncio
+import importlib
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, EmailStr, ValidationError
+from typing import List, Optional, Dict, Any, Union
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from itertools import islice
 import uuid
-from datetime import datetime, timedelta
-from passlib.context import CryptContext
+from datetime import datetime, timedelta, timezone
+import email.utils
 from bson import ObjectId
 
-from openai import OpenAI
-from pydantic import BaseModel
-
-from google import genai
-from google.genai import types
 import base64
+import csv
+import io
+import tempfile
 import httpx
-from PIL import Image
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import gzip
+import bisect
+import hashlib
+import shutil
 import mimetypes
 import random
-import time
+import re
+import threading
 import jwt
 from passlib.context import CryptContext
 
@@ -50,7 +88,9 @@ MAKE_WEBHOOK_URL = (
 )
 IG_SECRET = os.environ.get("IG_SECRET") or "ig-very-secret"
 
-PWD_CTX = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Explicit rounds so hashes made at another cost show up as needing an update.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PWD_CTX = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 JWT_SECRET = os.getenv("JWT_SECRET")
 if not JWT_SECRET:
     raise RuntimeError("JWT_SECRET must be set in the environment (Render/.env)")
@@ -58,29 +98,213 @@ JWT_ALG = "HS256"
 JWT_EXPIRES_MIN = int(os.getenv("JWT_EXPIRES_MIN", "43200"))
 ADMIN_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH", "")
 
-try:
-    import httpx
-except Exception:
-    httpx = None
 import json
 from urllib.request import Request as UrlRequest, urlopen
+from starlette.background import BackgroundTask
 from starlette.concurrency import run_in_threadpool
 
-try:
-    import stripe
-except Exception:
-    stripe = None
+
+@lru_cache(maxsize=None)
+def lazy_module(name: str):
+    """
+    Imports an SDK on first use instead of at boot (None when it is not
+    installed), so workers that only serve the catalog never load it.
+    """
+    t0 = time.perf_counter()
+    try:
+        mod = importlib.import_module(name)
+    except ImportError:
+        return None
+    if STARTUP_PROFILE:
+        logging.getLogger(__name__).info("Lazy import of %s took %.0f ms", name, (time.perf_counter() - t0) * 1000)
+    return mod
+
+# ---------- Metrics ----------
+# In-process Prometheus registry rendered by /metrics in the text exposition
+# format. Updates are a dict lookup plus a lock (motor reports commands from
+# its worker threads), so instrumentation stays cheap on the request path.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def _labels(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{self._labels(key)} {_fmt_metric(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            st = self._values.get(labels)
+            if st is None:
+                st = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            st[0][i] += 1
+            st[1] += value
+            st[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip((*self.buckets, float("inf")), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else _fmt_metric(bound)
+                labels = self._labels(key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_fmt_metric(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {n}")
+        return lines
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_metric(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+METRICS: List[_Metric] = []
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+mongo_latency = Histogram("mongo_command_duration_seconds", "MongoDB command latency.", ("command", "collection"))
+mongo_failures = Counter("mongo_command_failures_total", "MongoDB commands that failed.", ("command", "collection"))
+upstream_latency = Histogram("upstream_request_duration_seconds", "Latency of calls to external providers.", ("upstream",))
+upstream_requests = Counter("upstream_requests_total", "Calls to external providers by outcome.", ("upstream", "outcome"))
+loop_lag = Gauge("event_loop_lag_seconds", "Most recent event-loop scheduling delay.")
+loop_lag_hist = Histogram("event_loop_lag_distribution_seconds", "Event-loop scheduling delay samples.", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Feeds mongo_command_* from pymongo's command monitoring (called on motor's worker threads)."""
+
+    def __init__(self):
+        self._pending: Dict[tuple, str] = {}
+
+    def started(self, event):
+        coll = event.command.get(event.command_name)
+        self._pending[(event.connection_id, event.request_id)] = coll if isinstance(coll, str) else ""
+
+    def succeeded(self, event):
+        coll = self._pending.pop((event.connection_id, event.request_id), "")
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name, coll)
+
+    def failed(self, event):
+        coll = self._pending.pop((event.connection_id, event.request_id), "")
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name, coll)
+        mongo_failures.inc(event.command_name, coll)
+
+
+class MetricsMiddleware:
+    """Counts, times and tracks in-flight HTTP requests, labelled by route template rather than raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.inc(amount=-1)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_latency.observe(time.perf_counter() - t0, scope["method"], route)
+            http_requests.inc(scope["method"], route, str(status_code[0]))
+
+
+async def watch_event_loop_lag(interval_s: float = 0.5):
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval_s)
+        lag = max(time.perf_counter() - t0 - interval_s, 0.0)
+        loop_lag.set(lag)
+        loop_lag_hist.observe(lag)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
 
 mongo_url = os.getenv('MONGO_URL')
 db = None
 client = None
-if mongo_url:
+
+
+def connect_mongo():
+    """Builds the Motor client (no I/O until the first command). Runs in the first startup hook; idempotent."""
+    global client, db
+    if client is not None or not mongo_url:
+        return
     try:
-        client = AsyncIOMotorClient(mongo_url)
+        client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
         db = client[os.getenv('DB_NAME', 'app')]
     except Exception:
         logging.exception("Mongo connection failed")
-        db = None
+        client = db = None
 
 def require_db():
     if db is None:
@@ -88,22 +312,11 @@ def require_db():
     return db
 
 def _create_token(sub: str) -> str:
-    now = int(time.time())
-    payload = {"sub": sub, "role": "admin", "iat": now, "exp": now + JWT_EXPIRES_MIN * 60}
+    # Sub-second iat, so a token issued right after a "log out everywhere" still sorts after it.
+    now = time.time()
+    payload = {"sub": sub, "role": "admin", "iat": now, "exp": int(now) + JWT_EXPIRES_MIN * 60, "jti": uuid.uuid4().hex}
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
-def _verify_token(token: str):
-    try:
-        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-    except Exception:
-        return None
-
-def _verify_password(plain: str, hashed: str) -> bool:
-    try:
-        return bool(hashed) and PWD_CTX.verify(plain, hashed)
-    except Exception:
-        return False
-
 def _is_dev_origin(origin: str) -> bool:
     return origin.startswith("http://localhost") or origin.startswith("http://127.0.0.1")
 
@@ -132,45 +345,15 @@ def _clear_session_cookie(response: Response, origin: str):
         path="/",
     )
 
-def require_admin(request: Request):
-    token = request.cookies.get("session")
-    data = _verify_token(token) if token else None
-    if not data or data.get("role") != "admin":
-        raise HTTPException(status_code=401, detail="Not authorized")
-    return data
-
 JWT_ALGO = os.environ.get('JWT_ALGO', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', '60'))
-pwd_context = PWD_CTX 
-
-
-def hash_password(p: str) -> str:
-    return pwd_context.hash(p)
-
-def verify_password(p: str, h: str) -> bool:
-    try:
-        return pwd_context.verify(p, h)
-    except Exception:
-        return False
 
 def create_access_token(data: Dict[str, Any], expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=expires_minutes)
-    to_encode.update({"exp": expire, "type": "access"})
+    to_encode.update({"exp": expire, "iat": time.time(), "type": "access", "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGO)
 
-def _scene_prompt(scene: str, extra: Optional[str], lang: str) -> str:
-    base = {
-        "easel":  "Place the provided painting on a wooden artist easel in a modern, minimal room with natural window light and white curtains. the provided painting should fill out the main part of the image. DONT modify the provided Painting AT ALL. DO NOT change the dimensions of the painting",
-        "wall":   "A photograph of a clean, modern living room with a prominent white wall, natural light, minimal furniture, gallery-like atmosphere.",
-        "gallery":"A photograph of a contemporary art gallery interior, neutral walls, subtle shadows, professional lighting, polished floor, minimal decor.",
-        "studio": "A photograph of an artist studio with natural light, white walls, tidy workspace, subtle props, calm mood.",
-    }.get(scene, "A photograph of a clean, minimalist interior with natural light.")
-    tail = (extra or "").strip()
-    if tail:
-        return f"{base} {tail}"
-    return base
-
 FIXED_HASHTAGS = [
     "#art","#painting","#originalart","#artcollectors","#artfromaustria",
 ]
@@ -180,13 +363,45 @@ ROTATING_HASHTAGS = [
     "#grazartist","#artgalleryonline","#artforsale","#emergingartist","#cityscapeart","#natureart","#surrealart", "#colorfulart",
 ]
 
-if stripe:
-    stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+CAPTION_CONCURRENCY = int(os.environ.get("CAPTION_CONCURRENCY", "4"))
+CAPTION_TIMEOUT_S = float(os.environ.get("CAPTION_TIMEOUT_S", "45"))
+CAPTION_QUEUE_TIMEOUT_S = float(os.environ.get("CAPTION_QUEUE_TIMEOUT_S", "30"))
+CAPTION_SEMAPHORE = asyncio.Semaphore(CAPTION_CONCURRENCY)
+CAPTION_CACHE_SIZE = int(os.environ.get("CAPTION_CACHE_SIZE", "512"))
+CAPTION_CACHE_TTL_S = float(os.environ.get("CAPTION_CACHE_TTL_S", str(7 * 24 * 3600)))
+CAPTION_CACHE_MONGO = os.environ.get("CAPTION_CACHE_MONGO", "").lower() in ("1", "true", "yes")
+
+GEMINI_IMAGE_ENDPOINT = os.environ.get(
+    "GEMINI_IMAGE_ENDPOINT",
+    "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image:generateContent",
+)
+# Sized so a four-scene batch (easel, wall, gallery, studio) renders in one round.
+GEMINI_CONCURRENCY = int(os.environ.get("GEMINI_CONCURRENCY", "4"))
+STAGE_BATCH_MAX = int(os.environ.get("STAGE_BATCH_MAX", "8"))
+GEMINI_SEMAPHORE = asyncio.Semaphore(GEMINI_CONCURRENCY)
+STAGE_WORKERS = int(os.environ.get("STAGE_WORKERS", "2"))
+STAGE_QUEUE_MAX = int(os.environ.get("STAGE_QUEUE_MAX", "50"))
+STAGE_JOB_TTL_S = float(os.environ.get("STAGE_JOB_TTL_S", str(24 * 3600)))
+# Lease on a running job, renewed every third of it; a job whose lease lapsed
+# (its process died) is re-queued at the next startup.
+STAGE_JOB_STALE_S = float(os.environ.get("STAGE_JOB_STALE_S", "300"))
+STAGE_SOURCE_DIR = os.environ.get("STAGE_SOURCE_DIR", str(ROOT_DIR / "stage_sources"))
+STAGE_SOURCE_GC_INTERVAL_S = float(os.environ.get("STAGE_SOURCE_GC_INTERVAL_S", "3600"))
+STAGE_EVENTS_POLL_S = 0.5
+
+
+@lru_cache(maxsize=None)
+def openai_client():
+    """The AsyncOpenAI client, built (and the SDK imported) on the first caption request; None without a key."""
+    openai = lazy_module("openai") if OPENAI_API_KEY else None
+    if openai is None:
+        return None
+    return openai.AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=CAPTION_TIMEOUT_S, max_retries=1)
 
 DEFAULT_HASHTAGS = os.environ.get(
     "DEFAULT_HASHTAGS",
@@ -201,475 +416,2998 @@ DEFAULT_CAPTION_SYSTEM = os.environ.get(
 )
 
 
-# ---------- FastAPI app ----------
-app = FastAPI()
+# ---------- Caching primitives ----------
+class LRUCache:
+    """Small in-process LRU with an optional per-entry TTL and hit/miss counters."""
 
-@app.get("/", include_in_schema=False)
-def root():
-    return {"ok": True, "service": "api", "time": datetime.utcnow().isoformat(timespec="seconds") + "Z"}
+    def __init__(self, maxsize: int = 1024, ttl_s: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-@app.get("/health", include_in_schema=False)
-def health():
-    return {"status": "ok"}
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, expires = item
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
 
-from starlette.middleware.cors import CORSMiddleware
+    def set(self, key, value, ttl_s: Optional[float] = None):
+        ttl = self.ttl_s if ttl_s is None else ttl_s
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
 
-def _allowed_origins():
-    raw = os.environ.get("CORS_ORIGINS", "")
-    if raw.strip():
-        return [o.strip() for o in raw.split(",") if o.strip()]
-    return [
-        "https://jpart.at",
-        "https://www.jpart.at",
-        "http://localhost:3000",
-        "https://api.jpart.at",
-    ]
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=_allowed_origins(),
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-    max_age=86400,
-)
+    def clear(self):
+        self._data.clear()
 
+    def values(self) -> List[Any]:
+        now = time.monotonic()
+        return [value for value, expires in self._data.values() if expires is None or expires >= now]
 
-# Router under /api
-api_router = APIRouter(prefix="/api")
+    def __len__(self):
+        return len(self._data)
 
-# ---------- Models ----------
-class StageIn(BaseModel):
-    imageUrl: Optional[str] = None
-    imageData: Optional[str] = None
-    scene: str = "easel"
-    extraPrompt: Optional[str] = None
-    lang: Optional[str] = "en"
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
 
-class StatusCheck(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    client_name: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
 
-class StatusCheckCreate(BaseModel):
-    client_name: str
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key onto one shared task. The task
+    is cancelled only once every caller waiting on it has gone away.
+    """
 
-class User(BaseModel):
-    id: Optional[str] = Field(default=None)
-    email: EmailStr
-    name: Optional[str] = None
-    role: str = Field(default="user")
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    def __init__(self):
+        self._inflight: Dict[Any, list] = {}
 
-class UserInDB(User):
-    hashed_password: str
+    def _forget(self, key, entry):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
 
-class UserCreate(BaseModel):
-    email: EmailStr
-    name: Optional[str] = None
-    password: str
+    async def do(self, key, fn):
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = self._inflight[key] = [asyncio.ensure_future(fn()), 0]
+            entry[0].add_done_callback(lambda _t, k=key, e=entry: self._forget(k, e))
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
 
-class TokenOut(BaseModel):
-    access_token: str
-    token_type: str = "bearer"
 
-class Artwork(BaseModel):
-    id: Optional[str] = None
-    title: str
-    priceCents: int = Field(ge=0)
-    category: str
-    imageUrl: Optional[str] = None
-    year: Optional[int] = None
-    medium: Optional[str] = None
-    dimensions: Optional[str] = None
-    status: str = Field(default="available")
-    createdAt: datetime = Field(default_factory=datetime.utcnow)
-    updatedAt: datetime = Field(default_factory=datetime.utcnow)
+class CatalogCache:
+    """
+    Read-through cache for public catalog reads. Any catalog write clears it
+    and bumps `version`; loads that started before a bump are not stored, so
+    a slow read can never put pre-write data back into the cache.
+    """
 
-class ArtworkCreate(BaseModel):
-    title: str
-    priceCents: int
-    category: str
-    imageUrl: Optional[str] = None
-    year: Optional[int] = None
-    medium: Optional[str] = None
-    dimensions: Optional[str] = None
-    status: Optional[str] = "available"
+    _MISS = object()
 
-class ArtworkUpdate(BaseModel):
-    title: Optional[str] = None
-    priceCents: Optional[int] = None
-    category: Optional[str] = None
-    imageUrl: Optional[str] = None
-    year: Optional[int] = None
-    medium: Optional[str] = None
-    dimensions: Optional[str] = None
-    status: Optional[str] = None
+    def __init__(self, maxsize: int, ttl_s: Optional[float]):
+        self.lru = LRUCache(maxsize, ttl_s)
+        self.flight = SingleFlight()
+        self.version = 0
+        self.invalidations = 0
 
-class Category(BaseModel):
-    id: Optional[str] = None
-    key: str
-    label_en: Optional[str] = None
-    label_de: Optional[str] = None
+    async def get_or_load(self, key, loader):
+        value = self.lru.get(key, self._MISS)
+        if value is not self._MISS:
+            return value
+        version = self.version
+        value = await self.flight.do((version, key), loader)
+        if self.version == version:
+            self.lru.set(key, value)
+        return value
 
-    # --- AI caption request/response ---
-class AICaptionRequest(BaseModel):
-    imageUrl: Optional[str] = None
-    imageData: Optional[str] = None
-    title: Optional[str] = None
-    year: Optional[int] = None
-    medium: Optional[str] = None
-    dimensions: Optional[str] = None
-    lang: Optional[str] = "en"
-    style: Optional[str] = None
-    system: Optional[str] = None
-    hashtags: Optional[str] = None 
+    def invalidate(self):
+        self.version += 1
+        self.invalidations += 1
+        self.lru.clear()
 
-class AICaptionResponse(BaseModel):
-    caption: str
+    def stats(self) -> Dict[str, int]:
+        return {**self.lru.stats(), "version": self.version, "invalidations": self.invalidations}
 
 
-class LoginBody(BaseModel):
-    password: str
+CATALOG_CACHE_SIZE = int(os.environ.get("CATALOG_CACHE_SIZE", "512"))
+CATALOG_CACHE_TTL_S = float(os.environ.get("CATALOG_CACHE_TTL_S", "300"))
+CATALOG_CHANGE_STREAMS = os.environ.get("CATALOG_CHANGE_STREAMS", "1") != "0"
+catalog_cache = CatalogCache(CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL_S)
 
 
-# ---------- Helpers ----------
-async def get_user_by_email(email: str) -> Optional[UserInDB]:
-    _db = require_db()
-    row = await _db.users.find_one({"email": email})
-    if not row:
-        return None
-    row['id'] = str(row.get('_id'))
-    return UserInDB(**row)
+class CatalogRevision:
+    """
+    Catalog-wide revision shared by every worker: a counter plus a second-precision
+    timestamp in `catalog_meta`, bumped on each catalog write. It backs the HTTP
+    validators (ETag / Last-Modified) and is held in process for `ttl_s` so a
+    conditional request can be answered without a Mongo round trip. Seeing a
+    newer revision than the last one also clears the in-process catalog cache,
+    which keeps workers coherent even without change streams.
+    """
 
-async def require_user(token: Optional[str] = None, request: Request = None) -> User:
-    auth_header = request.headers.get('Authorization') if request else None
-    token_str = token
-    if not token_str and auth_header and auth_header.lower().startswith('bearer '):
-        token_str = auth_header.split(' ')[1]
-    if not token_str:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    try:
-        payload = jwt.decode(token_str, JWT_SECRET, algorithms=[JWT_ALGO])
-        if payload.get('type') != 'access':
-            raise JWTError('Invalid token')
-        email = payload.get('sub')
-        user = await get_user_by_email(email)
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid user")
-        return User(**user.dict())
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Token invalid or expired")
+    def __init__(self, ttl_s: float):
+        self.ttl_s = ttl_s
+        self.flight = SingleFlight()
+        self._state: Optional[tuple] = None
+        self._expires = 0.0
 
-async def require_admin(request: Request) -> User:
-    user = await require_user(request=request)
-    if user.role != 'admin':
-        raise HTTPException(status_code=403, detail="Admin privilege required")
-    return user
+    async def current(self) -> tuple:
+        if self._state is not None and time.monotonic() < self._expires:
+            return self._state
+        return await self.flight.do("revision", self._load)
 
-# ---------- Basic Routes ----------
-@api_router.get("/")
-async def api_root():
-    return {"message": "Hello World"}
+    async def seed(self):
+        """Creates the revision document if missing; run once at startup so refreshes are plain reads."""
+        await db.catalog_meta.update_one(
+            {"_id": "catalog"},
+            {"$setOnInsert": {"version": 1, "updatedAt": _http_now()}},
+            upsert=True,
+        )
 
-@api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
-    _db = require_db()
-    status_obj = StatusCheck(**input.dict())
-    await _db.status_checks.insert_one(status_obj.dict())
-    return status_obj
+    async def _load(self) -> tuple:
+        doc = await db.catalog_meta.find_one({"_id": "catalog"})
+        if doc is None:  # read before seed() got to run
+            await self.seed()
+            doc = await db.catalog_meta.find_one({"_id": "catalog"})
+        return self._remember(doc)
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    _db = require_db()
-    status_checks = await _db.status_checks.find().to_list(1000)
-    return [StatusCheck(**{**s, 'id': s.get('id') or str(s.get('_id'))}) for s in status_checks]
+    async def bump(self):
+        catalog_cache.invalidate()
+        catalog_snapshot.schedule()
+        doc = await db.catalog_meta.find_one_and_update(
+            {"_id": "catalog"},
+            {"$inc": {"version": 1}, "$set": {"updatedAt": _http_now()}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        self._remember(doc)
 
-# ---------- Auth Routes ----------
-@api_router.post("/auth/register", response_model=User)
-async def register(user_in: UserCreate):
-    _db = require_db()
-    existing = await get_user_by_email(user_in.email)
-    if existing:
-        raise HTTPException(400, detail="Email already registered")
-    doc = {
-        "email": user_in.email,
-        "name": user_in.name,
-        "role": "user",
-        "hashed_password": hash_password(user_in.password),
-        "created_at": datetime.utcnow(),
-    }
-    res = await _db.users.insert_one(doc)
-    return User(id=str(res.inserted_id), email=user_in.email, name=user_in.name, role="user")
+    def expire(self):
+        self._expires = 0.0
 
-@api_router.post("/auth/login")
-def auth_login(body: LoginBody, request: Request, response: Response):
-    if not _verify_password(body.password, ADMIN_PASSWORD_HASH):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-    token = _create_token("admin")
-    origin = request.headers.get("origin", "")
-    set_session_cookie(response, token)
+    def _remember(self, doc: Dict[str, Any]) -> tuple:
+        state = (int(doc["version"]), doc["updatedAt"])
+        if self._state is not None:
+            if state[0] < self._state[0]:  # a read that raced a newer bump
+                return self._state
+            if state[0] > self._state[0]:
+                catalog_cache.invalidate()
+        self._state = state
+        self._expires = time.monotonic() + self.ttl_s
+        return state
+
+
+def _http_now() -> datetime:
+    return datetime.utcnow().replace(microsecond=0)
+
+
+CATALOG_REVISION_TTL_S = float(os.environ.get("CATALOG_REVISION_TTL_S", "5"))
+CATALOG_MAX_AGE_S = int(os.environ.get("CATALOG_MAX_AGE_S", "10"))
+CATALOG_SWR_S = int(os.environ.get("CATALOG_SWR_S", "300"))
+CATALOG_CACHE_CONTROL = f"public, max-age={CATALOG_MAX_AGE_S}, stale-while-revalidate={CATALOG_SWR_S}"
+catalog_revision = CatalogRevision(CATALOG_REVISION_TTL_S)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so a W/ prefix added by a proxy still matches.
+    if header.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == etag for t in header.split(","))
+
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    try:
+        since = email.utils.parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return last_modified <= since
+
+
+async def catalog_conditional(request: Request, response: Response) -> Optional[Response]:
+    """
+    Sets the catalog validators and Cache-Control on `response` and returns a
+    ready 304 when the request's If-None-Match / If-Modified-Since still holds.
+    Runs before any catalog read, so a revalidation costs no Mongo query while
+    the revision is held in process.
+    """
+    version, updated_at = await catalog_revision.current()
+    headers = {
+        "ETag": f'"cat-{version}"',
+        "Last-Modified": email.utils.format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True),
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+    }
+    response.headers.update(headers)
+    inm = request.headers.get("if-none-match")
+    ims = request.headers.get("if-modified-since")
+    if inm is not None:
+        fresh = _etag_matches(inm, headers["ETag"])
+    else:
+        fresh = ims is not None and _not_modified_since(ims, updated_at)
+    return Response(status_code=304, headers=headers) if fresh else None
+
+
+# ---------- Outbound HTTP ----------
+OUTBOUND_MAX_CONNECTIONS = int(os.environ.get("OUTBOUND_MAX_CONNECTIONS", "100"))
+OUTBOUND_MAX_KEEPALIVE = int(os.environ.get("OUTBOUND_MAX_KEEPALIVE", "20"))
+OUTBOUND_KEEPALIVE_S = float(os.environ.get("OUTBOUND_KEEPALIVE_S", "60"))
+OUTBOUND_TIMEOUT_S = float(os.environ.get("OUTBOUND_TIMEOUT_S", "30"))
+OUTBOUND_CONNECT_TIMEOUT_S = float(os.environ.get("OUTBOUND_CONNECT_TIMEOUT_S", "10"))
+OUTBOUND_RETRIES = int(os.environ.get("OUTBOUND_RETRIES", "2"))
+OUTBOUND_BACKOFF_S = float(os.environ.get("OUTBOUND_BACKOFF_S", "0.25"))
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+try:
+    import h2  # noqa: F401 - enables HTTP/2 in httpx when present
+    OUTBOUND_HTTP2 = os.environ.get("OUTBOUND_HTTP2", "1") != "0"
+except Exception:
+    OUTBOUND_HTTP2 = False
+
+
+class OutboundHTTP:
+    """
+    One pooled httpx client for every upstream call (Gemini, Make, image fetches),
+    created at startup and closed at shutdown. Idempotent requests are retried
+    with jittered exponential backoff; every call is counted per upstream label.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=OUTBOUND_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=OUTBOUND_MAX_CONNECTIONS,
+                    max_keepalive_connections=OUTBOUND_MAX_KEEPALIVE,
+                    keepalive_expiry=OUTBOUND_KEEPALIVE_S,
+                ),
+                timeout=httpx.Timeout(OUTBOUND_TIMEOUT_S, connect=OUTBOUND_CONNECT_TIMEOUT_S),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _record(self, upstream: str, elapsed_s: float, error: bool):
+        st = self.stats.setdefault(upstream, {"requests": 0, "errors": 0, "retries": 0, "latency_ms_total": 0.0, "latency_ms_max": 0.0})
+        ms = elapsed_s * 1000
+        st["requests"] += 1
+        st["errors"] += int(error)
+        st["latency_ms_total"] += ms
+        st["latency_ms_max"] = max(st["latency_ms_max"], ms)
+        upstream_latency.observe(elapsed_s, upstream)
+        upstream_requests.inc(upstream, "error" if error else "ok")
+
+    @contextmanager
+    def track(self, upstream: str):
+        """Records an SDK call (OpenAI, Stripe) that does not go through this client under the same stats."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except HTTPException as e:
+            self._record(upstream, time.perf_counter() - t0, e.status_code >= 500)
+            raise
+        except BaseException:
+            self._record(upstream, time.perf_counter() - t0, True)
+            raise
+        self._record(upstream, time.perf_counter() - t0, False)
+
+    async def request(self, upstream: str, method: str, url: str, *, retries: Optional[int] = None, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        method = method.upper()
+        if retries is None:
+            retries = OUTBOUND_RETRIES if method in IDEMPOTENT_METHODS else 0
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=min(timeout, OUTBOUND_CONNECT_TIMEOUT_S))
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                r = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                self._record(upstream, time.perf_counter() - t0, True)
+                if attempt >= retries:
+                    raise
+            else:
+                failed = r.status_code >= 500 or r.status_code == 429
+                self._record(upstream, time.perf_counter() - t0, failed)
+                if not failed or attempt >= retries:
+                    return r
+            attempt += 1
+            self.stats[upstream]["retries"] += 1
+            await asyncio.sleep(random.uniform(0, OUTBOUND_BACKOFF_S * (2 ** attempt)))
+
+    async def get(self, upstream: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(upstream, "GET", url, **kwargs)
+
+    async def post(self, upstream: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(upstream, "POST", url, **kwargs)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for name, st in self.stats.items():
+            out[name] = {**st, "latency_ms_avg": round(st["latency_ms_total"] / st["requests"], 2) if st["requests"] else 0.0}
+        return out
+
+
+outbound = OutboundHTTP()
+
+
+# ---------- Media store ----------
+MEDIA_EXTENSIONS = {"image/png": "png", "image/webp": "webp", "image/jpeg": "jpg", "image/gif": "gif"}
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class LocalMediaStore:
+    """
+    Content-addressed blob store on the local filesystem. Keys are
+    '<sha256>.<ext>' so identical bytes are stored once and a key never
+    changes meaning, which is what makes immutable caching safe.
+    Other backends only need put/path/exists/delete with the same key scheme.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    @staticmethod
+    def make_key(data: bytes, mime: str) -> str:
+        return f"{hashlib.sha256(data).hexdigest()}.{MEDIA_EXTENSIONS.get(mime, 'bin')}"
+
+    def path(self, key: str) -> Path:
+        if not re.fullmatch(r"[0-9a-f]{64}\.[a-z0-9]{2,5}", key):
+            raise ValueError("invalid media key")
+        return self.root / key[:2] / key[2:4] / key
+
+    def exists(self, key: str) -> bool:
+        try:
+            return self.path(key).is_file()
+        except ValueError:
+            return False
+
+    def _write(self, key: str, data: bytes):
+        dest = self.path(key)
+        if dest.is_file():
+            return
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, dest)
+
+    async def put(self, data: bytes, mime: str) -> str:
+        key = self.make_key(data, mime)
+        await run_in_threadpool(self._write, key, data)
+        return key
+
+    def _move(self, key: str, src: Path):
+        dest = self.path(key)
+        if dest.is_file():
+            src.unlink(missing_ok=True)
+            return
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+        shutil.move(str(src), tmp)  # a rename when both are on one filesystem
+        os.replace(tmp, dest)
+
+    async def put_file(self, src: Path, sha256_hex: str, mime: str) -> str:
+        """Moves an already-hashed file into the store, for bodies too large to hold in memory."""
+        key = f"{sha256_hex}.{MEDIA_EXTENSIONS.get(mime, 'bin')}"
+        await run_in_threadpool(self._move, key, src)
+        return key
+
+    def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+    def stale_keys(self, older_than: float) -> List[str]:
+        """Keys of blobs last written before `older_than` (epoch seconds)."""
+        if not self.root.is_dir():
+            return []
+        return [p.name for p in self.root.glob("??/??/*") if not p.name.startswith(".") and p.stat().st_mtime < older_than]
+
+
+def _make_media_store():
+    backend = os.environ.get("MEDIA_STORE", "local").lower()
+    if backend != "local":
+        raise RuntimeError(f"Unsupported MEDIA_STORE backend: {backend}")
+    return LocalMediaStore(Path(os.environ.get("MEDIA_DIR", str(ROOT_DIR / "media"))))
+
+
+media_store = _make_media_store()
+
+
+PUBLIC_API_URL = os.environ.get("PUBLIC_API_URL", "").rstrip("/")
+
+
+def public_url(path: str) -> str:
+    """Absolute when PUBLIC_API_URL is set (e.g. https://api.jpart.at), else root-relative."""
+    return f"{PUBLIC_API_URL}{path}"
+
+
+def media_url(key: str) -> str:
+    return public_url(f"/api/media/{key}")
+
+
+def media_key_from_url(url: str) -> Optional[str]:
+    m = re.search(r"/api/media/([0-9a-f]{64}\.[a-z0-9]{2,5})$", (url or "").split("?")[0])
+    return m.group(1) if m else None
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple]:
+    """Parses a single 'bytes=a-b' range; None means serve the whole file."""
+    m = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+    else:
+        start = max(size - int(m.group(2)), 0)
+        end = size - 1
+    if start >= size or start > end:
+        raise HTTPException(416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+def _read_range(path: Path, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
+
+
+# ---------- Image normalization ----------
+# Uploads are often full-size phone photos; providers only need a modest
+# resolution. Sources are decoded once in a process pool, rotated per EXIF,
+# downscaled to the profile's max edge and re-encoded without metadata.
+IMAGE_NORMALIZE = os.environ.get("IMAGE_NORMALIZE", "1") != "0"
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+IMAGE_PROFILES = {
+    "caption": (int(os.environ.get("CAPTION_MAX_EDGE", "1024")), 85),
+    "stage": (int(os.environ.get("STAGE_MAX_EDGE", "2048")), 90),
+}
+
+normalized_images = LRUCache(maxsize=int(os.environ.get("IMAGE_NORMALIZE_CACHE", "64")), ttl_s=3600)
+normalize_flight = SingleFlight()
+_image_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _normalize_image_sync(data: bytes, max_edge: int, quality: int) -> tuple:
+    """Runs in a worker process. Returns (bytes, mime)."""
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(data)) as im:
+        im = ImageOps.exif_transpose(im)
+        if max_edge and max(im.size) > max_edge:
+            im.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        out = BytesIO()
+        if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+            im.save(out, "PNG", optimize=True)
+            return out.getvalue(), "image/png"
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        im.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        return out.getvalue(), "image/jpeg"
+
+
+def _image_executor() -> ProcessPoolExecutor:
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _image_pool
+
+
+def shutdown_image_pool():
+    global _image_pool
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False, cancel_futures=True)
+        _image_pool = None
+
+
+async def normalize_image(data: bytes, mime: str, profile: str) -> tuple:
+    """Normalized (bytes, mime) for a provider profile, cached by source hash."""
+    if not IMAGE_NORMALIZE:
+        return data, mime
+    max_edge, quality = IMAGE_PROFILES[profile]
+    key = (hashlib.sha256(data).hexdigest(), profile)
+    hit = normalized_images.get(key)
+    if hit is not None:
+        return hit
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(_image_executor(), _normalize_image_sync, data, max_edge, quality)
+        except Exception as e:
+            raise HTTPException(400, detail=f"Unsupported image: {e}")
+        normalized_images.set(key, result)
+        return result
+
+    return await normalize_flight.do(key, run)
+
+
+def decode_image_data(image_data: str) -> tuple:
+    """Returns (mime, base64 payload) for a data: URL or a bare base64 string."""
+    mime = "image/jpeg"
+    if not image_data.startswith("data:"):
+        return mime, image_data
+    try:
+        header, data = image_data.split(",", 1)
+        if ";base64" not in header:
+            raise ValueError("Expected base64 data URL")
+        mime = header.split("data:")[1].split(";")[0] or mime
+        return mime, data
+    except Exception:
+        raise HTTPException(400, detail="Invalid imageData data URL")
+
+
+def _b64decode_image(b64: str) -> bytes:
+    try:
+        return base64.b64decode(b64, validate=False)
+    except Exception:
+        raise HTTPException(400, detail="Invalid base64 image data")
+
+
+# ---------- Image derivatives ----------
+# Responsive renditions of artwork images, e.g. /api/images/<id>/640.webp.
+# Files are keyed by a hash of the source imageUrl, so changing the image
+# naturally starts a new set; the ?v= in srcset URLs busts HTTP caches.
+DERIVATIVE_WIDTHS = [int(w) for w in os.environ.get("DERIVATIVE_WIDTHS", "320,640,1280").split(",") if w.strip()]
+DERIVATIVE_FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+DERIVATIVE_DIR = Path(os.environ.get("DERIVATIVE_DIR", str(ROOT_DIR / "media" / "derivatives")))
+DERIVATIVE_CACHE_MB = float(os.environ.get("DERIVATIVE_CACHE_MB", "512"))
+
+
+def _render_derivatives_sync(data: bytes, widths: List[int]) -> Dict[str, bytes]:
+    """Runs in a worker process: one decode, every width x format."""
+    from PIL import Image, ImageOps
+
+    out: Dict[str, bytes] = {}
+    with Image.open(BytesIO(data)) as src:
+        src = ImageOps.exif_transpose(src)
+        if src.mode != "RGB":
+            src = src.convert("RGB")
+        for w in sorted(widths, reverse=True):
+            im = src if src.width <= w else src.resize((w, max(1, round(src.height * w / src.width))), Image.LANCZOS)
+            for ext, (fmt, _mime) in DERIVATIVE_FORMATS.items():
+                buf = BytesIO()
+                if fmt == "WEBP":
+                    im.save(buf, fmt, quality=80, method=4)
+                else:
+                    im.save(buf, fmt, quality=82, optimize=True, progressive=True)
+                out[f"{w}.{ext}"] = buf.getvalue()
+    return out
+
+
+class DerivativeCache:
+    """Disk cache with an approximate LRU size bound (hits refresh mtime)."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    def path(self, source_hash: str, variant: str) -> Path:
+        return self.root / source_hash[:2] / source_hash / variant
+
+    def _files(self) -> List[Path]:
+        return [p for p in self.root.rglob("*") if p.is_file()] if self.root.exists() else []
+
+    def _write_all(self, source_hash: str, files: Dict[str, bytes]) -> int:
+        written = 0
+        for variant, data in files.items():
+            dest = self.path(source_hash, variant)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dest.with_name(f".{variant}.{uuid.uuid4().hex}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, dest)
+            written += len(data)
+        return written
+
+    def _evict(self, target: int, keep: str) -> int:
+        """Deletes least recently used files until under target, never those of `keep`."""
+        entries = []
+        keep_dir = self.path(keep, "x").parent
+        for p in self._files():
+            if p.parent == keep_dir:
+                continue
+            try:
+                st = p.stat()
+                entries.append((st.st_mtime, st.st_size, p))
+            except FileNotFoundError:
+                pass
+        kept = sum(p.stat().st_size for p in keep_dir.iterdir() if p.is_file()) if keep_dir.exists() else 0
+        total = kept + sum(e[1] for e in entries)
+        for _mtime, size, p in sorted(entries):
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except FileNotFoundError:
+                pass
+        return total
+
+    async def put(self, source_hash: str, files: Dict[str, bytes]):
+        async with self._lock:
+            if self._size is None:
+                self._size = await run_in_threadpool(lambda: sum(p.stat().st_size for p in self._files()))
+            self._size += await run_in_threadpool(self._write_all, source_hash, files)
+            if self._size > self.max_bytes:
+                self._size = await run_in_threadpool(self._evict, int(self.max_bytes * 0.9), source_hash)
+
+    def touch(self, path: Path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+derivative_cache = DerivativeCache(DERIVATIVE_DIR, int(DERIVATIVE_CACHE_MB * 1024 * 1024))
+derivative_flight = SingleFlight()
+
+
+def _source_hash(image_url: str) -> str:
+    return hashlib.sha256(image_url.strip().encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=8192)
+def artwork_srcset(art_id: Optional[str], image_url: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    srcset strings per format, e.g. {"webp": ".../320.webp?v=ab12 320w, ...", "jpg": ...}.
+    Memoized (pure in its arguments); the returned dict is shared, so do not mutate it.
+    """
+    if not art_id or not image_url:
+        return None
+    v = _source_hash(image_url)[:12]
+    return {
+        ext: ", ".join(f"{public_url(f'/api/images/{art_id}/{w}.{ext}')}?v={v} {w}w" for w in DERIVATIVE_WIDTHS)
+        for ext in DERIVATIVE_FORMATS
+    }
+
+
+async def _load_source_image(image_url: str) -> bytes:
+    key = media_key_from_url(image_url)
+    if key and media_store.exists(key):
+        return await run_in_threadpool(media_store.path(key).read_bytes)
+    r = await outbound.get("image", image_url, timeout=60)
+    if r.status_code != 200:
+        raise HTTPException(502, detail=f"Failed to fetch source image: {r.status_code}")
+    return r.content
+
+
+async def ensure_derivatives(image_url: str) -> str:
+    """Renders every variant for image_url unless already cached; returns the source hash."""
+    source_hash = _source_hash(image_url)
+    if all(derivative_cache.path(source_hash, f"{w}.{ext}").is_file() for w in DERIVATIVE_WIDTHS for ext in DERIVATIVE_FORMATS):
+        return source_hash
+
+    async def render():
+        data = await _load_source_image(image_url)
+        loop = asyncio.get_running_loop()
+        try:
+            files = await loop.run_in_executor(_image_executor(), _render_derivatives_sync, data, DERIVATIVE_WIDTHS)
+        except Exception as e:
+            raise HTTPException(415, detail=f"Could not decode source image: {e}")
+        await derivative_cache.put(source_hash, files)
+        return source_hash
+
+    return await derivative_flight.do(source_hash, render)
+
+
+def schedule_derivatives(image_url: Optional[str]):
+    if image_url:
+        asyncio.create_task(_run_logged(ensure_derivatives(image_url), f"derivatives for {image_url}"))
+
+
+# ---------- FastAPI app ----------
+app = FastAPI()
+
+@app.get("/", include_in_schema=False)
+def root():
+    return {"ok": True, "service": "api", "time": datetime.utcnow().isoformat(timespec="seconds") + "Z"}
+
+@app.get("/health", include_in_schema=False)
+def health():
+    return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    """Prometheus scrape endpoint; set METRICS_TOKEN to require `Authorization: Bearer <token>`."""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(401, detail="Not authorized")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _allowed_origins():
+    raw = os.environ.get("CORS_ORIGINS", "")
+    if raw.strip():
+        return [o.strip() for o in raw.split(",") if o.strip()]
+    return [
+        "https://jpart.at",
+        "https://www.jpart.at",
+        "http://localhost:3000",
+        "https://api.jpart.at",
+    ]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=_allowed_origins(),
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["*"],
+    expose_headers=["*"],
+    max_age=86400,
+)
+app.add_middleware(MetricsMiddleware)
+
+
+# Router under /api
+api_router = APIRouter(prefix="/api")
+
+# ---------- Models ----------
+class StageIn(BaseModel):
+    imageUrl: Optional[str] = None
+    imageData: Optional[str] = None
+    scene: str = "easel"
+    extraPrompt: Optional[str] = None
+    lang: Optional[str] = "en"
+
+class StageBatchScene(BaseModel):
+    scene: str = "easel"
+    extraPrompt: Optional[str] = None
+
+class StageBatchIn(BaseModel):
+    imageUrl: Optional[str] = None
+    imageData: Optional[str] = None
+    # Plain scene names or {scene, extraPrompt}; the top-level extraPrompt applies to scenes without their own.
+    scenes: List[Union[str, StageBatchScene]] = Field(min_length=1, max_length=STAGE_BATCH_MAX)
+    extraPrompt: Optional[str] = None
+    lang: Optional[str] = "en"
+
+class StatusCheck(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    client_name: str
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+class StatusCheckCreate(BaseModel):
+    client_name: str
+
+class User(BaseModel):
+    id: Optional[str] = Field(default=None)
+    email: EmailStr
+    name: Optional[str] = None
+    role: str = Field(default="user")
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class UserInDB(User):
+    hashed_password: str
+
+class UserCreate(BaseModel):
+    email: EmailStr
+    name: Optional[str] = None
+    password: str
+
+class TokenOut(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+
+class Artwork(BaseModel):
+    id: Optional[str] = None
+    title: str
+    priceCents: int = Field(ge=0)
+    category: str
+    imageUrl: Optional[str] = None
+    year: Optional[int] = None
+    medium: Optional[str] = None
+    dimensions: Optional[str] = None
+    status: str = Field(default="available")
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    updatedAt: datetime = Field(default_factory=datetime.utcnow)
+    srcset: Optional[Dict[str, str]] = None
+
+class ArtworkCreate(BaseModel):
+    title: str
+    priceCents: int
+    category: str
+    imageUrl: Optional[str] = None
+    year: Optional[int] = None
+    medium: Optional[str] = None
+    dimensions: Optional[str] = None
+    status: Optional[str] = "available"
+
+class ArtworkUpdate(BaseModel):
+    title: Optional[str] = None
+    priceCents: Optional[int] = None
+    category: Optional[str] = None
+    imageUrl: Optional[str] = None
+    year: Optional[int] = None
+    medium: Optional[str] = None
+    dimensions: Optional[str] = None
+    status: Optional[str] = None
+
+class ArtworkImportRow(ArtworkCreate):
+    # Legacy id from the PHP/MySQL catalog; rows that carry one are upserted on it.
+    id: Optional[Union[str, int]] = None
+
+class ArtworkPatchItem(BaseModel):
+    id: str
+    status: Optional[str] = None
+    priceCents: Optional[int] = Field(default=None, ge=0)
+
+class ArtworkBatchPatch(BaseModel):
+    items: List[ArtworkPatchItem] = Field(min_length=1, max_length=1000)
+
+class Category(BaseModel):
+    id: Optional[str] = None
+    key: str
+    label_en: Optional[str] = None
+    label_de: Optional[str] = None
+
+    # --- AI caption request/response ---
+class AICaptionRequest(BaseModel):
+    imageUrl: Optional[str] = None
+    imageData: Optional[str] = None
+    title: Optional[str] = None
+    year: Optional[int] = None
+    medium: Optional[str] = None
+    dimensions: Optional[str] = None
+    lang: Optional[str] = "en"
+    style: Optional[str] = None
+    system: Optional[str] = None
+    hashtags: Optional[str] = None 
+    force: Optional[bool] = False
+
+class AICaptionResponse(BaseModel):
+    caption: str
+
+
+class LoginBody(BaseModel):
+    password: str
+
+
+# ---------- Helpers ----------
+try:
+    import orjson
+except ImportError:  # optional speedup; the stdlib encoder produces the same bytes
+    orjson = None
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def json_dumps(value) -> bytes:
+    """
+    Compact UTF-8 JSON. The stdlib fallback matches FastAPI's JSONResponse byte
+    for byte. orjson decodes to the same values, but not always the same bytes:
+    large floats print as 1e16 rather than 1e+16, and NaN becomes null instead
+    of raising.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def json_bytes_response(body: bytes, response: Response) -> Response:
+    """Sends pre-encoded JSON, keeping headers the route already set on its injected `response`."""
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
+
+
+def id_filter(doc_id: str) -> Dict[str, Any]:
+    """
+    Matches a document by ObjectId or by the legacy string `id` in one query.
+    Both branches are index-backed (_id, and the unique `id` index).
+    """
+    if ObjectId.is_valid(doc_id):
+        return {"$or": [{"_id": ObjectId(doc_id)}, {"id": doc_id}]}
+    return {"id": doc_id}
+
+
+def new_doc_ids() -> Dict[str, Any]:
+    """_id plus its string twin in `id`, so new documents resolve through either index."""
+    oid = ObjectId()
+    return {"_id": oid, "id": str(oid)}
+
+
+async def ensure_id_indexes():
+    _db = require_db()
+    for coll in (_db.artworks, _db.categories):
+        await coll.create_index("id", name="legacy_id", unique=True, partialFilterExpression={"id": {"$type": "string"}})
+
+
+async def backfill_legacy_ids(coll, batch_size: int = 500, dry_run: bool = False) -> int:
+    """Copies str(_id) into `id` on documents that lack it. Returns the number of documents touched."""
+    ops, touched = [], 0
+    async for r in coll.find({"id": {"$exists": False}}, {"_id": 1}):
+        touched += 1
+        if dry_run:
+            continue
+        ops.append(UpdateOne({"_id": r["_id"], "id": {"$exists": False}}, {"$set": {"id": str(r["_id"])}}))
+        if len(ops) >= batch_size:
+            await coll.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await coll.bulk_write(ops, ordered=False)
+    return touched
+
+
+# ---------- Auth ----------
+# One path for both credentials: the admin session cookie (password login) and
+# bearer access tokens of DB users. Verified claims are cached by token hash,
+# the session cookie never needs the database, DB users are cached briefly,
+# and revoked tokens are checked against an in-memory denylist.
+AUTH_CLAIMS_CACHE_SIZE = int(os.environ.get("AUTH_CLAIMS_CACHE_SIZE", "1024"))
+AUTH_CLAIMS_TTL_S = float(os.environ.get("AUTH_CLAIMS_TTL_S", "300"))
+AUTH_USER_TTL_S = float(os.environ.get("AUTH_USER_TTL_S", "60"))
+AUTH_DENYLIST_SYNC_S = float(os.environ.get("AUTH_DENYLIST_SYNC_S", "15"))
+ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", "admin@jpart.at")
+
+SESSION_ADMIN = User(id="admin", email=ADMIN_EMAIL, name="Admin", role="admin", created_at=datetime(1970, 1, 1))
+auth_claims = LRUCache(AUTH_CLAIMS_CACHE_SIZE, AUTH_CLAIMS_TTL_S)
+auth_users = LRUCache(AUTH_CLAIMS_CACHE_SIZE, AUTH_USER_TTL_S)
+
+
+class TokenDenylist:
+    """
+    Revoked token ids (jti, or the token hash for tokens issued without one)
+    plus a not-before cutoff that revokes everything issued earlier. Persisted
+    in `revoked_tokens` (TTL on expiresAt) and re-read every AUTH_DENYLIST_SYNC_S
+    so revocations made by other workers apply within one interval.
+    """
+
+    def __init__(self):
+        self.ids: set = set()
+        self.not_before = 0
+
+    def is_revoked(self, claims: Dict[str, Any], token_hash: str) -> bool:
+        return (claims.get("jti") or token_hash) in self.ids or claims.get("iat", 0) < self.not_before
+
+    async def revoke(self, claims: Dict[str, Any], token_hash: str):
+        rid = claims.get("jti") or token_hash
+        self.ids.add(rid)
+        if db is not None:
+            expires = datetime.utcfromtimestamp(claims.get("exp") or time.time() + JWT_EXPIRES_MIN * 60)
+            await db.revoked_tokens.update_one({"_id": rid}, {"$set": {"expiresAt": expires}}, upsert=True)
+
+    async def revoke_all(self):
+        self.not_before = time.time()
+        if db is not None:
+            await db.revoked_tokens.update_one(
+                {"_id": "*"}, {"$set": {"notBefore": self.not_before, "expiresAt": datetime(9999, 1, 1)}}, upsert=True,
+            )
+
+    async def sync(self):
+        ids, not_before = set(), 0
+        async for r in db.revoked_tokens.find({"expiresAt": {"$gt": datetime.utcnow()}}):
+            if r["_id"] == "*":
+                not_before = r.get("notBefore", 0)
+            else:
+                ids.add(r["_id"])
+        self.ids, self.not_before = ids, not_before
+
+    async def run(self):
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Token denylist sync failed: %s", e)
+            await asyncio.sleep(AUTH_DENYLIST_SYNC_S)
+
+
+token_denylist = TokenDenylist()
+
+
+def _request_token(request: Request) -> Optional[str]:
+    auth_header = request.headers.get("authorization", "")
+    if auth_header.lower().startswith("bearer "):
+        return auth_header[7:].strip() or None
+    return request.cookies.get("session")
+
+
+def verified_claims(token: str) -> tuple:
+    """(claims, token hash) for a valid, unexpired, unrevoked token; raises 401 otherwise."""
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    claims = auth_claims.get(token_hash)
+    now = time.time()
+    if claims is None:
+        try:
+            claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG, JWT_ALGO])
+        except jwt.PyJWTError:
+            raise HTTPException(status_code=401, detail="Token invalid or expired")
+        ttl = min(AUTH_CLAIMS_TTL_S, claims["exp"] - now) if claims.get("exp") else AUTH_CLAIMS_TTL_S
+        auth_claims.set(token_hash, claims, ttl_s=max(ttl, 0.001))
+    elif claims.get("exp") is not None and claims["exp"] <= now:
+        auth_claims.pop(token_hash)
+        raise HTTPException(status_code=401, detail="Token invalid or expired")
+    if token_denylist.is_revoked(claims, token_hash):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return claims, token_hash
+
+
+# bcrypt is deliberately slow (~250 ms at cost 12), so it runs on a small
+# dedicated pool behind a semaphore, and login attempts are rate limited per
+# client IP and per (IP, account) before any hash is computed. The per-account
+# ceiling across all IPs is much higher, so one client guessing cannot lock the
+# real user out, while a spread-out guessing run still gets slowed down.
+PASSWORD_CONCURRENCY = int(os.environ.get("PASSWORD_CONCURRENCY", "2"))
+PASSWORD_QUEUE_TIMEOUT_S = float(os.environ.get("PASSWORD_QUEUE_TIMEOUT_S", "5"))
+PASSWORD_SEMAPHORE = asyncio.Semaphore(PASSWORD_CONCURRENCY)
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_CONCURRENCY, thread_name_prefix="bcrypt")
+
+LOGIN_WINDOW_S = float(os.environ.get("LOGIN_WINDOW_S", "300"))
+LOGIN_MAX_PER_IP = int(os.environ.get("LOGIN_MAX_PER_IP", "20"))
+LOGIN_MAX_PER_ACCOUNT = int(os.environ.get("LOGIN_MAX_PER_ACCOUNT", "10"))
+LOGIN_MAX_PER_ACCOUNT_GLOBAL = int(os.environ.get("LOGIN_MAX_PER_ACCOUNT_GLOBAL", "200"))
+
+
+async def _password_call(fn, *args):
+    try:
+        await asyncio.wait_for(PASSWORD_SEMAPHORE.acquire(), timeout=PASSWORD_QUEUE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(429, detail="Too many sign-in attempts in progress, try again shortly.", headers={"Retry-After": "5"})
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, fn, *args)
+    finally:
+        PASSWORD_SEMAPHORE.release()
+
+
+async def hash_password_async(plain: str) -> str:
+    return await _password_call(PWD_CTX.hash, plain)
+
+
+def _verify_and_update(plain: str, hashed: str) -> tuple:
+    try:
+        return PWD_CTX.verify_and_update(plain, hashed) if hashed else (False, None)
+    except Exception:
+        return False, None
+
+
+async def verify_password_async(plain: str, hashed: str) -> tuple:
+    """(valid, new_hash); new_hash is set when the stored hash should be replaced, e.g. after a BCRYPT_ROUNDS change."""
+    return await _password_call(_verify_and_update, plain, hashed)
+
+
+class SlidingWindowLimiter:
+    """Attempt log per key over the last `window_s`; the least recently used keys are dropped past `max_keys`."""
+
+    def __init__(self, limit: int, window_s: float, max_keys: int = 10000):
+        self.limit = limit
+        self.window_s = window_s
+        self.max_keys = max_keys
+        self._log: "OrderedDict[str, deque]" = OrderedDict()
+
+    def retry_after(self, key: str) -> float:
+        """Seconds until `key` may try again; 0 when it is under the limit (or the limit is off)."""
+        if self.limit <= 0:
+            return 0.0
+        log = self._log.get(key)
+        if not log:
+            return 0.0
+        cutoff = time.monotonic() - self.window_s
+        while log and log[0] <= cutoff:
+            log.popleft()
+        return log[0] - cutoff if len(log) >= self.limit else 0.0
+
+    def hit(self, key: str):
+        if self.limit <= 0:
+            return
+        self._log.setdefault(key, deque(maxlen=self.limit)).append(time.monotonic())
+        self._log.move_to_end(key)
+        while len(self._log) > self.max_keys:
+            self._log.popitem(last=False)
+
+    def reset(self, key: str):
+        self._log.pop(key, None)
+
+
+login_ip_limiter = SlidingWindowLimiter(LOGIN_MAX_PER_IP, LOGIN_WINDOW_S)
+login_account_limiter = SlidingWindowLimiter(LOGIN_MAX_PER_ACCOUNT, LOGIN_WINDOW_S)
+login_account_ceiling = SlidingWindowLimiter(LOGIN_MAX_PER_ACCOUNT_GLOBAL, LOGIN_WINDOW_S)
+
+
+def login_gate(request: Request, account: Optional[str]) -> Optional[str]:
+    """
+    Rejects with 429 before any hashing when the client IP, this IP's attempts
+    on the account, or the account's global ceiling is over its limit, else
+    records the attempt. Returns the (IP, account) key to reset on success.
+    """
+    ip = request.client.host if request.client else "unknown"
+    account = account.strip().lower() if account else None
+    pair = f"{ip}|{account}" if account else None
+    wait = login_ip_limiter.retry_after(ip)
+    if account:
+        wait = max(wait, login_account_limiter.retry_after(pair), login_account_ceiling.retry_after(account))
+    if wait > 0:
+        raise HTTPException(429, detail="Too many sign-in attempts, try again later.", headers={"Retry-After": str(int(wait) + 1)})
+    login_ip_limiter.hit(ip)
+    if account:
+        login_account_limiter.hit(pair)
+        login_account_ceiling.hit(account)
+    return pair
+
+
+async def admin_password_hash() -> str:
+    """
+    ADMIN_PASSWORD_HASH, or its rehashed successor stored after a login at a new
+    cost. The stored hash is tied to the env value it replaced, so changing the
+    env var still takes effect.
+    """
+    if db is None or not ADMIN_PASSWORD_HASH:
+        return ADMIN_PASSWORD_HASH
+    source = hashlib.sha256(ADMIN_PASSWORD_HASH.encode()).hexdigest()
+    doc = await db.auth_meta.find_one({"_id": "admin_password", "source": source})
+    return doc["hash"] if doc else ADMIN_PASSWORD_HASH
+
+
+async def store_admin_password_hash(new_hash: str):
+    if db is None:
+        logger.warning("ADMIN_PASSWORD_HASH was made with another bcrypt cost; regenerate it at BCRYPT_ROUNDS=%s", BCRYPT_ROUNDS)
+        return
+    source = hashlib.sha256(ADMIN_PASSWORD_HASH.encode()).hexdigest()
+    await db.auth_meta.update_one({"_id": "admin_password"}, {"$set": {"source": source, "hash": new_hash}}, upsert=True)
+
+
+async def get_user_by_email(email: str) -> Optional[UserInDB]:
+    _db = require_db()
+    row = await _db.users.find_one({"email": email})
+    if not row:
+        return None
+    row['id'] = str(row.get('_id'))
+    return UserInDB(**row)
+
+
+async def cached_user(email: str) -> Optional[User]:
+    user = auth_users.get(email) if AUTH_USER_TTL_S > 0 else None
+    if user is None:
+        row = await get_user_by_email(email)
+        if row is None:
+            return None
+        user = User(**row.model_dump(exclude={"hashed_password"}))
+        if AUTH_USER_TTL_S > 0:
+            auth_users.set(email, user)
+    return user
+
+
+def invalidate_user(email: str):
+    """Call after changing a user's role or credentials so the next request re-reads it."""
+    auth_users.pop(email)
+
+
+async def current_user(request: Request) -> Optional[User]:
+    token = _request_token(request)
+    if not token:
+        return None
+    claims, _ = verified_claims(token)
+    if claims.get("type") == "access":
+        user = await cached_user(claims.get("sub"))
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid user")
+        return user
+    if claims.get("role") == "admin":
+        return SESSION_ADMIN
+    raise HTTPException(status_code=401, detail="Token invalid or expired")
+
+
+async def require_user(request: Request) -> User:
+    user = await current_user(request)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user
+
+
+async def require_admin(request: Request) -> User:
+    user = await require_user(request)
+    if user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin privilege required")
+    return user
+
+# ---------- Basic Routes ----------
+@api_router.get("/")
+async def api_root():
+    return {"message": "Hello World"}
+
+@api_router.post("/status", response_model=StatusCheck)
+async def create_status_check(input: StatusCheckCreate):
+    _db = require_db()
+    status_obj = StatusCheck(**input.dict())
+    await _db.status_checks.insert_one(status_obj.dict())
+    return status_obj
+
+@api_router.get("/status", response_model=List[StatusCheck])
+async def get_status_checks():
+    _db = require_db()
+    status_checks = await _db.status_checks.find().to_list(1000)
+    return [StatusCheck(**{**s, 'id': s.get('id') or str(s.get('_id'))}) for s in status_checks]
+
+# ---------- Auth Routes ----------
+@api_router.post("/auth/register", response_model=User)
+async def register(user_in: UserCreate, request: Request):
+    _db = require_db()
+    login_gate(request, None)
+    existing = await get_user_by_email(user_in.email)
+    if existing:
+        raise HTTPException(400, detail="Email already registered")
+    doc = {
+        "email": user_in.email,
+        "name": user_in.name,
+        "role": "user",
+        "hashed_password": await hash_password_async(user_in.password),
+        "created_at": datetime.utcnow(),
+    }
+    res = await _db.users.insert_one(doc)
+    invalidate_user(user_in.email)
+    return User(id=str(res.inserted_id), email=user_in.email, name=user_in.name, role="user")
+
+@api_router.post("/auth/login")
+async def auth_login(body: LoginBody, request: Request, response: Response):
+    attempt_key = login_gate(request, "admin")
+    ok, new_hash = await verify_password_async(body.password, await admin_password_hash())
+    if not ok:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    login_account_limiter.reset(attempt_key)
+    if new_hash:
+        await store_admin_password_hash(new_hash)
+    token = _create_token("admin")
+    origin = request.headers.get("origin", "")
+    set_session_cookie(response, token)
+    return {"ok": True}
+
+
+@api_router.post("/auth/token", response_model=TokenOut)
+async def auth_token(request: Request, form: OAuth2PasswordRequestForm = Depends()):
+    """Bearer access token for a DB user (register/bootstrap accounts)."""
+    attempt_key = login_gate(request, form.username)
+    user = await get_user_by_email(form.username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    ok, new_hash = await verify_password_async(form.password, user.hashed_password)
+    if not ok:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    login_account_limiter.reset(attempt_key)
+    if new_hash:
+        await require_db().users.update_one(
+            {"email": user.email, "hashed_password": user.hashed_password}, {"$set": {"hashed_password": new_hash}},
+        )
+        invalidate_user(user.email)
+    return TokenOut(access_token=create_access_token({"sub": user.email}))
+
+@api_router.post("/auth/logout")
+async def auth_logout(request: Request, response: Response):
+    """Clears the cookie and revokes the presented token, so a copied token stops working too."""
+    token = _request_token(request)
+    if token:
+        try:
+            claims, token_hash = verified_claims(token)
+            await token_denylist.revoke(claims, token_hash)
+        except HTTPException:
+            pass
+    origin = request.headers.get("origin", "")
+    _clear_session_cookie(response, origin)
+    return {"ok": True}
+
+@api_router.post("/auth/revoke-all")
+async def auth_revoke_all(user: User = Depends(require_admin)):
+    """Invalidates every token issued so far, e.g. after rotating the admin password."""
+    await token_denylist.revoke_all()
+    return {"ok": True, "notBefore": token_denylist.not_before}
+
+@api_router.get("/auth/me")
+async def auth_me(request: Request):
+    try:
+        user = await current_user(request)
+    except HTTPException:
+        user = None
+    return {"isAdmin": bool(user and user.role == "admin")}
+
+@api_router.post("/auth/bootstrap", response_model=User)
+async def bootstrap_admin(request: Request, email: EmailStr = Form(...), password: str = Form(...), secret: Optional[str] = Form(None)):
+    _db = require_db()
+    login_gate(request, None)
+    count = await _db.users.count_documents({})
+    if count > 0:
+        raise HTTPException(403, detail="Bootstrap not allowed after users exist")
+    if secret and secret != os.environ.get('BOOTSTRAP_SECRET'):
+        raise HTTPException(403, detail="Invalid bootstrap secret")
+    doc = {
+        "email": email,
+        "name": "Admin",
+        "role": "admin",
+        "hashed_password": await hash_password_async(password),
+        "created_at": datetime.utcnow(),
+    }
+    res = await _db.users.insert_one(doc)
+    invalidate_user(email)
+    return User(id=str(res.inserted_id), email=email, name="Admin", role="admin")
+
+# ---------- Category Routes ----------
+@api_router.get("/categories", response_model=List[Category])
+async def list_categories(request: Request, response: Response):
+    _db = require_db()
+    not_modified = await catalog_conditional(request, response)
+    if not_modified:
+        return not_modified
+
+    async def load():
+        rows = await _db.categories.find().to_list(100)
+        items = []
+        for r in rows:
+            r['id'] = str(r.get('_id'))
+            items.append(Category(**r))
+        return items
+
+    return await catalog_cache.get_or_load(("categories",), load)
+
+@api_router.post("/categories", response_model=Category)
+async def create_category(cat: Category, user: User = Depends(require_admin)):
+    _db = require_db()
+    doc = {
+        **new_doc_ids(),
+        "key": cat.key,
+        "label_en": cat.label_en,
+        "label_de": cat.label_de,
+        "created_at": datetime.utcnow(),
+    }
+    res = await _db.categories.insert_one(doc)
+    await catalog_revision.bump()
+    cat_dict = cat.dict()
+    cat_dict['id'] = str(res.inserted_id)
+    return Category(**cat_dict)
+
+@api_router.delete("/categories/{cat_id}")
+async def delete_category(cat_id: str, user: User = Depends(require_admin)):
+    _db = require_db()
+    res = await _db.categories.delete_one(id_filter(cat_id))
+    if res.deleted_count == 0:
+        raise HTTPException(404, detail="Category not found")
+    await catalog_revision.bump()
+    return {"ok": True}
+
+# ---------- Catalog query engine ----------
+# Every sort order ends on _id so the keyset (sort value, _id) is unique and
+# a page boundary can be resumed from the last row without skip().
+ARTWORK_SORTS: Dict[str, List[tuple]] = {
+    "priceAsc": [("priceCents", 1), ("_id", 1)],
+    "priceDesc": [("priceCents", -1), ("_id", -1)],
+    "nameAZ": [("title", 1), ("_id", 1)],
+    "categoryAZ": [("category", 1), ("_id", 1)],
+}
+ARTWORK_DEFAULT_SORT = "priceAsc"
+
+# Equality filters the gallery uses, each combined with every sort field below.
+ARTWORK_INDEX_FILTERS = [(), ("status",), ("category",), ("year",), ("status", "category"), ("searchTokens",)]
+ARTWORK_INDEX_SORT_FIELDS = ["priceCents", "title", "category"]
+
+ARTWORKS_PAGE_DEFAULT = int(os.environ.get("ARTWORKS_PAGE_DEFAULT", "500"))
+ARTWORKS_PAGE_MAX = int(os.environ.get("ARTWORKS_PAGE_MAX", "1000"))
+SEARCH_TOKEN_MAX_LEN = 32
+
+
+def _artwork_search_tokens(title: Optional[str]) -> List[str]:
+    """All lowercase word prefixes of a title, e.g. 'Red Sun' -> r, re, red, s, su, sun."""
+    tokens = set()
+    for word in re.findall(r"\w+", (title or "").lower()):
+        word = word[:SEARCH_TOKEN_MAX_LEN]
+        for i in range(1, len(word) + 1):
+            tokens.add(word[:i])
+    return sorted(tokens)
+
+
+def _search_query_terms(query: str) -> List[str]:
+    return [w[:SEARCH_TOKEN_MAX_LEN] for w in re.findall(r"\w+", query.lower())]
+
+
+def _encode_cursor(sort: str, row: Dict[str, Any]) -> str:
+    field = ARTWORK_SORTS[sort][0][0]
+    _id = row.get("_id")
+    raw = {"s": sort, "v": row.get(field), "i": str(_id), "o": isinstance(_id, ObjectId)}
+    return base64.urlsafe_b64encode(json.dumps(raw, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str) -> Dict[str, Any]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if raw["s"] != sort:
+            raise ValueError("cursor belongs to a different sort order")
+        _id = ObjectId(raw["i"]) if raw.get("o") else raw["i"]
+    except Exception:
+        raise HTTPException(400, detail="Invalid cursor")
+    field, direction = ARTWORK_SORTS[sort][0]
+    value = raw.get("v")
+    op = "$gt" if direction == 1 else "$lt"
+    # Mongo orders null/missing before any value, so they are the head of an
+    # ascending scan and the tail of a descending one.
+    if value is None:
+        if direction == 1:
+            return {"$or": [{field: {"$ne": None}}, {field: None, "_id": {op: _id}}]}
+        return {field: None, "_id": {op: _id}}
+    clauses = [{field: {op: value}}, {field: value, "_id": {op: _id}}]
+    if direction == -1:
+        clauses.append({field: None})
+    return {"$or": clauses}
+
+
+def _artwork_filter(query: Optional[str], category: Optional[str], year: Optional[int], status_f: Optional[str]) -> Dict[str, Any]:
+    q: Dict[str, Any] = {}
+    if query:
+        terms = _search_query_terms(query)
+        if terms:
+            q["searchTokens"] = {"$all": terms} if len(terms) > 1 else terms[0]
+    if category:
+        q["category"] = category
+    if year is not None:
+        q["year"] = year
+    if status_f:
+        q["status"] = status_f
+    return q
+
+
+ARTWORK_PRICE_BUCKETS = [int(b) for b in os.environ.get("ARTWORK_PRICE_BUCKETS", "0,10000,25000,50000,100000,250000").split(",")]
+
+
+def _price_boundaries(raw: Optional[str]) -> List[int]:
+    if not raw:
+        return ARTWORK_PRICE_BUCKETS
+    try:
+        boundaries = [int(b) for b in raw.split(",")]
+    except ValueError:
+        raise HTTPException(400, detail="buckets must be comma-separated integers")
+    if not 1 <= len(boundaries) <= 50 or boundaries != sorted(set(boundaries)):
+        raise HTTPException(400, detail="buckets must be 1-50 strictly increasing integers")
+    return boundaries
+
+
+def _artwork_facet_stages(boundaries: List[int]) -> Dict[str, list]:
+    def count_by(field: str) -> list:
+        return [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}, {"$sort": {"count": -1, "_id": 1}}]
+
+    return {
+        "total": [{"$count": "count"}],
+        "category": count_by("category"),
+        "year": count_by("year"),
+        "status": count_by("status"),
+        "price": [
+            # Prices below the first boundary (or missing) are not counted in any bucket.
+            {"$match": {"priceCents": {"$gte": boundaries[0]}}},
+            {"$bucket": {"groupBy": "$priceCents", "boundaries": [*boundaries, 2**62], "default": "overflow", "output": {"count": {"$sum": 1}}}},
+        ],
+    }
+
+
+def _artwork_index_specs() -> List[List[tuple]]:
+    specs, seen = [], set()
+    for filters in ARTWORK_INDEX_FILTERS:
+        for sort_field in ARTWORK_INDEX_SORT_FIELDS:
+            keys = []
+            for f in (*filters, sort_field, "_id"):
+                if f not in [k for k, _ in keys]:
+                    keys.append((f, 1))
+            if tuple(keys) not in seen:
+                seen.add(tuple(keys))
+                specs.append(keys)
+    return specs
+
+
+async def ensure_artwork_indexes():
+    _db = require_db()
+    for keys in _artwork_index_specs():
+        name = "art_" + "_".join(k for k, _ in keys)
+        await _db.artworks.create_index(keys, name=name, background=True)
+    # Holds every field artwork_facets reads, so unsearched facet counts never fetch documents.
+    await _db.artworks.create_index(
+        [("status", 1), ("category", 1), ("year", 1), ("priceCents", 1)], name="art_facets", background=True,
+    )
+
+
+async def backfill_search_tokens(batch_size: int = 500):
+    """Adds searchTokens to artworks written before the field existed."""
+    _db = require_db()
+    ops = []
+    async for r in _db.artworks.find({"searchTokens": {"$exists": False}}, {"title": 1}):
+        ops.append(UpdateOne({"_id": r["_id"]}, {"$set": {"searchTokens": _artwork_search_tokens(r.get("title"))}}))
+        if len(ops) >= batch_size:
+            await _db.artworks.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await _db.artworks.bulk_write(ops, ordered=False)
+
+
+def _artwork_model(r: Dict[str, Any]) -> Artwork:
+    return Artwork(**{**r, "srcset": artwork_srcset(r.get("id"), r.get("imageUrl"))})
+
+
+# Read paths skip the model: rows written through the API already have
+# Artwork's types, so they are turned straight into dicts with its keys, order
+# and defaults and encoded once. Legacy rows (imported or hand-edited, e.g. a
+# float priceCents or a string year) fail the type check and go through the
+# model, so they still get its coercion.
+ARTWORK_FIELD_DEFAULTS = [(name, f.default_factory, f.default) for name, f in Artwork.model_fields.items()]
+ARTWORK_READ_PROJECTION = {name: 1 for name, _, _ in ARTWORK_FIELD_DEFAULTS if name not in ("id", "srcset")}
+_OPT_STR, _OPT_INT = (str, type(None)), (int, type(None))
+ARTWORK_LEAN_TYPES = {
+    "title": (str,), "priceCents": (int,), "category": (str,), "imageUrl": _OPT_STR, "year": _OPT_INT,
+    "medium": _OPT_STR, "dimensions": _OPT_STR, "status": (str,), "createdAt": (datetime,), "updatedAt": (datetime,),
+}
+_ARTWORK_REQUIRED = {name for name, f in Artwork.model_fields.items() if f.is_required()}
+
+
+def _artwork_row_is_lean(r: Dict[str, Any]) -> bool:
+    for name, types in ARTWORK_LEAN_TYPES.items():
+        if name not in r:
+            if name in _ARTWORK_REQUIRED:
+                return False
+        elif type(r[name]) not in types:  # exact: a bool is not an int here
+            return False
+    return r["priceCents"] >= 0
+
+
+def artwork_row(r: Dict[str, Any]) -> Dict[str, Any]:
+    """Plain-dict twin of _artwork_model(r).model_dump() for a row read with ARTWORK_READ_PROJECTION."""
+    if not _artwork_row_is_lean(r):
+        return _artwork_model({**r, "id": str(r["_id"])}).model_dump()
+    row = {}
+    for name, factory, default in ARTWORK_FIELD_DEFAULTS:
+        if name in r:
+            row[name] = r[name]
+        else:
+            row[name] = factory() if factory is not None else default
+    row["id"] = str(r["_id"])
+    row["srcset"] = artwork_srcset(row["id"], row["imageUrl"])
+    return row
+
+
+async def watch_catalog_changes():
+    """
+    Invalidates the catalog cache and the held revision on every catalog change
+    seen by a Mongo change stream, keeping several Uvicorn workers coherent.
+    Change streams need a replica set; on a standalone server the TTLs are the
+    fallback.
+    """
+    backoff = 1.0
+    while True:
+        try:
+            pipeline = [{"$match": {"ns.coll": {"$in": ["artworks", "categories", "catalog_meta"]}}}]
+            async with db.watch(pipeline) as stream:
+                backoff = 1.0
+                async for _change in stream:
+                    catalog_cache.invalidate()
+                    catalog_revision.expire()
+                    catalog_snapshot.schedule()
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            if e.code in (40573, 40324) or "replica set" in str(e).lower():
+                logger.info("Change streams unavailable (%s); catalog cache relies on its TTL", e)
+                return
+            logger.warning("Catalog change stream failed: %s", e)
+        except Exception as e:
+            logger.warning("Catalog change stream failed: %s", e)
+        catalog_cache.invalidate()  # events may have been missed while disconnected
+        catalog_revision.expire()
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 60.0)
+
+
+# ---------- Bulk artwork import/export ----------
+ARTWORK_IMPORT_BATCH = int(os.environ.get("ARTWORK_IMPORT_BATCH", "500"))
+ARTWORK_IMPORT_MAX_MB = float(os.environ.get("ARTWORK_IMPORT_MAX_MB", "50"))
+ARTWORK_IMPORT_MAX_ERRORS = 1000
+ARTWORK_EXPORT_CHUNK = 64 * 1024
+
+
+def _import_rows(f, fmt: str):
+    """Yields (line, row dict or error message) from an NDJSON or CSV upload."""
+    text = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for rec in reader:
+            # Empty cells are left out so model defaults (e.g. status) apply.
+            yield reader.line_num, {k.strip(): v for k, v in rec.items() if k and v not in ("", None)}
+        return
+    for n, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield n, f"invalid JSON: {e}"
+            continue
+        yield n, row if isinstance(row, dict) else "row must be a JSON object"
+
+
+def _row_error(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors())
+    return str(e)
+
+
+def _import_op(item: ArtworkImportRow, now: datetime):
+    doc = item.model_dump(exclude={"id"})
+    doc["status"] = doc.get("status") or "available"
+    doc["searchTokens"] = _artwork_search_tokens(doc.get("title"))
+    doc["updatedAt"] = now
+    if item.id is None:
+        return InsertOne({**new_doc_ids(), **doc, "createdAt": now})
+    return UpdateOne(
+        {"id": str(item.id)},
+        {"$set": doc, "$setOnInsert": {"_id": ObjectId(), "createdAt": now}},
+        upsert=True,
+    )
+
+
+@api_router.post("/artworks/import")
+async def import_artworks(request: Request, format: Optional[str] = None, user: User = Depends(require_admin)):
+    """
+    Bulk create/update from an NDJSON or CSV body (columns = ArtworkCreate fields,
+    plus an optional legacy `id` to upsert on). The body is spooled, then parsed
+    and written in bulk_write batches; rows that fail validation or the write
+    are reported by line and do not stop the import.
+    """
+    _db = require_db()
+    fmt = (format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")).lower()
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(400, detail="format must be ndjson or csv")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    summary: Dict[str, Any] = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+    image_urls = set()
+
+    def fail(line: int, message: str):
+        summary["failed"] += 1
+        if len(summary["errors"]) < ARTWORK_IMPORT_MAX_ERRORS:
+            summary["errors"].append({"line": line, "error": message})
+
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > ARTWORK_IMPORT_MAX_MB * 1024 * 1024:
+                raise HTTPException(413, detail=f"Import larger than {ARTWORK_IMPORT_MAX_MB:g} MB")
+            spool.write(chunk)
+        spool.seek(0)
+        rows = _import_rows(spool, fmt)
+        while True:
+            batch = await run_in_threadpool(lambda: list(islice(rows, ARTWORK_IMPORT_BATCH)))
+            if not batch:
+                break
+            now = datetime.utcnow()
+            ops, lines = [], []
+            for line, raw in batch:
+                try:
+                    if isinstance(raw, str):
+                        raise ValueError(raw)
+                    item = ArtworkImportRow(**raw)
+                except ValueError as e:
+                    fail(line, _row_error(e))
+                    continue
+                ops.append(_import_op(item, now))
+                lines.append(line)
+                if item.imageUrl:
+                    image_urls.add(item.imageUrl)
+            if not ops:
+                continue
+            try:
+                result = (await _db.artworks.bulk_write(ops, ordered=False)).bulk_api_result
+            except BulkWriteError as e:
+                result = e.details
+                for err in result.get("writeErrors", []):
+                    fail(lines[err["index"]], err.get("errmsg", "write failed"))
+            summary["inserted"] += result.get("nInserted", 0) + result.get("nUpserted", 0)
+            summary["updated"] += result.get("nMatched", 0)
+    except UnicodeDecodeError:
+        raise HTTPException(400, detail="Import must be UTF-8")
+    finally:
+        spool.close()
+
+    if summary["inserted"] or summary["updated"]:
+        await catalog_revision.bump()
+        for url in image_urls:
+            schedule_derivatives(url)
+    summary["errorsTruncated"] = summary["failed"] > len(summary["errors"])
+    return summary
+
+
+@api_router.patch("/artworks")
+async def patch_artworks(body: ArtworkBatchPatch, user: User = Depends(require_admin)):
+    """Sets status and/or priceCents on many artworks in one bulk_write; unknown ids come back in `missing`."""
+    _db = require_db()
+    ids = [it.id for it in body.items]
+    found = set()
+    async for r in _db.artworks.find({"$or": [id_filter(i) for i in ids]}, {"_id": 1, "id": 1}):
+        found.update({str(r["_id"]), r.get("id")})
+    missing = [i for i in ids if i not in found]
+
+    now = datetime.utcnow()
+    ops = []
+    for it in body.items:
+        upd = it.model_dump(exclude={"id"}, exclude_none=True)
+        if not upd:
+            raise HTTPException(400, detail=f"Nothing to update for {it.id}")
+        if it.id not in found:
+            continue
+        ops.append(UpdateOne(id_filter(it.id), {"$set": {**upd, "updatedAt": now}}))
+    matched = modified = 0
+    if ops:
+        res = await _db.artworks.bulk_write(ops, ordered=False)
+        matched, modified = res.matched_count, res.modified_count
+        await catalog_revision.bump()
+    return {"matched": matched, "modified": modified, "missing": missing}
+
+
+@api_router.get("/artworks/export")
+async def export_artworks(user: User = Depends(require_admin)):
+    """Every artwork as NDJSON (re-importable through /artworks/import), streamed from the cursor."""
+    _db = require_db()
+
+    async def lines():
+        buf = bytearray()
+        projection = {**ARTWORK_READ_PROJECTION, "id": 1}
+        async for r in _db.artworks.find({}, projection).sort("_id", 1).batch_size(ARTWORK_IMPORT_BATCH):
+            row = artwork_row(r)
+            row.pop("srcset", None)
+            row["id"] = r.get("id") or row["id"]  # the key a re-import upserts on
+            buf += json_dumps(row) + b"\n"
+            if len(buf) >= ARTWORK_EXPORT_CHUNK:
+                yield bytes(buf)
+                buf.clear()
+        if buf:
+            yield bytes(buf)
+
+    return StreamingResponse(
+        lines(), media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="artworks.ndjson"', "Cache-Control": "no-store"},
+    )
+
+
+# ---------- Artwork Routes ----------
+@api_router.post("/artworks", response_model=Artwork)
+async def create_artwork(body: ArtworkCreate, user: User = Depends(require_admin)):
+    _db = require_db()
+    now = datetime.utcnow()
+    doc = {**new_doc_ids(), **body.dict(), "createdAt": now, "updatedAt": now}
+    doc["searchTokens"] = _artwork_search_tokens(doc.get("title"))
+    res = await _db.artworks.insert_one(doc)
+    await catalog_revision.bump()
+    schedule_derivatives(doc.get("imageUrl"))
+    return _artwork_model(doc)
+
+@api_router.get("/artworks", response_model=List[Artwork])
+async def list_artworks(request: Request, response: Response, query: Optional[str] = None, category: Optional[str] = None, year: Optional[int] = None, status_f: Optional[str] = None, sort: Optional[str] = ARTWORK_DEFAULT_SORT, limit: int = Query(ARTWORKS_PAGE_DEFAULT, ge=1, le=ARTWORKS_PAGE_MAX), cursor: Optional[str] = None):
+    """
+    Keyset-paginated catalog listing. The body stays a plain list; when more rows
+    exist the opaque cursor for the next page is sent in the X-Next-Cursor header.
+    """
+    _db = require_db()
+    not_modified = await catalog_conditional(request, response)
+    if not_modified:
+        return not_modified
+    if sort not in ARTWORK_SORTS:
+        sort = ARTWORK_DEFAULT_SORT
+    q = _artwork_filter(query, category, year, status_f)
+    if cursor:
+        q = {"$and": [q, _decode_cursor(cursor, sort)]} if q else _decode_cursor(cursor, sort)
+
+    async def load():
+        rows = await _db.artworks.find(q, ARTWORK_READ_PROJECTION).sort(ARTWORK_SORTS[sort]).limit(limit + 1).to_list(limit + 1)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(sort, rows[-1])
+        return json_dumps([artwork_row(r) for r in rows]), next_cursor
+
+    # The cache holds the encoded page, so a hit is served without touching any row.
+    key = ("artworks", tuple(_search_query_terms(query or "")), category, year, status_f, sort, limit, cursor)
+    body, next_cursor = await catalog_cache.get_or_load(key, load)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return json_bytes_response(body, response)
+
+# Declared before /artworks/{art_id} so "facets" is not taken for an id.
+@api_router.get("/artworks/facets")
+async def artwork_facets(request: Request, response: Response, query: Optional[str] = None, category: Optional[str] = None, year: Optional[int] = None, status_f: Optional[str] = None, buckets: Optional[str] = None):
+    """
+    Match counts per category, year, status and price bucket for the same filters
+    list_artworks takes, from one $facet aggregation. `buckets` overrides the
+    price boundaries in cents, e.g. "0,10000,50000"; the last bucket is open-ended.
+    """
+    _db = require_db()
+    not_modified = await catalog_conditional(request, response)
+    if not_modified:
+        return not_modified
+    boundaries = _price_boundaries(buckets)
+    q = _artwork_filter(query, category, year, status_f)
+
+    async def load():
+        pipeline = [{"$match": q}, {"$facet": _artwork_facet_stages(boundaries)}]
+        # Without a search term every needed field is in art_facets, so the scan is
+        # index-only; token lookups are left to the planner (searchTokens indexes).
+        opts = {} if "searchTokens" in q else {"hint": "art_facets"}
+        out = (await _db.artworks.aggregate(pipeline, **opts).to_list(1))[0]
+        counts = {b["_id"]: b["count"] for b in out["price"]}
+        edges = [*boundaries, None]
+        return json_dumps({
+            "total": out["total"][0]["count"] if out["total"] else 0,
+            "category": [{"value": r["_id"], "count": r["count"]} for r in out["category"]],
+            "year": [{"value": r["_id"], "count": r["count"]} for r in out["year"]],
+            "status": [{"value": r["_id"], "count": r["count"]} for r in out["status"]],
+            "price": [
+                {"min": lo, "max": hi, "count": counts.get(lo, 0)}
+                for lo, hi in zip(edges, edges[1:])
+            ],
+        })
+
+    key = ("facets", tuple(_search_query_terms(query or "")), category, year, status_f, tuple(boundaries))
+    return json_bytes_response(await catalog_cache.get_or_load(key, load), response)
+
+async def load_artwork(art_id: str) -> Dict[str, Any]:
+    """The artwork as an artwork_row dict; the cached value is shared, so callers must not mutate it."""
+    _db = require_db()
+
+    async def load():
+        r = await _db.artworks.find_one(id_filter(art_id), ARTWORK_READ_PROJECTION)
+        if not r:
+            raise HTTPException(404, detail="Artwork not found")
+        return artwork_row(r)
+
+    return await catalog_cache.get_or_load(("artwork", art_id), load)
+
+@api_router.get("/artworks/{art_id}", response_model=Artwork)
+async def get_artwork(art_id: str, request: Request, response: Response):
+    require_db()
+    not_modified = await catalog_conditional(request, response)
+    if not_modified:
+        return not_modified
+    return json_bytes_response(json_dumps(await load_artwork(art_id)), response)
+
+@api_router.put("/artworks/{art_id}", response_model=Artwork)
+async def update_artwork(art_id: str, body: ArtworkUpdate, user: User = Depends(require_admin)):
+    _db = require_db()
+    upd = {k: v for k, v in body.dict().items() if v is not None}
+    upd['updatedAt'] = datetime.utcnow()
+    if 'title' in upd:
+        upd['searchTokens'] = _artwork_search_tokens(upd['title'])
+
+    r = await _db.artworks.find_one_and_update(
+        id_filter(art_id), {"$set": upd}, projection={"searchTokens": 0}, return_document=ReturnDocument.AFTER,
+    )
+    if not r:
+        raise HTTPException(404, detail="Artwork not found")
+    await catalog_revision.bump()
+    if 'imageUrl' in upd:
+        schedule_derivatives(upd['imageUrl'])
+    r['id'] = str(r.get('_id')) if r.get('_id') else r.get('id')
+    return _artwork_model(r)
+
+@api_router.delete("/artworks/{art_id}")
+async def delete_artwork(art_id: str, user: User = Depends(require_admin)):
+    _db = require_db()
+    res = await _db.artworks.delete_one(id_filter(art_id))
+    if res.deleted_count == 0:
+        raise HTTPException(404, detail="Artwork not found")
+    await catalog_revision.bump()
+    return {"ok": True}
+
+@api_router.get("/images/{art_id}/{variant}")
+async def artwork_image_variant(art_id: str, variant: str, request: Request, v: Optional[str] = None):
+    """Responsive rendition of an artwork image, rendered on first request if needed."""
+    m = re.fullmatch(r"(\d+)\.(webp|jpg)", variant)
+    if not m or int(m.group(1)) not in DERIVATIVE_WIDTHS:
+        raise HTTPException(404, detail="Unknown image variant")
+    art = await load_artwork(art_id)
+    if not art["imageUrl"]:
+        raise HTTPException(404, detail="Artwork has no image")
+    source_hash = await ensure_derivatives(art["imageUrl"])
+    path = derivative_cache.path(source_hash, variant)
+    if not path.is_file():  # evicted between render and read
+        await ensure_derivatives(art["imageUrl"])
+    derivative_cache.touch(path)
+
+    etag = f'"{source_hash[:16]}-{variant}"'
+    immutable = v is not None and v == source_hash[:12]
+    headers = {"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL if immutable else "public, max-age=3600"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=DERIVATIVE_FORMATS[m.group(2)][1], headers=headers)
+
+# ---------- Catalog snapshot ----------
+# The public gallery loads the whole catalog at once. After catalog writes a
+# background task renders it to catalog-<revision>.json plus .gz/.br variants
+# on disk, and /api/catalog/snapshot serves the variant the client accepts as
+# a file, so a request never touches Mongo or compresses anything.
+CATALOG_SNAPSHOT_DIR = Path(os.environ.get("CATALOG_SNAPSHOT_DIR", str(ROOT_DIR / "media" / "snapshots")))
+CATALOG_SNAPSHOT_DEBOUNCE_S = float(os.environ.get("CATALOG_SNAPSHOT_DEBOUNCE_S", "2"))
+CATALOG_SNAPSHOT_POLL_S = float(os.environ.get("CATALOG_SNAPSHOT_POLL_S", "30"))
+CATALOG_SNAPSHOT_KEEP = int(os.environ.get("CATALOG_SNAPSHOT_KEEP", "3"))
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always written
+    brotli = None
+
+SNAPSHOT_ENCODINGS = [("br", ".br"), ("gzip", ".gz")] if brotli is not None else [("gzip", ".gz")]
+
+
+def _compress_snapshot_sync(body: bytes) -> Dict[str, bytes]:
+    out = {".gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        out[".br"] = brotli.compress(body, quality=11)
+    return out
+
+
+class CatalogSnapshot:
+    """Debounced builder for the on-disk catalog snapshots, one set per catalog revision."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.flight = SingleFlight()
+        self._dirty = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.builds = 0
+
+    def path(self, version: int, suffix: str = "") -> Path:
+        return self.root / f"catalog-{version}.json{suffix}"
+
+    def latest(self, at_most: int) -> Optional[int]:
+        """Newest complete snapshot not ahead of `at_most` (files can outlive a reset catalog_meta)."""
+        versions = [int(m.group(1)) for p in self.root.glob("catalog-*.json") if (m := re.fullmatch(r"catalog-(\d+)\.json", p.name))]
+        return max((v for v in versions if v <= at_most), default=None)
+
+    def schedule(self):
+        self._dirty.set()
+
+    async def ensure(self, version: int) -> int:
+        if not self.path(version).is_file():
+            await self.flight.do(version, lambda: self._build(version))
+        return version
+
+    async def _build(self, version: int):
+        _db = require_db()
+        rows = await _db.artworks.find({}, ARTWORK_READ_PROJECTION).sort(ARTWORK_SORTS[ARTWORK_DEFAULT_SORT]).to_list(None)
+        cats = await _db.categories.find().to_list(None)
+        body = json_dumps({
+            "version": version,
+            "generatedAt": _http_now(),
+            "artworks": [artwork_row(r) for r in rows],
+            "categories": [Category(**{**c, "id": str(c["_id"])}).model_dump() for c in cats],
+        })
+        variants = await run_in_threadpool(_compress_snapshot_sync, body)
+        await run_in_threadpool(self._write_set, version, body, variants)
+        self.builds += 1
+
+    def _write_set(self, version: int, body: bytes, variants: Dict[str, bytes]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Variants first and the plain file last: its presence marks a complete set.
+        for suffix, data in [*variants.items(), ("", body)]:
+            target = self.path(version, suffix)
+            tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}")
+            tmp.write_bytes(data)
+            os.replace(tmp, target)
+        for old in sorted({int(p.name.split("-")[1].split(".")[0]) for p in self.root.glob("catalog-*.json*")})[:-CATALOG_SNAPSHOT_KEEP]:
+            for p in self.root.glob(f"catalog-{old}.json*"):
+                p.unlink(missing_ok=True)
+
+    async def run(self):
+        """Rebuilds once writes settle; the periodic check picks up writes made by other workers."""
+        while True:
+            try:
+                await asyncio.wait_for(self._dirty.wait(), timeout=CATALOG_SNAPSHOT_POLL_S)
+                await asyncio.sleep(CATALOG_SNAPSHOT_DEBOUNCE_S)
+            except asyncio.TimeoutError:
+                pass
+            self._dirty.clear()
+            try:
+                version, _ = await catalog_revision.current()
+                await self.ensure(version)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Catalog snapshot build failed")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+            self.schedule()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+catalog_snapshot = CatalogSnapshot(CATALOG_SNAPSHOT_DIR)
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+@api_router.get("/catalog/version")
+async def catalog_version():
+    """Current catalog revision, so a client holding a snapshot can skip refetching it."""
+    require_db()
+    version, updated_at = await catalog_revision.current()
+    return {"version": version, "updatedAt": updated_at}
+
+
+@api_router.get("/catalog/snapshot")
+async def get_catalog_snapshot(request: Request):
+    """
+    All artworks and categories as one precompressed document. While a newer
+    revision is being rendered the previous snapshot is served; X-Catalog-Version
+    names the revision actually sent.
+    """
+    require_db()
+    current, _ = await catalog_revision.current()
+    version = catalog_snapshot.latest(current)
+    if version is None:
+        version = await catalog_snapshot.ensure(current)
+    elif version < current:
+        catalog_snapshot.schedule()
+
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    encoding, suffix = next(((e, s) for e, s in SNAPSHOT_ENCODINGS if e in accepted), (None, ""))
+    path = catalog_snapshot.path(version, suffix)
+    if not path.is_file():  # pruned between lookup and read
+        version = await catalog_snapshot.ensure(current)
+        path = catalog_snapshot.path(version, suffix)
+
+    etag = f'"snap-{version}{suffix}"'
+    headers = {
+        "ETag": etag,
+        "X-Catalog-Version": str(version),
+        "Cache-Control": f"public, no-cache, stale-while-revalidate={CATALOG_SWR_S}",
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path, media_type="application/json", headers=headers)
+
+
+# ---------- Uploads ----------
+# Resumable multipart uploads: init -> PUT parts (any order, in parallel,
+# re-sendable) -> complete. Parts are streamed to disk and hashed as they
+# arrive; complete concatenates them and moves the result into the media
+# store, whose URL is what goes into Artwork.imageUrl.
+UPLOAD_DIR = Path(os.environ.get("UPLOAD_DIR", str(ROOT_DIR / "media" / "uploads")))
+UPLOAD_PART_SIZE = int(os.environ.get("CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_MB = float(os.environ.get("UPLOAD_MAX_MB", "200"))
+UPLOAD_TTL_S = float(os.environ.get("UPLOAD_TTL_S", str(24 * 3600)))
+UPLOAD_GC_INTERVAL_S = float(os.environ.get("UPLOAD_GC_INTERVAL_S", "600"))
+
+
+class LocalUploadBackend:
+    """
+    Part storage on the local filesystem, one directory per upload. An
+    S3/R2-compatible backend maps the same calls onto CreateMultipartUpload /
+    UploadPart / CompleteMultipartUpload / AbortMultipartUpload.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _dir(self, upload_id: str) -> Path:
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            raise HTTPException(404, detail="Upload not found")
+        return self.root / upload_id
+
+    def part_path(self, upload_id: str, part: int, sha256_hex: str) -> Path:
+        # Named by content, so a stored part file never changes under a record
+        # that points at it, whatever other attempts at the same part do.
+        return self._dir(upload_id) / f"part-{part:05d}-{sha256_hex}"
+
+    async def write_part(self, upload_id: str, part: int, chunks, limit: int, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Streams chunks to a temp file, then renames it to its content-addressed
+        part path. A bad `expected_sha256` is rejected before the rename, so the
+        part already stored is left as it was.
+        """
+        folder = self._dir(upload_id)
+        await run_in_threadpool(folder.mkdir, parents=True, exist_ok=True)
+        tmp = folder / f".part-{part:05d}.{uuid.uuid4().hex}.tmp"
+        digest, size = hashlib.sha256(), 0
+        f = await run_in_threadpool(open, tmp, "wb")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(413, detail=f"Part larger than {limit} bytes")
+                digest.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+            await run_in_threadpool(f.close)
+            if expected_sha256 and expected_sha256.strip().lower() != digest.hexdigest():
+                raise HTTPException(400, detail="Checksum mismatch")
+            os.replace(tmp, self.part_path(upload_id, part, digest.hexdigest()))
+        except BaseException:
+            f.close()
+            tmp.unlink(missing_ok=True)
+            raise
+        return {"size": size, "sha256": digest.hexdigest()}
+
+    def assemble(self, upload_id: str, parts: List[tuple]) -> tuple:
+        """
+        Concatenates (partNumber, sha256) parts into one file (copy_file_range,
+        so the data stays in the kernel) and hashes it.
+        """
+        out_path = self._dir(upload_id) / "assembled"
+        with open(out_path, "wb") as out:
+            for n, sha in parts:
+                with open(self.part_path(upload_id, n, sha), "rb") as src:
+                    remaining = os.fstat(src.fileno()).st_size
+                    try:
+                        while remaining > 0:
+                            copied = os.copy_file_range(src.fileno(), out.fileno(), remaining)
+                            if copied == 0:
+                                break
+                            remaining -= copied
+                    except (AttributeError, OSError):
+                        src.seek(os.fstat(src.fileno()).st_size - remaining)
+                        shutil.copyfileobj(src, out, 1024 * 1024)
+        digest = hashlib.sha256()
+        with open(out_path, "rb") as f:
+            while block := f.read(1024 * 1024):
+                digest.update(block)
+        return out_path, digest.hexdigest()
+
+    def abort(self, upload_id: str):
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    def orphans(self, older_than: float) -> List[str]:
+        """Upload directories untouched since `older_than` (epoch seconds)."""
+        if not self.root.is_dir():
+            return []
+        return [p.name for p in self.root.iterdir() if p.is_dir() and p.stat().st_mtime < older_than]
+
+
+def _make_upload_backend():
+    backend = os.environ.get("UPLOAD_BACKEND", "local").lower()
+    if backend != "local":
+        raise RuntimeError(f"Unsupported UPLOAD_BACKEND: {backend}")
+    return LocalUploadBackend(UPLOAD_DIR)
+
+
+upload_backend = _make_upload_backend()
+
+
+async def _upload_doc(upload_id: str) -> Dict[str, Any]:
+    doc = await require_db().uploads.find_one({"_id": upload_id})
+    if not doc:
+        raise HTTPException(404, detail="Upload not found")
+    return doc
+
+
+def _upload_public(doc: Dict[str, Any]) -> Dict[str, Any]:
+    parts = sorted(({"partNumber": int(n), **p} for n, p in (doc.get("parts") or {}).items()), key=lambda p: p["partNumber"])
+    return {
+        "uploadId": doc["_id"], "status": doc["status"], "filename": doc.get("filename"), "size": doc["size"],
+        "partSize": doc["partSize"], "parts": parts, "fileUrl": doc.get("fileUrl"),
+    }
+
+
+async def _request_chunks(request: Request):
+    """Body chunks of a raw (application/octet-stream) or multipart `file` part upload."""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        file = form.get("file")
+        if file is None or isinstance(file, str):
+            raise HTTPException(400, detail="Missing file field")
+        while chunk := await file.read(1024 * 1024):
+            yield chunk
+        return
+    async for chunk in request.stream():
+        yield chunk
+
+
+@api_router.post("/uploads/init")
+async def uploads_init(filename: str = Form(...), size: int = Form(...), type: str = Form(...), user: User = Depends(require_admin)):
+    _db = require_db()
+    if type not in MEDIA_EXTENSIONS:
+        raise HTTPException(415, detail=f"Unsupported type {type}")
+    if size <= 0 or size > UPLOAD_MAX_MB * 1024 * 1024:
+        raise HTTPException(413, detail=f"Uploads are limited to {UPLOAD_MAX_MB:g} MB")
+    now = datetime.utcnow()
+    doc = {
+        "_id": uuid.uuid4().hex, "filename": filename, "size": size, "type": type,
+        "partSize": UPLOAD_PART_SIZE, "status": "open", "parts": {}, "createdAt": now, "updatedAt": now,
+    }
+    await _db.uploads.insert_one(doc)
+    return {"uploadId": doc["_id"], "partSize": UPLOAD_PART_SIZE, "parts": -(-size // UPLOAD_PART_SIZE)}
+
+
+@api_router.get("/uploads/{upload_id}")
+async def uploads_status(upload_id: str, user: User = Depends(require_admin)):
+    """Parts received so far, so a client can resume after a disconnect by sending only the rest."""
+    return _upload_public(await _upload_doc(upload_id))
+
+
+@api_router.put("/uploads/{upload_id}/part")
+async def uploads_part(upload_id: str, partNumber: int, request: Request, user: User = Depends(require_admin)):
+    """
+    Stores one part from the raw body (or a multipart `file` field). Re-sending
+    a part replaces it. An X-Content-SHA256 header, when sent, is checked
+    against the received bytes. The returned etag is the part's sha256.
+    """
+    _db = require_db()
+    doc = await _upload_doc(upload_id)
+    if doc["status"] != "open":
+        raise HTTPException(409, detail=f"Upload is {doc['status']}")
+    total_parts = -(-doc["size"] // doc["partSize"])
+    if not 1 <= partNumber <= total_parts:
+        raise HTTPException(400, detail=f"partNumber must be 1..{total_parts}")
+
+    info = await upload_backend.write_part(
+        upload_id, partNumber, _request_chunks(request), doc["partSize"], request.headers.get("x-content-sha256"),
+    )
+    # Conditional, so a part that lands after complete started is refused
+    # rather than recorded against an upload that is already being assembled.
+    res = await _db.uploads.update_one(
+        {"_id": upload_id, "status": "open"},
+        {"$set": {f"parts.{partNumber}": info, "updatedAt": datetime.utcnow()}},
+    )
+    if not res.matched_count:
+        raise HTTPException(409, detail="Upload is no longer open")
+    return {"partNumber": partNumber, "etag": info["sha256"], "size": info["size"]}
+
+
+@api_router.post("/uploads/{upload_id}/complete")
+async def uploads_complete(upload_id: str, parts: Optional[List[Dict[str, Any]]] = None, artworkId: Optional[str] = None, user: User = Depends(require_admin)):
+    """
+    Assembles the parts into a media-store file and returns its URL. `parts`
+    ([{partNumber, etag}]) is optional and, when given, must match what was
+    received. With ?artworkId= the URL is also written to that artwork's imageUrl.
+    """
+    _db = require_db()
+    doc = await _db.uploads.find_one_and_update(
+        {"_id": upload_id, "status": "open"},
+        {"$set": {"status": "assembling", "updatedAt": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not doc:
+        doc = await _upload_doc(upload_id)
+        if doc["status"] != "complete":
+            raise HTTPException(409, detail=f"Upload is {doc['status']}")
+    else:
+        try:
+            doc = await _assemble_upload(doc, parts)
+        except BaseException:
+            await _db.uploads.update_one({"_id": upload_id, "status": "assembling"}, {"$set": {"status": "open"}})
+            raise
+
+    result = {"fileUrl": doc["fileUrl"], "key": doc["key"], "size": doc["size"], "sha256": doc["sha256"]}
+    if artworkId:
+        art = await _db.artworks.find_one_and_update(
+            id_filter(artworkId), {"$set": {"imageUrl": doc["fileUrl"], "updatedAt": datetime.utcnow()}},
+        )
+        if not art:
+            raise HTTPException(404, detail="Artwork not found")
+        await catalog_revision.bump()
+        schedule_derivatives(doc["fileUrl"])
+        result["artworkId"] = artworkId
+    return result
+
+
+async def _assemble_upload(doc: Dict[str, Any], claimed: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    upload_id = doc["_id"]
+    received = {int(n): p for n, p in (doc.get("parts") or {}).items()}
+    numbers = list(range(1, -(-doc["size"] // doc["partSize"]) + 1))
+    missing = [n for n in numbers if n not in received]
+    if missing:
+        raise HTTPException(400, detail=f"Missing parts: {missing[:20]}")
+    for c in claimed or []:
+        n = int(c.get("partNumber", 0))
+        if n not in received or (c.get("etag") and c["etag"] != received[n]["sha256"]):
+            raise HTTPException(400, detail=f"Part {n} does not match the stored part")
+    if sum(received[n]["size"] for n in numbers) != doc["size"]:
+        raise HTTPException(400, detail="Parts do not add up to the declared size")
+
+    parts = [(n, received[n]["sha256"]) for n in numbers]
+    lost = [n for n, sha in parts if not await run_in_threadpool(upload_backend.part_path(upload_id, n, sha).is_file)]
+    if lost:
+        await require_db().uploads.update_one({"_id": upload_id}, {"$unset": {f"parts.{n}": "" for n in lost}})
+        raise HTTPException(409, detail=f"Parts {lost[:20]} are missing from storage, re-upload them")
+    try:
+        path, sha = await run_in_threadpool(upload_backend.assemble, upload_id, parts)
+    except FileNotFoundError:
+        raise HTTPException(409, detail="A part went missing while assembling, check the upload and re-send it")
+    key = await media_store.put_file(path, sha, doc["type"])
+    await run_in_threadpool(upload_backend.abort, upload_id)
+    done = {"status": "complete", "key": key, "sha256": sha, "fileUrl": media_url(key), "updatedAt": datetime.utcnow()}
+    await require_db().uploads.update_one({"_id": upload_id}, {"$set": done, "$unset": {"parts": ""}})
+    return {**doc, **done}
+
+
+@api_router.delete("/uploads/{upload_id}")
+async def uploads_abort(upload_id: str, user: User = Depends(require_admin)):
+    _db = require_db()
+    doc = await _upload_doc(upload_id)
+    if doc["status"] == "assembling":
+        raise HTTPException(409, detail="Upload is assembling")
+    await run_in_threadpool(upload_backend.abort, upload_id)
+    await _db.uploads.delete_one({"_id": upload_id})
     return {"ok": True}
 
 
-@api_router.post("/auth/logout")
-def auth_logout(request: Request, response: Response):
-    origin = request.headers.get("origin", "")
-    _clear_session_cookie(response, origin)
-    return {"ok": True}
+async def gc_uploads():
+    """Drops uploads idle for UPLOAD_TTL_S (parts and state) and part directories with no state."""
+    while True:
+        try:
+            _db = require_db()
+            cutoff = datetime.utcnow() - timedelta(seconds=UPLOAD_TTL_S)
+            async for doc in _db.uploads.find({"updatedAt": {"$lt": cutoff}}, {"_id": 1, "status": 1}):
+                await run_in_threadpool(upload_backend.abort, doc["_id"])
+                await _db.uploads.delete_one({"_id": doc["_id"], "updatedAt": {"$lt": cutoff}})
+            for upload_id in await run_in_threadpool(upload_backend.orphans, time.time() - UPLOAD_TTL_S):
+                if not await _db.uploads.find_one({"_id": upload_id}, {"_id": 1}):
+                    await run_in_threadpool(upload_backend.abort, upload_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Upload GC failed")
+        await asyncio.sleep(UPLOAD_GC_INTERVAL_S)
+
+
+# ---------- Checkout (Stripe) ----------
+STRIPE_CONCURRENCY = int(os.environ.get("STRIPE_CONCURRENCY", "4"))
+STRIPE_TIMEOUT_S = float(os.environ.get("STRIPE_TIMEOUT_S", "20"))
+STRIPE_QUEUE_TIMEOUT_S = float(os.environ.get("STRIPE_QUEUE_TIMEOUT_S", "10"))
+STRIPE_API_BASE = os.environ.get("STRIPE_API_BASE")  # e.g. a local fake for benchmarks
+# Stripe only accepts a session expires_at 30 minutes to 24 hours out. The
+# session is given the hold minus CHECKOUT_HOLD_MARGIN_S, so a buyer paying in
+# the session's last second still finds the artwork reserved; the extra minute
+# covers the time between reserving and creating the session.
+CHECKOUT_HOLD_MARGIN_S = max(float(os.environ.get("CHECKOUT_HOLD_MARGIN_S", "300")), 60.0)
+CHECKOUT_HOLD_S = min(
+    max(float(os.environ.get("CHECKOUT_HOLD_S", "2160")), 1860 + CHECKOUT_HOLD_MARGIN_S),
+    86400 + CHECKOUT_HOLD_MARGIN_S,
+)
+CHECKOUT_RELEASE_INTERVAL_S = float(os.environ.get("CHECKOUT_RELEASE_INTERVAL_S", "60"))
+STRIPE_SEMAPHORE = asyncio.Semaphore(STRIPE_CONCURRENCY)
+stripe_executor = ThreadPoolExecutor(max_workers=STRIPE_CONCURRENCY, thread_name_prefix="stripe")
+
+
 
-@api_router.get("/auth/me")
-def auth_me(request: Request):
-    token = request.cookies.get("session")
-    data = _verify_token(token) if token else None
-    return {"isAdmin": bool(data and data.get("role") == "admin")}
+@lru_cache(maxsize=None)
+def stripe_sdk():
+    """The configured stripe module, imported on the first checkout or webhook; None when not installed."""
+    stripe = lazy_module("stripe")
+    if stripe is None:
+        return None
+    stripe.api_key = STRIPE_SECRET_KEY
+    if STRIPE_API_BASE:
+        stripe.api_base = STRIPE_API_BASE
+    # The requests-based client keeps one session per thread, so each executor
+    # thread reuses its connection to Stripe instead of handshaking per call.
+    stripe.default_http_client = stripe.new_default_http_client(timeout=STRIPE_TIMEOUT_S)
+    stripe.max_network_retries = 2  # safe: every create carries an idempotency key
+    return stripe
 
-@api_router.post("/auth/bootstrap", response_model=User)
-async def bootstrap_admin(email: EmailStr = Form(...), password: str = Form(...), secret: Optional[str] = Form(None)):
-    _db = require_db()
-    count = await _db.users.count_documents({})
-    if count > 0:
-        raise HTTPException(403, detail="Bootstrap not allowed after users exist")
-    if secret and secret != os.environ.get('BOOTSTRAP_SECRET'):
-        raise HTTPException(403, detail="Invalid bootstrap secret")
-    doc = {
-        "email": email,
-        "name": "Admin",
-        "role": "admin",
-        "hashed_password": hash_password(password),
-        "created_at": datetime.utcnow(),
-    }
-    res = await _db.users.insert_one(doc)
-    return User(id=str(res.inserted_id), email=email, name="Admin", role="admin")
+checkout_sessions = LRUCache(maxsize=2048)
+checkout_flights = SingleFlight()
 
-# ---------- Category Routes ----------
-@api_router.get("/categories", response_model=List[Category])
-async def list_categories():
-    _db = require_db()
-    rows = await _db.categories.find().to_list(100)
-    items = []
-    for r in rows:
-        r['id'] = str(r.get('_id'))
-        items.append(Category(**r))
-    return items
 
-@api_router.post("/categories", response_model=Category)
-async def create_category(cat: Category, user: User = Depends(require_admin)):
-    _db = require_db()
-    doc = {
-        "key": cat.key,
-        "label_en": cat.label_en,
-        "label_de": cat.label_de,
-        "created_at": datetime.utcnow(),
-    }
-    res = await _db.categories.insert_one(doc)
-    cat_dict = cat.dict()
-    cat_dict['id'] = str(res.inserted_id)
-    return Category(**cat_dict)
+def stripe_configured() -> bool:
+    key = STRIPE_SECRET_KEY or ''
+    return bool(key) and 'placeholder' not in key.lower() and stripe_sdk() is not None
 
-@api_router.delete("/categories/{cat_id}")
-async def delete_category(cat_id: str, user: User = Depends(require_admin)):
-    _db = require_db()
-    deleted = 0
+
+async def _stripe_call(fn, *args, **kwargs):
     try:
-        if ObjectId.is_valid(cat_id):
-            res = await _db.categories.delete_one({"_id": ObjectId(cat_id)})
-            deleted += res.deleted_count
-    except Exception:
-        pass
-    if deleted == 0:
-        res = await _db.categories.delete_one({"id": cat_id})
-        deleted += res.deleted_count
-    if deleted == 0:
-        raise HTTPException(404, detail="Category not found")
-    return {"ok": True}
+        await asyncio.wait_for(STRIPE_SEMAPHORE.acquire(), timeout=STRIPE_QUEUE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(503, detail="Checkout is busy, try again shortly.", headers={"Retry-After": "5"})
+    try:
+        with outbound.track("stripe"):
+            return await asyncio.get_running_loop().run_in_executor(stripe_executor, partial(fn, *args, **kwargs))
+    finally:
+        STRIPE_SEMAPHORE.release()
 
-# ---------- Artwork Routes ----------
-@api_router.post("/artworks", response_model=Artwork)
-async def create_artwork(body: ArtworkCreate, user: User = Depends(require_admin)):
+
+def checkout_key(art_id: str, buyer: str) -> str:
+    return hashlib.sha256(f"{art_id}\n{buyer}".encode("utf-8")).hexdigest()[:32]
+
+
+async def reserve_artwork(art_id: str, key: str) -> tuple:
+    """
+    Moves the artwork to `reserved` for this checkout key with one conditional
+    update and returns (artwork, created). Available artworks and lapsed holds
+    can be taken; a live hold under the same key is returned as is (created
+    False) so a retry reuses its expiry (and Stripe idempotency key). Anything
+    else is 404/400/409.
+    """
     _db = require_db()
     now = datetime.utcnow()
-    doc = {**body.dict(), "createdAt": now, "updatedAt": now}
-    res = await _db.artworks.insert_one(doc)
-    return Artwork(id=str(res.inserted_id), **doc)
+    projection = {"title": 1, "priceCents": 1, "imageUrl": 1, "status": 1, "reservation": 1}
+    takeable = {"$or": [
+        {"status": {"$in": ["available", None]}},
+        {"status": "reserved", "reservation.expiresAt": {"$lte": now}},
+    ]}
+    art = await _db.artworks.find_one_and_update(
+        {"$and": [id_filter(art_id), takeable]},
+        {"$set": {"status": "reserved", "reservation": {"key": key, "expiresAt": now + timedelta(seconds=CHECKOUT_HOLD_S)}}},
+        projection=projection, return_document=ReturnDocument.AFTER,
+    )
+    if art:
+        await catalog_revision.bump()
+        return art, True
+    art = await _db.artworks.find_one(id_filter(art_id), projection)
+    if not art:
+        raise HTTPException(404, detail="Artwork not found")
+    if art.get('status') == 'sold':
+        raise HTTPException(400, detail="Artwork already sold")
+    if art.get('status') == 'reserved' and (art.get('reservation') or {}).get('key') == key:
+        return art, False
+    raise HTTPException(409, detail="Artwork is reserved by another buyer", headers={"Retry-After": str(int(CHECKOUT_HOLD_S))})
 
-@api_router.get("/artworks", response_model=List[Artwork])
-async def list_artworks(query: Optional[str] = None, category: Optional[str] = None, year: Optional[int] = None, status_f: Optional[str] = None, sort: Optional[str] = "priceAsc"):
-    _db = require_db()
-    q: Dict[str, Any] = {}
-    if query:
-        q["title"] = {"$regex": query, "$options": "i"}
-    if category:
-        q["category"] = category
-    if year is not None:
-        q["year"] = year
-    if status_f:
-        q["status"] = status_f
-    cursor = _db.artworks.find(q)
-    if sort == "priceDesc":
-        cursor = cursor.sort("priceCents", -1)
-    elif sort == "categoryAZ":
-        cursor = cursor.sort("category", 1)
-    elif sort == "nameAZ":
-        cursor = cursor.sort("title", 1)
-    else:
-        cursor = cursor.sort("priceCents", 1)
-    rows = await cursor.to_list(500)
-    items: List[Artwork] = []
-    for r in rows:
-        r['id'] = str(r.get('_id'))
-        items.append(Artwork(**r))
-    return items
 
-@api_router.get("/artworks/{art_id}", response_model=Artwork)
-async def get_artwork(art_id: str):
+async def release_artwork(art_id: str, key: Optional[str] = None) -> bool:
+    """Returns a reserved artwork to `available`; with `key`, only if that checkout still holds it."""
     _db = require_db()
-    r = None
-    try:
-        if ObjectId.is_valid(art_id):
-            r = await _db.artworks.find_one({"_id": ObjectId(art_id)})
-    except Exception:
-        r = None
-    if not r:
-        r = await _db.artworks.find_one({"id": art_id})
-    if not r:
-        raise HTTPException(404, detail="Artwork not found")
-    r['id'] = str(r.get('_id')) if r.get('_id') else r.get('id')
-    return Artwork(**r)
+    cond: Dict[str, Any] = {"status": "reserved"}
+    if key:
+        cond["reservation.key"] = key
+    res = await _db.artworks.update_one(
+        {"$and": [id_filter(art_id), cond]},
+        {"$set": {"status": "available", "updatedAt": datetime.utcnow()}, "$unset": {"reservation": ""}},
+    )
+    if res.modified_count:
+        await catalog_revision.bump()
+    return bool(res.modified_count)
 
-@api_router.put("/artworks/{art_id}", response_model=Artwork)
-async def update_artwork(art_id: str, body: ArtworkUpdate, user: User = Depends(require_admin)):
+
+async def release_expired_reservations() -> int:
     _db = require_db()
-    upd = {k: v for k, v in body.dict().items() if v is not None}
-    upd['updatedAt'] = datetime.utcnow()
+    res = await _db.artworks.update_many(
+        {"status": "reserved", "reservation.expiresAt": {"$lte": datetime.utcnow()}},
+        {"$set": {"status": "available", "updatedAt": datetime.utcnow()}, "$unset": {"reservation": ""}},
+    )
+    if res.modified_count:
+        await catalog_revision.bump()
+    return res.modified_count
 
-    updated = 0
-    try:
-        if ObjectId.is_valid(art_id):
-            res = await _db.artworks.update_one({"_id": ObjectId(art_id)}, {"$set": upd})
-            updated += res.modified_count
-    except Exception:
-        pass
-    if updated == 0:
-        res = await _db.artworks.update_one({"id": art_id}, {"$set": upd})
-        updated += res.modified_count
 
-    if updated == 0:
-        raise HTTPException(404, detail="Artwork not found")
+async def run_reservation_release():
+    while True:
+        try:
+            released = await release_expired_reservations()
+            if released:
+                logger.info("Released %d expired artwork reservations", released)
+        except Exception:
+            logger.exception("Releasing expired reservations failed")
+        await asyncio.sleep(CHECKOUT_RELEASE_INTERVAL_S)
 
-    r = None
-    try:
-        if ObjectId.is_valid(art_id):
-            r = await _db.artworks.find_one({"_id": ObjectId(art_id)})
-    except Exception:
-        pass
-    if not r:
-        r = await _db.artworks.find_one({"id": art_id})
-    if not r:
-        raise HTTPException(404, detail="Artwork not found")
-    r['id'] = str(r.get('_id')) if r.get('_id') else r.get('id')
-    return Artwork(**r)
 
-@api_router.delete("/artworks/{art_id}")
-async def delete_artwork(art_id: str, user: User = Depends(require_admin)):
+def _stripe_session_params(art: Dict[str, Any], buyer_email: Optional[str], expires_at: datetime, key: str) -> Dict[str, Any]:
+    frontend = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
+    art_id = art.get('id') or str(art.get('_id'))
+    return dict(
+        mode='payment',
+        payment_method_types=['card', 'sepa_debit'],
+        line_items=[{
+            'price_data': {
+                'currency': 'eur',
+                'product_data': {
+                    'name': art.get('title', 'Artwork'),
+                    'images': [art.get('imageUrl')] if art.get('imageUrl') else []
+                },
+                'unit_amount': int(art.get('priceCents', 0))
+            },
+            'quantity': 1
+        }],
+        success_url=frontend + '/checkout-success?sid={CHECKOUT_SESSION_ID}',
+        cancel_url=frontend + '/checkout-cancel',
+        customer_email=buyer_email,
+        expires_at=int(expires_at.replace(tzinfo=timezone.utc).timestamp()),
+        client_reference_id=art_id,
+        metadata={'artworkId': art_id, 'checkoutKey': key},
+        # A new hold gets a new expiry and so a new key; retries within one hold replay the same session.
+        idempotency_key=f"checkout-{key}-{int(expires_at.replace(tzinfo=timezone.utc).timestamp())}",
+    )
+
+
+async def _open_checkout(art_id: str, buyer_email: Optional[str], key: str) -> Dict[str, Any]:
     _db = require_db()
-    deleted = 0
-    try:
-        if ObjectId.is_valid(art_id):
-            res = await _db.artworks.delete_one({"_id": ObjectId(art_id)})
-            deleted += res.deleted_count
-    except Exception:
-        pass
-    if deleted == 0:
-        res = await _db.artworks.delete_one({"id": art_id})
-        deleted += res.deleted_count
-    if deleted == 0:
-        raise HTTPException(404, detail="Artwork not found")
-    return {"ok": True}
+    now = datetime.utcnow()
+    existing = await _db.checkouts.find_one({"_id": key, "expiresAt": {"$gt": now}})
+    if existing:
+        return {"id": existing["sessionId"], "url": existing["url"], "expiresAt": existing["expiresAt"]}
 
-# ---------- Uploads (R2 stubs) ----------
-@api_router.post("/uploads/init")
-async def uploads_init(filename: str = Form(...), size: int = Form(...), type: str = Form(...), user: User = Depends(require_admin)):
-    if not os.environ.get('CLOUDFLARE_R2_ACCOUNT_ID'):
-        raise HTTPException(503, detail="Storage not configured (R2). Add CLOUDFLARE_R2_* envs.")
-    return {"uploadId": str(uuid.uuid4()), "partSize": int(os.environ.get('CHUNK_SIZE', '1048576'))}
+    art, created = await reserve_artwork(art_id, key)
 
-@api_router.put("/uploads/{upload_id}/part")
-async def uploads_part(upload_id: str, partNumber: int, file: UploadFile = File(...), user: User = Depends(require_admin)):
-    if not os.environ.get('CLOUDFLARE_R2_ACCOUNT_ID'):
-        raise HTTPException(503, detail="Storage not configured (R2)")
-    _ = await file.read()
-    return {"etag": f"etag-{partNumber}"}
+    async def undo_hold():
+        # Only a hold made by this call: an older one under the same key may be
+        # keeping the artwork for a payment that is still clearing.
+        if created:
+            await release_artwork(art_id, key)
+
+    if await payment_clearing(art_id, str(art["_id"])):
+        await undo_hold()
+        raise HTTPException(409, detail="A payment for this artwork is still clearing")
+    # Stripe accepts expires_at at most 24 hours out.
+    expires_at = min(
+        art["reservation"]["expiresAt"] - timedelta(seconds=CHECKOUT_HOLD_MARGIN_S),
+        now + timedelta(seconds=86400 - 60),
+    )
+    try:
+        session = await _stripe_call(stripe_sdk().checkout.Session.create, **_stripe_session_params(art, buyer_email, expires_at, key))
+    except HTTPException:
+        await undo_hold()
+        raise
+    except Exception as e:
+        logging.exception("Stripe session error")
+        await undo_hold()
+        raise HTTPException(502, detail=f"Stripe session error: {e}")
+
+    await _db.checkouts.replace_one({"_id": key}, {
+        "_id": key,
+        "artworkId": art.get('id') or str(art.get('_id')),
+        "buyerEmail": buyer_email,
+        "sessionId": session.id,
+        "url": session.url,
+        "expiresAt": expires_at,
+        "createdAt": now,
+    }, upsert=True)
+    return {"id": session.id, "url": session.url, "expiresAt": expires_at}
 
-@api_router.post("/uploads/{upload_id}/complete")
-async def uploads_complete(upload_id: str, parts: List[Dict[str, Any]], user: User = Depends(require_admin)):
-    if not os.environ.get('CLOUDFLARE_R2_ACCOUNT_ID'):
-        raise HTTPException(503, detail="Storage not configured (R2)")
-    return {"fileUrl": f"https://r2.mock/{upload_id}.jpg"}
 
-# ---------- Checkout (Stripe) ----------
 @api_router.post("/checkout/create-session")
-async def create_checkout_session(artworkId: str = Form(...), buyerEmail: Optional[EmailStr] = Form(None)):
+async def create_checkout_session(request: Request, artworkId: str = Form(...), buyerEmail: Optional[EmailStr] = Form(None)):
+    require_db()
+    if not await run_in_threadpool(stripe_configured):
+        raise HTTPException(503, detail="Stripe not configured. Add STRIPE_SECRET_KEY and STRIPE_PUBLISHABLE_KEY.")
+
+    buyer_email = str(buyerEmail).lower() if buyerEmail else None
+    buyer = buyer_email or "ip:" + (request.client.host if request.client else "unknown")
+    key = checkout_key(artworkId, buyer)
+    cached = checkout_sessions.get(key)
+    if cached and cached["expiresAt"] > datetime.utcnow():
+        return {"id": cached["id"], "url": cached["url"]}
+
+    out = await checkout_flights.do(key, lambda: _open_checkout(artworkId, buyer_email, key))
+    ttl = (out["expiresAt"] - datetime.utcnow()).total_seconds()
+    if ttl > 0:
+        checkout_sessions.set(key, out, ttl_s=ttl)
+    return {"id": out["id"], "url": out["url"]}
+
+# ---------- Stripe webhooks ----------
+# Events are stored (deduplicated by event id) and acknowledged at once; a
+# background worker applies them, so Stripe never waits on our writes and a
+# failed apply is retried here instead of by Stripe's redelivery.
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+STRIPE_EVENT_WORKERS = int(os.environ.get("STRIPE_EVENT_WORKERS", "2"))
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.environ.get("STRIPE_EVENT_MAX_ATTEMPTS", "10"))
+STRIPE_EVENT_BACKOFF_S = float(os.environ.get("STRIPE_EVENT_BACKOFF_S", "2"))
+STRIPE_EVENT_BACKOFF_MAX_S = float(os.environ.get("STRIPE_EVENT_BACKOFF_MAX_S", "600"))
+STRIPE_EVENT_LEASE_S = float(os.environ.get("STRIPE_EVENT_LEASE_S", "60"))
+STRIPE_EVENT_POLL_S = float(os.environ.get("STRIPE_EVENT_POLL_S", "10"))
+STRIPE_EVENT_RETENTION_S = float(os.environ.get("STRIPE_EVENT_RETENTION_S", str(30 * 86400)))
+# A delayed-notification payment (SEPA) keeps the artwork reserved while it clears.
+STRIPE_PENDING_HOLD_S = float(os.environ.get("STRIPE_PENDING_HOLD_S", str(14 * 86400)))
+STRIPE_EVENT_STATUSES = {"queued", "processing", "done", "dead"}
+STRIPE_HANDLED_EVENTS = {
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+    "checkout.session.async_payment_failed",
+    "checkout.session.expired",
+}
+
+stripe_seen_events = LRUCache(maxsize=4096)
+stripe_event_wakeup = asyncio.Event()
+stripe_event_workers: List[asyncio.Task] = []
+
+
+def _stripe_event_backoff(attempts: int) -> float:
+    return min(STRIPE_EVENT_BACKOFF_MAX_S, STRIPE_EVENT_BACKOFF_S * (2 ** (attempts - 1))) * random.uniform(0.5, 1.0)
+
+
+def _stripe_event_public(row: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: row.get(k) for k in ("type", "status", "attempts", "lastError", "receivedAt", "processedAt", "nextAttemptAt")}
+    for k, v in out.items():
+        if isinstance(v, datetime):
+            out[k] = v.isoformat() + "Z"
+    obj = row.get("object") or {}
+    return {"id": row["_id"], **out, "sessionId": obj.get("id"), "artworkId": (obj.get("metadata") or {}).get("artworkId")}
+
+
+async def ensure_stripe_event_indexes():
     _db = require_db()
-    art = None
+    await _db.stripe_events.create_index([("status", 1), ("nextAttemptAt", 1)])
+    await _db.stripe_events.create_index("expiresAt", expireAfterSeconds=0)
+    await _db.orders.create_index("artworkId")
+
+
+def _session_artwork(obj: Dict[str, Any]) -> Optional[str]:
+    return (obj.get("metadata") or {}).get("artworkId") or obj.get("client_reference_id")
+
+
+async def _forget_checkout(obj: Dict[str, Any]):
+    key = (obj.get("metadata") or {}).get("checkoutKey")
+    if key:
+        checkout_sessions.pop(key, None)
+        await require_db().checkouts.delete_one({"_id": key, "sessionId": obj.get("id")})
+
+
+ORDER_FINAL = ["paid", "failed"]
+
+
+async def payment_clearing(*art_ids: str) -> bool:
+    """Whether a delayed (e.g. SEPA) payment for the artwork is still pending."""
+    return bool(await require_db().orders.find_one({"artworkId": {"$in": list(art_ids)}, "status": "pending"}, {"_id": 1}))
+
+
+async def _record_order(event: Dict[str, Any], art_id: str, status_: str) -> bool:
+    """
+    Upserts the session's order. A settled order (paid/failed) is never moved
+    back to pending by a late `completed` event; returns False when it was kept.
+    """
+    obj = event["object"]
+    now = datetime.utcnow()
+    cond: Dict[str, Any] = {"_id": obj["id"]}
+    if status_ not in ORDER_FINAL:
+        cond["status"] = {"$nin": ORDER_FINAL}
+    update = {
+        "$set": {
+            "status": status_,
+            "paymentStatus": obj.get("payment_status"),
+            "paymentIntent": obj.get("payment_intent"),
+            "amountTotal": obj.get("amount_total"),
+            "currency": obj.get("currency"),
+            "customerEmail": (obj.get("customer_details") or {}).get("email") or obj.get("customer_email"),
+            "lastEventId": event["_id"],
+            "updatedAt": now,
+        },
+        "$setOnInsert": {"artworkId": art_id, "createdAt": now},
+    }
     try:
-        if ObjectId.is_valid(artworkId):
-            art = await _db.artworks.find_one({"_id": ObjectId(artworkId)})
-    except Exception:
-        pass
-    if not art:
-        art = await _db.artworks.find_one({"id": artworkId})
-    if not art:
-        raise HTTPException(404, detail="Artwork not found")
-    if art.get('status') == 'sold':
-        raise HTTPException(400, detail="Artwork already sold")
+        await require_db().orders.update_one(cond, update, upsert=True)
+    except DuplicateKeyError:  # the order exists and is already settled
+        return False
+    return True
 
-    if (stripe is None) or (not getattr(stripe, 'api_key', None)) or ('placeholder' in str(getattr(stripe, 'api_key', '')).lower()):
-        raise HTTPException(503, detail="Stripe not configured. Add STRIPE_SECRET_KEY and STRIPE_PUBLISHABLE_KEY.")
 
+async def _mark_sold(art_id: str, session_id: str):
+    now = datetime.utcnow()
+    res = await require_db().artworks.update_one(
+        {"$and": [id_filter(art_id), {"status": {"$ne": "sold"}}]},
+        {"$set": {"status": "sold", "soldAt": now, "soldSessionId": session_id, "updatedAt": now}, "$unset": {"reservation": ""}},
+    )
+    if res.modified_count:
+        await catalog_revision.bump()
+
+
+async def _hold_pending(art_id: str, key: Optional[str]):
+    """Extends the checkout's hold while a delayed payment clears; a no-op if the hold has moved on."""
+    cond: Dict[str, Any] = {"status": "reserved"}
+    if key:
+        cond["reservation.key"] = key
+    await require_db().artworks.update_one(
+        {"$and": [id_filter(art_id), cond]},
+        {"$set": {"reservation.expiresAt": datetime.utcnow() + timedelta(seconds=STRIPE_PENDING_HOLD_S)}},
+    )
+
+
+async def apply_stripe_event(event: Dict[str, Any]):
+    """Applies one stored event. Every step is idempotent, so a retry after a partial apply is safe."""
+    obj, etype = event["object"], event["type"]
+    art_id = _session_artwork(obj)
+    if not art_id:
+        return
+    key = (obj.get("metadata") or {}).get("checkoutKey")
+    paid = obj.get("payment_status") in ("paid", "no_payment_required")
+    if etype in ("checkout.session.completed", "checkout.session.async_payment_succeeded"):
+        if paid or etype == "checkout.session.async_payment_succeeded":
+            await _record_order(event, art_id, "paid")
+            await _mark_sold(art_id, obj["id"])
+        elif await _record_order(event, art_id, "pending"):
+            await _hold_pending(art_id, key)
+        await _forget_checkout(obj)
+    elif etype == "checkout.session.async_payment_failed":
+        await _record_order(event, art_id, "failed")
+        await release_artwork(art_id, key)
+        await _forget_checkout(obj)
+    elif etype == "checkout.session.expired":
+        # A late expiry of an earlier session under the same key must not free
+        # an artwork whose payment from a later session is still clearing.
+        if not await payment_clearing(art_id):
+            await release_artwork(art_id, key)
+        await _forget_checkout(obj)
+
+
+async def _claim_stripe_event() -> Optional[Dict[str, Any]]:
+    now = datetime.utcnow()
+    return await require_db().stripe_events.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "nextAttemptAt": {"$lte": now}},
+            {"status": "processing", "leaseUntil": {"$lt": now}},
+        ]},
+        {"$set": {"status": "processing", "leaseUntil": now + timedelta(seconds=STRIPE_EVENT_LEASE_S)}},
+        sort=[("nextAttemptAt", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _process_stripe_event(event: Dict[str, Any]):
+    coll = require_db().stripe_events
+    attempts = int(event.get("attempts") or 0) + 1
     try:
-        session = stripe.checkout.Session.create(
-            mode='payment',
-            payment_method_types=['card', 'sepa_debit'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'eur',
-                    'product_data': {
-                        'name': art.get('title', 'Artwork'),
-                        'images': [art.get('imageUrl')] if art.get('imageUrl') else []
-                    },
-                    'unit_amount': int(art.get('priceCents', 0))
-                },
-                'quantity': 1
-            }],
-            success_url=os.environ.get('FRONTEND_URL', 'http://localhost:3000') + '/checkout-success?sid={CHECKOUT_SESSION_ID}',
-            cancel_url=os.environ.get('FRONTEND_URL', 'http://localhost:3000') + '/checkout-cancel',
-            customer_email=str(buyerEmail) if buyerEmail else None,
-        )
-        return {"id": session.id, "url": session.url}
+        await apply_stripe_event(event)
     except Exception as e:
-        logging.exception("Stripe session error")
-        raise HTTPException(500, detail=str(e))
+        error = f"{e.__class__.__name__}: {e}"
+        if attempts >= STRIPE_EVENT_MAX_ATTEMPTS:
+            logger.error("Stripe event %s dead-lettered after %s attempts: %s", event["_id"], attempts, error)
+            fields = {"status": "dead"}
+        else:
+            logger.warning("Stripe event %s failed (attempt %s): %s", event["_id"], attempts, error)
+            fields = {"status": "queued", "nextAttemptAt": datetime.utcnow() + timedelta(seconds=_stripe_event_backoff(attempts))}
+        await coll.update_one({"_id": event["_id"]}, {"$set": {**fields, "attempts": attempts, "lastError": error, "leaseUntil": None}})
+        return
+    now = datetime.utcnow()
+    await coll.update_one({"_id": event["_id"]}, {"$set": {
+        "status": "done", "attempts": attempts, "lastError": None, "leaseUntil": None, "processedAt": now,
+        "expiresAt": now + timedelta(seconds=STRIPE_EVENT_RETENTION_S),
+    }})
+
+
+async def _stripe_event_worker():
+    while True:
+        try:
+            event = await _claim_stripe_event()
+        except Exception:
+            logger.exception("Stripe event claim failed")
+            event = None
+        if event is None:
+            stripe_event_wakeup.clear()
+            try:
+                await asyncio.wait_for(stripe_event_wakeup.wait(), timeout=STRIPE_EVENT_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _process_stripe_event(event)
+        except Exception:
+            logger.exception("Stripe event processing crashed for %s", event.get("_id"))
+
+
+async def start_stripe_event_workers():
+    try:
+        await ensure_stripe_event_indexes()
+    except Exception:
+        logger.exception("Creating Stripe event indexes failed")
+    for _ in range(STRIPE_EVENT_WORKERS):
+        stripe_event_workers.append(asyncio.create_task(_stripe_event_worker()))
+
+
+async def stop_stripe_event_workers():
+    for t in stripe_event_workers:
+        t.cancel()
+    await asyncio.gather(*stripe_event_workers, return_exceptions=True)
+    stripe_event_workers.clear()
+
 
 @api_router.post("/checkout/webhook")
 async def stripe_webhook(request: Request):
-    if (stripe is None) or (not os.environ.get('STRIPE_WEBHOOK_SECRET')):
+    # The first call imports the SDK, which takes long enough to stall the loop.
+    stripe = await run_in_threadpool(stripe_sdk) if STRIPE_WEBHOOK_SECRET else None
+    if stripe is None:
         raise HTTPException(503, detail="Stripe webhook not configured. Add STRIPE_WEBHOOK_SECRET.")
+    _db = require_db()
     payload = await request.body()
-    sig_header = request.headers.get('stripe-signature')
     try:
-        event = stripe.Webhook.construct_event(payload, sig_header, os.environ['STRIPE_WEBHOOK_SECRET'])
+        stripe.WebhookSignature.verify_header(payload, request.headers.get('stripe-signature'), STRIPE_WEBHOOK_SECRET, tolerance=300)
+        event = json.loads(payload)
     except Exception as e:
         raise HTTPException(400, detail=f"Webhook error: {e}")
-    if event['type'] == 'checkout.session.completed':
-        pass
+
+    event_id, etype = event.get("id"), event.get("type")
+    if etype not in STRIPE_HANDLED_EVENTS or not event_id:
+        return {"received": True}
+    if stripe_seen_events.get(event_id):
+        return {"received": True, "duplicate": True}
+    now = datetime.utcnow()
+    try:
+        await _db.stripe_events.insert_one({
+            "_id": event_id, "type": etype, "object": (event.get("data") or {}).get("object") or {},
+            "created": event.get("created"), "livemode": event.get("livemode"),
+            "status": "queued", "attempts": 0, "lastError": None,
+            "receivedAt": now, "nextAttemptAt": now, "leaseUntil": None, "processedAt": None,
+        })
+    except DuplicateKeyError:
+        stripe_seen_events.set(event_id, True)
+        return {"received": True, "duplicate": True}
+    stripe_seen_events.set(event_id, True)
+    stripe_event_wakeup.set()
     return {"received": True}
 
+@api_router.get("/checkout/events")
+async def stripe_events_list(status_f: Optional[str] = None, limit: int = Query(50, ge=1, le=500), user: User = Depends(require_admin)):
+    if status_f and status_f not in STRIPE_EVENT_STATUSES:
+        raise HTTPException(400, detail=f"status_f must be one of {sorted(STRIPE_EVENT_STATUSES)}")
+    q = {"status": status_f} if status_f else {}
+    rows = await require_db().stripe_events.find(q).sort("receivedAt", -1).limit(limit).to_list(limit)
+    return {"items": [_stripe_event_public(r) for r in rows]}
+
+@api_router.post("/checkout/events/{event_id}/retry")
+async def stripe_event_retry(event_id: str, user: User = Depends(require_admin)):
+    now = datetime.utcnow()
+    res = await require_db().stripe_events.update_one(
+        {"_id": event_id, "status": "dead"},
+        {"$set": {"status": "queued", "attempts": 0, "nextAttemptAt": now}},
+    )
+    if not res.modified_count:
+        raise HTTPException(404, detail="No dead-lettered event with that id")
+    stripe_event_wakeup.set()
+    return {"ok": True}
+
 
 # ---------- AI Caption ----------
+def _caption_user_text(lang: str, title: str, year: Optional[int], medium: str, dimensions: str) -> str:
+    year_line = f"Year: {year}\n" if year else ""
+    medium_line = f"Medium: {medium}\n" if medium else ""
+    dims_line = f"Dimensions: {dimensions}\n" if dimensions else ""
+    return (
+        f"Language: {'German' if lang.startswith('de') else 'English'}.\n"
+        f"Return EXACTLY two lines:\n"
+        f"1) DESC: A short (1–2 sentences) natural description in the requested language, as if the artist is speaking. "
+        f"Include medium, year{' ('+str(year)+')' if year else ''}, and size ('{dimensions}' if present) naturally. "
+        f"No emojis. No hashtags in this line.\n"
+        f"2) TAGS: exactly 5 additional, relevant hashtags (no spaces inside tags), space-separated, no explanations.\n\n"
+        f"Title: {title}\n"
+        f"{year_line}"
+        f"{medium_line}"
+        f"{dims_line}"
+    )
+
+
+async def _cancel_on_disconnect(request: Request, coro, poll_s: float = 0.5):
+    """Runs coro but cancels it as soon as the HTTP client goes away."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_s)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def _caption_completion(system_prompt: str, content: List[Dict[str, Any]]) -> str:
+    try:
+        await asyncio.wait_for(CAPTION_SEMAPHORE.acquire(), timeout=CAPTION_QUEUE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(429, detail="AI caption service busy, try again shortly.")
+    try:
+        with outbound.track("openai"):
+            resp = await asyncio.wait_for(
+                openai_client().chat.completions.create(
+                    model=OPENAI_MODEL,
+                    temperature=0.7,
+                    max_tokens=250,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": content},
+                    ],
+                ),
+                timeout=CAPTION_TIMEOUT_S,
+            )
+        return (resp.choices[0].message.content or "").strip()
+    except asyncio.TimeoutError:
+        raise HTTPException(504, detail="AI error: caption request timed out")
+    finally:
+        CAPTION_SEMAPHORE.release()
+
+
+def _parse_caption_lines(raw: str) -> tuple:
+    desc_line, tags_line = "", ""
+    for line in raw.splitlines():
+        l = line.strip()
+        if l.lower().startswith("desc:"):
+            desc_line = l.split(":", 1)[1].strip()
+        elif l.lower().startswith("tags:"):
+            tags_line = l.split(":", 1)[1].strip()
+    return desc_line, tags_line
+
+
+# Model output (DESC/TAGS) keyed by everything that goes into the prompt.
+# Hashtag rotation is applied per request on top, so cached captions still vary.
+caption_cache = LRUCache(CAPTION_CACHE_SIZE, CAPTION_CACHE_TTL_S)
+caption_flight = SingleFlight()
+
+
+def _caption_cache_key(system_prompt: str, lang: str, body: AICaptionRequest, title: str, medium: str, dimensions: str) -> str:
+    h = hashlib.sha256()
+    for part in (OPENAI_MODEL, system_prompt, lang, (body.style or "").strip(), title, str(body.year or ""), medium, dimensions):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    if body.imageData:
+        h.update(b"data:" + body.imageData.encode("utf-8"))
+    elif body.imageUrl:
+        h.update(b"url:" + body.imageUrl.strip().encode("utf-8"))
+    return h.hexdigest()
+
+
+async def _caption_cache_load(key: str) -> Optional[tuple]:
+    if not CAPTION_CACHE_MONGO or db is None:
+        return None
+    try:
+        row = await db.caption_cache.find_one({"_id": key, "expiresAt": {"$gt": datetime.utcnow()}})
+    except Exception:
+        logging.exception("Caption cache read failed")
+        return None
+    return (row["desc"], row["tags"]) if row else None
+
+
+async def _caption_cache_store(key: str, lines: tuple):
+    if not CAPTION_CACHE_MONGO or db is None:
+        return
+    try:
+        await db.caption_cache.replace_one(
+            {"_id": key},
+            {"desc": lines[0], "tags": lines[1], "expiresAt": datetime.utcnow() + timedelta(seconds=CAPTION_CACHE_TTL_S)},
+            upsert=True,
+        )
+    except Exception:
+        logging.exception("Caption cache write failed")
+
+
+async def _caption_lines(key: str, system_prompt: str, build_content, force: bool) -> tuple:
+    if not force:
+        lines = caption_cache.get(key)
+        if lines is None:
+            lines = await _caption_cache_load(key)
+            if lines is not None:
+                caption_cache.set(key, lines)
+        if lines is not None:
+            return lines
+
+    async def fetch():
+        lines = _parse_caption_lines(await _caption_completion(system_prompt, await build_content()))
+        if lines[0]:
+            caption_cache.set(key, lines)
+            await _caption_cache_store(key, lines)
+        return lines
+
+    return await caption_flight.do(key, fetch)
+
+
 @api_router.post("/ai/caption", response_model=AICaptionResponse)
-async def ai_caption(body: AICaptionRequest):
+async def ai_caption(body: AICaptionRequest, request: Request):
     """
     Builds an IG caption using the model for the short description + 5 fresh hashtags,
     then combines them with:
@@ -677,7 +3415,8 @@ async def ai_caption(body: AICaptionRequest):
       - 10 random rotating tags
     => total 20 tags. All tags are de-duped case-insensitively.
     """
-    if openai_client is None:
+    # The first call imports the SDK, which takes long enough to stall the loop.
+    if await run_in_threadpool(openai_client) is None:
         raise HTTPException(503, detail="AI not configured. Set OPENAI_API_KEY.")
 
     system_prompt = (body.system or DEFAULT_CAPTION_SYSTEM).strip()
@@ -687,48 +3426,28 @@ async def ai_caption(body: AICaptionRequest):
     medium = (body.medium or "").strip()
     dimensions = (body.dimensions or "").strip()
 
-    user_text = (
-        f"Language: {'German' if lang.startswith('de') else 'English'}.\n"
-        f"Return EXACTLY two lines:\n"
-        f"1) DESC: A short (1–2 sentences) natural description in the requested language, as if the artist is speaking. "
-        f"Include medium, year{' ('+str(year)+')' if year else ''}, and size ('{dimensions}' if present) naturally. "
-        f"No emojis. No hashtags in this line.\n"
-        f"2) TAGS: exactly 5 additional, relevant hashtags (no spaces inside tags), space-separated, no explanations.\n\n"
-        f"Title: {title}\n"
-        f"{'Year: '+str(year)+'\\n' if year else ''}"
-        f"{'Medium: '+medium+'\\n' if medium else ''}"
-        f"{'Dimensions: '+dimensions+'\\n' if dimensions else ''}"
-    )
+    user_text = _caption_user_text(lang, title, year, medium, dimensions)
 
-    content = [{"type": "text", "text": user_text}]
-    if body.imageData:
-        content.append({"type": "image_url", "image_url": {"url": body.imageData}})
-    elif body.imageUrl:
-        content.append({"type": "image_url", "image_url": {"url": body.imageUrl}})
+    async def build_content():
+        content = [{"type": "text", "text": user_text}]
+        if body.imageData:
+            mime, b64 = decode_image_data(body.imageData)
+            data, mime = await normalize_image(_b64decode_image(b64), mime, "caption")
+            image_url = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+            content.append({"type": "image_url", "image_url": {"url": image_url}})
+        elif body.imageUrl:
+            content.append({"type": "image_url", "image_url": {"url": body.imageUrl}})
+        return content
 
-    try:
-        resp = openai_client.chat.completions.create(
-            model=OPENAI_MODEL,
-            temperature=0.7,
-            max_tokens=250,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": content},
-            ],
-        )
-        raw = (resp.choices[0].message.content or "").strip()
+    key = _caption_cache_key(system_prompt, lang, body, title, medium, dimensions)
+    try:
+        desc_line, tags_line = await _cancel_on_disconnect(request, _caption_lines(key, system_prompt, build_content, bool(body.force)))
+    except HTTPException:
+        raise
     except Exception as e:
         logging.exception("AI caption error")
         raise HTTPException(500, detail=f"AI error: {e}")
 
-    desc_line, tags_line = "", ""
-    for line in raw.splitlines():
-        l = line.strip()
-        if l.lower().startswith("desc:"):
-            desc_line = l.split(":", 1)[1].strip()
-        elif l.lower().startswith("tags:"):
-            tags_line = l.split(":", 1)[1].strip()
-
     rotating = random.sample(ROTATING_HASHTAGS, k=min(10, len(ROTATING_HASHTAGS)))
     base_tags = FIXED_HASHTAGS + rotating
 
@@ -747,63 +3466,62 @@ async def ai_caption(body: AICaptionRequest):
 
 
 
-@api_router.post("/ai/stage")
-async def ai_stage(body: StageIn):
-    """
-    Uses Gemini 2.5 Flash Image (aka Nano Banana) to stage the provided painting
-    in a scene (easel/wall/etc.). Returns a data: URL of the composed image.
-    """
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
-        raise HTTPException(503, detail="GOOGLE_API_KEY is not configured on the server.")
+# ---------- AI Staging ----------
+STAGE_SCENES = {
+    "easel":  "Place the provided painting on a wooden artist easel in a modern, minimal room with natural window light and white curtains. the provided painting should fill out the main part of the image. DONT change the provided Painting AT ALL.",
+    "wall":   "Hang the provided painting on a clean white wall in a bright modern interior with soft natural light.",
+    "gallery":"Display the provided painting in a contemporary gallery setting with neutral walls and soft even lighting.",
+    "studio": "Place the provided painting in an artist studio scene with soft natural light and tasteful minimal decor."
+}
+
+
+async def _fetch_stage_image(url: str) -> tuple:
+    try:
+        r = await outbound.get("image", url, timeout=60)
+        if r.status_code != 200:
+            raise HTTPException(400, detail=f"Failed to fetch imageUrl: {r.status_code}")
+        mime = r.headers.get("content-type") or mimetypes.guess_type(url)[0] or "image/jpeg"
+        return mime, r.content
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(400, detail=f"Could not fetch imageUrl: {e}")
 
-    img_b64 = None
-    mime = "image/jpeg"
 
+async def _stage_source_image(body: StageIn) -> tuple:
+    """Returns (mime, base64) of the normalized source painting."""
     if body.imageData:
-        if body.imageData.startswith("data:"):
-            try:
-                header, data = body.imageData.split(",", 1)
-                if ";base64" in header:
-                    mime = header.split("data:")[1].split(";")[0] or mime
-                    img_b64 = data
-                else:
-                    raise ValueError("Expected base64 data URL")
-            except Exception:
-                raise HTTPException(400, detail="Invalid imageData data URL")
-        else:
-            img_b64 = body.imageData
+        mime, b64 = decode_image_data(body.imageData)
+        data = _b64decode_image(b64)
     elif body.imageUrl:
-        try:
-            async with httpx.AsyncClient(timeout=60) as cx:
-                r = await cx.get(body.imageUrl)
-            if r.status_code != 200:
-                raise HTTPException(400, detail=f"Failed to fetch imageUrl: {r.status_code}")
-            mime = r.headers.get("content-type") or mimetypes.guess_type(body.imageUrl)[0] or "image/jpeg"
-            img_b64 = base64.b64encode(r.content).decode("ascii")
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(400, detail=f"Could not fetch imageUrl: {e}")
+        mime, data = await _fetch_stage_image(body.imageUrl)
     else:
         raise HTTPException(400, detail="Provide imageUrl or imageData")
+    data, mime = await normalize_image(data, mime, "stage")
+    return mime, base64.b64encode(data).decode("ascii")
 
-    scene = (body.scene or "easel").lower()
-    if scene not in {"easel", "wall", "gallery", "studio"}:
-        scene = "easel"
 
-    scene_text = {
-        "easel":  "Place the provided painting on a wooden artist easel in a modern, minimal room with natural window light and white curtains. the provided painting should fill out the main part of the image. DONT change the provided Painting AT ALL.",
-        "wall":   "Hang the provided painting on a clean white wall in a bright modern interior with soft natural light.",
-        "gallery":"Display the provided painting in a contemporary gallery setting with neutral walls and soft even lighting.",
-        "studio": "Place the provided painting in an artist studio scene with soft natural light and tasteful minimal decor."
-    }[scene]
+async def _stage_stored_source(key: str, mime: str) -> tuple:
+    """Like _stage_source_image, for a source the job endpoint already put in stage_source_store."""
+    try:
+        data = await run_in_threadpool(stage_source_store.path(key).read_bytes)
+    except (OSError, ValueError):
+        raise HTTPException(410, detail="Source image is no longer available")
+    data, mime = await normalize_image(data, mime, "stage")
+    return mime, base64.b64encode(data).decode("ascii")
+
+
+def _stage_prompt(scene: Optional[str], extra: Optional[str], lang: Optional[str]) -> str:
+    scene = (scene or "easel").lower()
+    if scene not in STAGE_SCENES:
+        scene = "easel"
+    scene_text = STAGE_SCENES[scene]
 
     aspect_note = "Output must be a single photorealistic vertical image in 4:5 aspect ratio."
     safety_note = "Do not modify the painting’s content. Preserve its colors and proportions exactly; only compose the environment and placement realistically. The aspect ratio of the painting CANT NOT be altered and has to stay the same"
 
-    extra = (body.extraPrompt or "").strip()
-    lang = body.lang or "en"
+    extra = (extra or "").strip()
+    lang = lang or "en"
 
     if lang.startswith("de"):
         base_prompt = (
@@ -815,35 +3533,43 @@ async def ai_stage(body: StageIn):
             f"{scene_text} {aspect_note} {safety_note} "
             "Use realistic shadows, perspective, and correct proportions."
         )
-    full_prompt = (base_prompt + (" " + extra if extra else "")).strip()
+    return (base_prompt + (" " + extra if extra else "")).strip()
+
+
+async def _gemini_stage(prompt: str, mime: str, img_b64: str) -> tuple:
+    """Calls Gemini image generation; returns (mime, base64) of the first inline image."""
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        raise HTTPException(503, detail="GOOGLE_API_KEY is not configured on the server.")
 
-    endpoint = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image:generateContent"
     payload = {
         "contents": [{
             "parts": [
-                {"text": full_prompt},
+                {"text": prompt},
                 {"inline_data": {"mime_type": mime, "data": img_b64}},
             ]
         }],
     }
 
-    try:
-        async with httpx.AsyncClient(timeout=90) as cx:
-            r = await cx.post(
-                endpoint,
+    async with GEMINI_SEMAPHORE:
+        try:
+            r = await outbound.post(
+                "gemini",
+                GEMINI_IMAGE_ENDPOINT,
+                timeout=90,
                 headers={
                     "x-goog-api-key": api_key,
                     "Content-Type": "application/json",
                 },
                 json=payload,
             )
-        if r.status_code != 200:
-            raise HTTPException(r.status_code, detail=(r.text or "Gemini request failed"))
-        data = r.json()
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(502, detail=f"Gemini request error: {e}")
+            if r.status_code != 200:
+                raise HTTPException(r.status_code, detail=(r.text or "Gemini request failed"))
+            data = r.json()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(502, detail=f"Gemini request error: {e}")
     try:
         parts = data["candidates"][0]["content"]["parts"]
         b64_out = None
@@ -861,11 +3587,728 @@ async def ai_stage(body: StageIn):
             raise KeyError("No inline image in response")
     except Exception as e:
         raise HTTPException(500, detail=f"Could not parse image from Gemini response: {e}")
+    return out_mime, b64_out
+
+
+@api_router.post("/ai/stage")
+async def ai_stage(body: StageIn, format: Optional[str] = None):
+    """
+    Uses Gemini 2.5 Flash Image (aka Nano Banana) to stage the provided painting
+    in a scene (easel/wall/etc.). The result is written to the media store and
+    its URL returned; format=dataurl returns the old inline data: URL instead.
+    """
+    if not os.environ.get("GOOGLE_API_KEY"):
+        raise HTTPException(503, detail="GOOGLE_API_KEY is not configured on the server.")
+    mime, img_b64 = await _stage_source_image(body)
+    out_mime, b64_out = await _gemini_stage(_stage_prompt(body.scene, body.extraPrompt, body.lang), mime, img_b64)
+    if (format or "").lower() == "dataurl":
+        data_url = f"data:{out_mime};base64,{b64_out}"
+        return {"ok": True, "dataUrl": data_url}
+    key = await media_store.put(base64.b64decode(b64_out), out_mime)
+    return {"ok": True, "url": media_url(key), "mime": out_mime}
+
+
+async def _stage_batch_item(index: int, item: StageBatchScene, body: StageBatchIn, mime: str, img_b64: str, as_data_url: bool) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"index": index, "scene": item.scene}
+    try:
+        prompt = _stage_prompt(item.scene, item.extraPrompt if item.extraPrompt is not None else body.extraPrompt, body.lang)
+        out_mime, b64_out = await _gemini_stage(prompt, mime, img_b64)
+        if as_data_url:
+            out.update(ok=True, dataUrl=f"data:{out_mime};base64,{b64_out}")
+        else:
+            key = await media_store.put(base64.b64decode(b64_out), out_mime)
+            out.update(ok=True, url=media_url(key), mime=out_mime)
+    except HTTPException as e:
+        out.update(ok=False, status=e.status_code, error=str(e.detail))
+    except Exception as e:
+        logger.exception("Staging scene %s failed", item.scene)
+        out.update(ok=False, status=500, error=str(e))
+    return out
+
+
+@api_router.post("/ai/stage/batch")
+async def ai_stage_batch(body: StageBatchIn, request: Request, format: Optional[str] = None):
+    """
+    Stages one painting in several scenes. The source is fetched/decoded and
+    normalized once, the Gemini calls run concurrently (capped by
+    GEMINI_CONCURRENCY), and each result is streamed as a server-sent 'scene'
+    event as soon as it is ready, followed by one 'done' event. Source errors
+    are returned as a plain error before the stream starts; a failed scene is
+    reported in its own event and does not stop the others.
+    """
+    if not os.environ.get("GOOGLE_API_KEY"):
+        raise HTTPException(503, detail="GOOGLE_API_KEY is not configured on the server.")
+    t0 = time.perf_counter()
+    items = [StageBatchScene(scene=s) if isinstance(s, str) else s for s in body.scenes]
+    mime, img_b64 = await _stage_source_image(StageIn(imageUrl=body.imageUrl, imageData=body.imageData))
+    as_data_url = (format or "").lower() == "dataurl"
+    tasks: List[asyncio.Task] = []
+
+    def cancel_scenes():
+        for t in tasks:
+            t.cancel()
+
+    async def stream():
+        # The scene tasks start only once the body is being sent, so a client
+        # gone before then never leaves Gemini calls holding semaphore slots.
+        # The background hook cancels them however the stream ends.
+        tasks.extend(asyncio.create_task(_stage_batch_item(i, item, body, mime, img_b64, as_data_url)) for i, item in enumerate(items))
+        pending, ok = set(tasks), 0
+        try:
+            yield f"event: start\ndata: {json.dumps({'count': len(items), 'scenes': [it.scene for it in items]})}\n\n"
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=15, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                for t in done:
+                    result = t.result()
+                    ok += bool(result["ok"])
+                    yield f"event: scene\ndata: {json.dumps(result)}\n\n"
+            summary = {"ok": ok, "failed": len(items) - ok, "elapsedMs": round((time.perf_counter() - t0) * 1000)}
+            yield f"event: done\ndata: {json.dumps(summary)}\n\n"
+        finally:
+            cancel_scenes()
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(cancel_scenes),
+    )
+
+
+# ---------- AI Staging jobs ----------
+# Job mode: POST returns a job id at once and a small worker pool renders in the
+# background. Records live in memory and, when Mongo is configured, in the
+# stage_jobs collection so queued work survives a restart.
+STAGE_JOB_PROGRESS = {"queued": 0, "fetching": 10, "rendering": 30, "storing": 90, "done": 100, "failed": 100}
+STAGE_JOB_FINAL = {"done", "failed"}
+
+STAGE_JOB_RUNNING = ["fetching", "rendering", "storing"]
+
+stage_jobs = LRUCache(maxsize=256, ttl_s=STAGE_JOB_TTL_S)
+stage_job_queue: "asyncio.Queue[str]" = asyncio.Queue()
+stage_workers: List[asyncio.Task] = []
+# Inline sources of queued jobs; kept apart from media_store so deleting one
+# can never take an artwork image with the same bytes along with it.
+stage_source_store = LocalMediaStore(Path(STAGE_SOURCE_DIR))
+
+
+def _stage_job_public(job: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: job.get(k) for k in ("id", "status", "progress", "scene", "error", "createdAt", "updatedAt")}
+    for k in ("createdAt", "updatedAt"):
+        if isinstance(out[k], datetime):
+            out[k] = out[k].isoformat() + "Z"
+    out["imageUrl"] = media_url(job["resultKey"]) if job.get("status") == "done" and job.get("resultKey") else None
+    return out
+
+
+async def _stage_job_get(job_id: str) -> Optional[Dict[str, Any]]:
+    job = stage_jobs.get(job_id)
+    if job is None and db is not None:
+        row = await db.stage_jobs.find_one({"_id": job_id}, {"input": 0})
+        if row:
+            job = {**row, "id": row["_id"]}
+    return job
+
+
+async def _stage_job_update(job_id: str, **fields):
+    fields["updatedAt"] = datetime.utcnow()
+    if "status" in fields:
+        fields.setdefault("progress", STAGE_JOB_PROGRESS[fields["status"]])
+    job = stage_jobs.get(job_id)
+    if job is not None:
+        job.update(fields)
+    if db is not None:
+        await db.stage_jobs.update_one({"_id": job_id}, {"$set": fields})
+
+
+async def _stage_job_claim(job_id: str) -> Optional[Dict[str, Any]]:
+    """Atomically moves a queued job to running; returns it with its input, or None."""
+    now = datetime.utcnow()
+    if db is not None:
+        row = await db.stage_jobs.find_one_and_update(
+            {"_id": job_id, "status": "queued"},
+            {"$set": {
+                "status": "fetching", "progress": STAGE_JOB_PROGRESS["fetching"], "updatedAt": now,
+                "leaseUntil": now + timedelta(seconds=STAGE_JOB_STALE_S),
+            }},
+        )
+        if not row:
+            return None
+        job = stage_jobs.get(job_id) or {**{k: v for k, v in row.items() if k != "input"}, "id": job_id}
+        job.update(status="fetching", progress=STAGE_JOB_PROGRESS["fetching"], updatedAt=now)
+        job["input"] = job.get("input") or row.get("input")
+        stage_jobs.set(job_id, job)
+        return job
+    job = stage_jobs.get(job_id)
+    if not job or job.get("status") != "queued":
+        return None
+    job.update(status="fetching", progress=STAGE_JOB_PROGRESS["fetching"], updatedAt=now)
+    return job
+
+
+async def _stage_job_heartbeat(job_id: str):
+    """Renews a running job's lease, including while it waits for a Gemini slot."""
+    while True:
+        await asyncio.sleep(STAGE_JOB_STALE_S / 3)
+        now = datetime.utcnow()
+        await _run_logged(db.stage_jobs.update_one(
+            {"_id": job_id, "status": {"$in": STAGE_JOB_RUNNING}},
+            {"$set": {"leaseUntil": now + timedelta(seconds=STAGE_JOB_STALE_S), "updatedAt": now}},
+        ), "Stage job heartbeat")
+
+
+async def _stage_source_in_use(key: str, except_job: str) -> bool:
+    """Whether a job other than `except_job` that has not finished still needs this source."""
+    if db is not None:
+        return bool(await db.stage_jobs.find_one(
+            {"input.sourceKey": key, "status": {"$nin": list(STAGE_JOB_FINAL)}, "_id": {"$ne": except_job}}, {"_id": 1},
+        ))
+    return any(
+        j["id"] != except_job and j.get("status") not in STAGE_JOB_FINAL and (j.get("input") or {}).get("sourceKey") == key
+        for j in stage_jobs.values()
+    )
+
+
+async def _release_stage_source(job_id: str, inp: Optional[Dict[str, Any]]):
+    key = (inp or {}).get("sourceKey")
+    if key and not await _stage_source_in_use(key, job_id):
+        await run_in_threadpool(stage_source_store.delete, key)
+
+
+async def _run_stage_job(job_id: str):
+    job = await _stage_job_claim(job_id)
+    if job is None:
+        return
+    heartbeat = asyncio.create_task(_stage_job_heartbeat(job_id)) if db is not None else None
+    inp = job["input"]
+    try:
+        body = StageIn(**inp)
+        if inp.get("sourceKey"):
+            mime, img_b64 = await _stage_stored_source(inp["sourceKey"], inp["sourceMime"])
+        else:
+            mime, img_b64 = await _stage_source_image(body)
+        await _stage_job_update(job_id, status="rendering")
+        out_mime, b64_out = await _gemini_stage(_stage_prompt(body.scene, body.extraPrompt, body.lang), mime, img_b64)
+        await _stage_job_update(job_id, status="storing")
+        key = await media_store.put(base64.b64decode(b64_out), out_mime)
+        final = {"status": "done", "resultKey": key, "resultMime": out_mime}
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        if not isinstance(e, HTTPException):
+            logger.exception("Stage job %s failed", job_id)
+        final = {"status": "failed", "error": str(detail)}
+    finally:
+        if heartbeat is not None:
+            heartbeat.cancel()
+    if db is not None:
+        await db.stage_jobs.update_one({"_id": job_id}, {"$unset": {"input": ""}})
+    job.pop("input", None)
+    await _stage_job_update(job_id, leaseUntil=None, **final)
+    await _run_logged(_release_stage_source(job_id, inp), "Releasing stage source")
+
+
+async def _stage_worker():
+    while True:
+        job_id = await stage_job_queue.get()
+        try:
+            await _run_stage_job(job_id)
+        except Exception:
+            logger.exception("Stage worker error")
+        finally:
+            stage_job_queue.task_done()
+
+
+async def _resume_stage_jobs():
+    """Re-queues jobs left behind by a previous process: running, but with a lapsed lease."""
+    if db is None:
+        return
+    now = datetime.utcnow()
+    await db.stage_jobs.update_many(
+        {"status": {"$in": STAGE_JOB_RUNNING}, "$or": [
+            {"leaseUntil": {"$lt": now}},
+            {"leaseUntil": {"$exists": False}, "updatedAt": {"$lt": now - timedelta(seconds=STAGE_JOB_STALE_S)}},
+        ]},
+        {"$set": {"status": "queued", "progress": 0, "leaseUntil": None}},
+    )
+    async for row in db.stage_jobs.find({"status": "queued"}, {"_id": 1}).sort("createdAt", 1):
+        stage_job_queue.put_nowait(row["_id"])
+
+
+async def start_stage_workers():
+    if db is not None:
+        try:
+            await db.stage_jobs.create_index("updatedAt", expireAfterSeconds=int(STAGE_JOB_TTL_S))
+            await db.stage_jobs.create_index([("status", 1), ("createdAt", 1)])
+            await _resume_stage_jobs()
+        except Exception:
+            logger.exception("Resuming stage jobs failed")
+    for _ in range(STAGE_WORKERS):
+        stage_workers.append(asyncio.create_task(_stage_worker()))
+    stage_workers.append(asyncio.create_task(gc_stage_sources()))
+
+
+async def sweep_stage_sources() -> int:
+    """Deletes source blobs older than the job lease that no unfinished job points at."""
+    removed = 0
+    for key in await run_in_threadpool(stage_source_store.stale_keys, time.time() - STAGE_JOB_STALE_S):
+        if not await _stage_source_in_use(key, ""):
+            await run_in_threadpool(stage_source_store.delete, key)
+            removed += 1
+    return removed
+
+
+async def gc_stage_sources():
+    """Catches sources a finished job did not release (crash, TTL-expired queued job)."""
+    while True:
+        try:
+            removed = await sweep_stage_sources()
+            if removed:
+                logger.info("Removed %d orphaned stage sources", removed)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Stage source GC failed")
+        await asyncio.sleep(STAGE_SOURCE_GC_INTERVAL_S)
+
+
+async def stop_stage_workers():
+    for t in stage_workers:
+        t.cancel()
+    await asyncio.gather(*stage_workers, return_exceptions=True)
+    stage_workers.clear()
+
+
+@api_router.post("/ai/stage/jobs", status_code=202)
+async def create_stage_job(body: StageIn):
+    if not os.environ.get("GOOGLE_API_KEY"):
+        raise HTTPException(503, detail="GOOGLE_API_KEY is not configured on the server.")
+    if not body.imageData and not body.imageUrl:
+        raise HTTPException(400, detail="Provide imageUrl or imageData")
+    if stage_job_queue.qsize() >= STAGE_QUEUE_MAX:
+        raise HTTPException(429, detail="Staging queue is full, try again shortly.")
+    # Inline images go to stage_source_store so the job record only carries a
+    # key, not several MB of base64 in memory and in Mongo. The record is
+    # written first, so a finishing job sharing the source sees it as in use.
+    inp = body.dict(exclude={"imageData"})
+    source = None
+    if body.imageData:
+        mime, b64 = decode_image_data(body.imageData)
+        source = (_b64decode_image(b64), mime)
+        inp["sourceKey"] = stage_source_store.make_key(*source)
+        inp["sourceMime"] = mime
+
+    now = datetime.utcnow()
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": "queued",
+        "progress": 0,
+        "scene": body.scene,
+        "error": None,
+        "createdAt": now,
+        "updatedAt": now,
+        "input": inp,
+    }
+    stage_jobs.set(job["id"], job)
+    if db is not None:
+        await db.stage_jobs.insert_one({**{k: v for k, v in job.items() if k != "id"}, "_id": job["id"]})
+    if source:
+        await stage_source_store.put(*source)
+    stage_job_queue.put_nowait(job["id"])
+    out = _stage_job_public(job)
+    out["statusUrl"] = f"/api/ai/stage/jobs/{job['id']}"
+    out["eventsUrl"] = f"/api/ai/stage/jobs/{job['id']}/events"
+    return out
+
+
+@api_router.get("/ai/stage/jobs/{job_id}")
+async def get_stage_job(job_id: str):
+    job = await _stage_job_get(job_id)
+    if not job:
+        raise HTTPException(404, detail="Job not found")
+    return _stage_job_public(job)
+
+
+@api_router.get("/ai/stage/jobs/{job_id}/events")
+async def stage_job_events(job_id: str, request: Request):
+    """Server-sent events: one 'status' event per change, ending on done/failed."""
+    if not await _stage_job_get(job_id):
+        raise HTTPException(404, detail="Job not found")
+
+    async def stream():
+        last = None
+        idle = 0.0
+        while not await request.is_disconnected():
+            job = await _stage_job_get(job_id)
+            if not job:
+                break
+            state = (job.get("status"), job.get("progress"))
+            if state != last:
+                last = state
+                idle = 0.0
+                yield f"event: status\ndata: {json.dumps(_stage_job_public(job))}\n\n"
+                if job.get("status") in STAGE_JOB_FINAL:
+                    break
+            elif idle >= 15:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(STAGE_EVENTS_POLL_S)
+            idle += STAGE_EVENTS_POLL_S
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@api_router.get("/media/{key}", name="get_media")
+async def get_media(key: str, request: Request):
+    """Serves a stored blob with a strong ETag, immutable caching and single-range support."""
+    if not media_store.exists(key):
+        raise HTTPException(404, detail="Not found")
+    path = media_store.path(key)
+    etag = f'"{key.split(".")[0]}"'
+    mime = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    headers = {"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        size = path.stat().st_size
+        rng = _parse_range(range_header, size)
+        if rng:
+            start, end = rng
+            data = await run_in_threadpool(_read_range, path, start, end)
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return Response(content=data, status_code=206, media_type=mime, headers=headers)
+    return FileResponse(path, media_type=mime, headers=headers)
+
+
+
+# ---------- Instagram outbox ----------
+# Posts for Make are written to a durable outbox and delivered by background
+# workers, so a slow or failing webhook no longer loses the post. Mongo is
+# used when configured, otherwise a local SQLite file stands in.
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_S = float(os.environ.get("OUTBOX_BACKOFF_S", "5"))
+OUTBOX_BACKOFF_MAX_S = float(os.environ.get("OUTBOX_BACKOFF_MAX_S", "1800"))
+OUTBOX_LEASE_S = float(os.environ.get("OUTBOX_LEASE_S", "120"))
+OUTBOX_POLL_S = float(os.environ.get("OUTBOX_POLL_S", "5"))
+OUTBOX_RATE_PER_MIN = float(os.environ.get("OUTBOX_RATE_PER_MIN", "20"))
+OUTBOX_SQLITE_PATH = os.environ.get("OUTBOX_SQLITE_PATH", str(ROOT_DIR / "outbox.sqlite3"))
+OUTBOX_STATUSES = {"queued", "sending", "sent", "dead"}
+
+
+def _outbox_idempotency_key(request: Request, target: str, fields: Dict[str, Any]) -> str:
+    """
+    The client's Idempotency-Key header, else one derived from the body's
+    requestId (scoped to artworkId when sent), else a fresh key. Never the
+    payload itself: posting the same caption and images again is a new post.
+    """
+    key = (request.headers.get("idempotency-key") or "").strip()
+    if key:
+        return key
+    request_id = str(fields.get("requestId") or "").strip()
+    if request_id:
+        scope = f"{target}\0{fields.get('artworkId') or ''}\0{request_id}"
+        return hashlib.sha256(scope.encode("utf-8")).hexdigest()
+    return uuid.uuid4().hex
+
+
+def _outbox_public(entry: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: entry.get(k) for k in ("id", "target", "status", "attempts", "lastError", "idempotencyKey", "createdAt", "updatedAt", "nextAttemptAt", "sentAt")}
+    for k, v in out.items():
+        if isinstance(v, datetime):
+            out[k] = v.isoformat() + "Z"
+    payload = entry.get("payload") or {}
+    out["images"] = payload.get("images")
+    out["caption"] = payload.get("caption")
+    return out
+
+
+def _new_outbox_entry(target: str, payload: Dict[str, Any], key: str) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        "id": uuid.uuid4().hex, "target": target, "payload": payload, "idempotencyKey": key,
+        "status": "queued", "attempts": 0, "lastError": None,
+        "createdAt": now, "updatedAt": now, "nextAttemptAt": now, "leaseUntil": None, "sentAt": None,
+    }
+
+
+class MongoOutbox:
+    def __init__(self, coll):
+        self.coll = coll
+
+    @staticmethod
+    def _out(row):
+        return {**row, "id": row["_id"]} if row else None
+
+    async def ensure_indexes(self):
+        await self.coll.create_index("idempotencyKey", unique=True)
+        await self.coll.create_index([("status", 1), ("nextAttemptAt", 1)])
+
+    async def add(self, target, payload, key):
+        entry = _new_outbox_entry(target, payload, key)
+        doc = {k: v for k, v in entry.items() if k != "id"}
+        try:
+            await self.coll.insert_one({**doc, "_id": entry["id"]})
+            return entry, True
+        except DuplicateKeyError:
+            return self._out(await self.coll.find_one({"idempotencyKey": key})), False
+
+    async def claim(self):
+        now = datetime.utcnow()
+        row = await self.coll.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "nextAttemptAt": {"$lte": now}},
+                {"status": "sending", "leaseUntil": {"$lt": now}},
+            ]},
+            {"$set": {"status": "sending", "leaseUntil": now + timedelta(seconds=OUTBOX_LEASE_S), "updatedAt": now}},
+            sort=[("nextAttemptAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return self._out(row)
+
+    async def update(self, entry_id, **fields):
+        fields["updatedAt"] = datetime.utcnow()
+        await self.coll.update_one({"_id": entry_id}, {"$set": fields})
+
+    async def requeue(self, entry_id):
+        now = datetime.utcnow()
+        res = await self.coll.update_one(
+            {"_id": entry_id, "status": "dead"},
+            {"$set": {"status": "queued", "attempts": 0, "nextAttemptAt": now, "updatedAt": now}},
+        )
+        return res.modified_count > 0
+
+    async def list(self, status_f, limit):
+        q = {"status": status_f} if status_f else {}
+        rows = await self.coll.find(q).sort("createdAt", -1).limit(limit).to_list(limit)
+        return [self._out(r) for r in rows]
+
+
+class SqliteOutbox:
+    """Single-file stand-in for MongoOutbox when no database is configured."""
+
+    _COLUMNS = ("id", "target", "payload", "idempotencyKey", "status", "attempts", "lastError",
+                "createdAt", "updatedAt", "nextAttemptAt", "leaseUntil", "sentAt")
+    _TIMES = {"createdAt", "updatedAt", "nextAttemptAt", "leaseUntil", "sentAt"}
+
+    def __init__(self, path: str):
+        import sqlite3
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox (id TEXT PRIMARY KEY, target TEXT, payload TEXT, "
+            "idempotencyKey TEXT UNIQUE, status TEXT, attempts INTEGER, lastError TEXT, createdAt REAL, "
+            "updatedAt REAL, nextAttemptAt REAL, leaseUntil REAL, sentAt REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, nextAttemptAt)")
+
+    def _to_row(self, entry):
+        row = {}
+        for k in self._COLUMNS:
+            v = entry.get(k)
+            if k in self._TIMES and isinstance(v, datetime):
+                v = v.timestamp()
+            elif k == "payload":
+                v = json.dumps(v)
+            row[k] = v
+        return row
+
+    def _from_row(self, row):
+        if row is None:
+            return None
+        out = dict(row)
+        for k in self._TIMES:
+            if out.get(k) is not None:
+                out[k] = datetime.fromtimestamp(out[k])
+        out["payload"] = json.loads(out["payload"])
+        return out
+
+    def _run(self, fn, *args):
+        with self._lock:
+            return fn(*args)
+
+    async def ensure_indexes(self):
+        return None
+
+    async def add(self, target, payload, key):
+        entry = _new_outbox_entry(target, payload, key)
+        row = self._to_row(entry)
+
+        def op():
+            cur = self._conn.execute(
+                f"INSERT OR IGNORE INTO outbox ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})", list(row.values())
+            )
+            if cur.rowcount:
+                return entry, True
+            return self._from_row(self._conn.execute("SELECT * FROM outbox WHERE idempotencyKey = ?", (key,)).fetchone()), False
+        return await run_in_threadpool(self._run, op)
+
+    async def claim(self):
+        def op():
+            now = datetime.utcnow().timestamp()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM outbox WHERE (status = 'queued' AND nextAttemptAt <= ?) "
+                    "OR (status = 'sending' AND leaseUntil < ?) ORDER BY nextAttemptAt LIMIT 1", (now, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE outbox SET status = 'sending', leaseUntil = ?, updatedAt = ? WHERE id = ?",
+                        (now + OUTBOX_LEASE_S, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._from_row(row)
+        return await run_in_threadpool(self._run, op)
+
+    async def update(self, entry_id, **fields):
+        fields["updatedAt"] = datetime.utcnow()
+        vals = self._to_row(fields)
+        vals = {k: vals[k] for k in fields}
+
+        def op():
+            sets = ", ".join(f"{k} = ?" for k in vals)
+            self._conn.execute(f"UPDATE outbox SET {sets} WHERE id = ?", [*vals.values(), entry_id])
+        await run_in_threadpool(self._run, op)
+
+    async def requeue(self, entry_id):
+        def op():
+            now = datetime.utcnow().timestamp()
+            cur = self._conn.execute(
+                "UPDATE outbox SET status = 'queued', attempts = 0, nextAttemptAt = ?, updatedAt = ? "
+                "WHERE id = ? AND status = 'dead'", (now, now, entry_id)
+            )
+            return cur.rowcount > 0
+        return await run_in_threadpool(self._run, op)
+
+    async def list(self, status_f, limit):
+        def op():
+            if status_f:
+                rows = self._conn.execute("SELECT * FROM outbox WHERE status = ? ORDER BY createdAt DESC LIMIT ?", (status_f, limit))
+            else:
+                rows = self._conn.execute("SELECT * FROM outbox ORDER BY createdAt DESC LIMIT ?", (limit,))
+            return [self._from_row(r) for r in rows.fetchall()]
+        return await run_in_threadpool(self._run, op)
+
 
-    data_url = f"data:{out_mime};base64,{b64_out}"
-    return {"ok": True, "dataUrl": data_url}
+_outbox = None
+outbox_wakeup = asyncio.Event()
+outbox_workers: List[asyncio.Task] = []
 
 
+def outbox_store():
+    global _outbox
+    if _outbox is None:
+        _outbox = MongoOutbox(db.ig_outbox) if db is not None else SqliteOutbox(OUTBOX_SQLITE_PATH)
+    return _outbox
+
+
+class RateLimiter:
+    """Token bucket per key; acquire() waits until a token is available."""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets: Dict[str, tuple] = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, key: str):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate) - 1
+            self._buckets[key] = (tokens, now)
+        if tokens < 0:
+            await asyncio.sleep(-tokens / self.rate)
+
+
+outbox_rate = RateLimiter(OUTBOX_RATE_PER_MIN, burst=3)
+
+
+def _outbox_target_url(target: str) -> str:
+    if target == "make":
+        return MAKE_WEBHOOK_URL
+    raise ValueError(f"unknown outbox target {target}")
+
+
+def _outbox_backoff(attempts: int) -> float:
+    return min(OUTBOX_BACKOFF_MAX_S, OUTBOX_BACKOFF_S * (2 ** (attempts - 1))) * random.uniform(0.5, 1.0)
+
+
+async def _deliver_outbox_entry(entry: Dict[str, Any]):
+    store = outbox_store()
+    attempts = int(entry.get("attempts") or 0) + 1
+    await outbox_rate.acquire(entry["target"])
+    error, permanent = None, False
+    try:
+        payload = {**entry["payload"], "secret": IG_SECRET}
+        r = await outbound.post(entry["target"], _outbox_target_url(entry["target"]), timeout=15, json=payload,
+                                headers={"Idempotency-Key": entry["idempotencyKey"]})
+        if r.status_code < 300:
+            await store.update(entry["id"], status="sent", attempts=attempts, sentAt=datetime.utcnow(), lastError=None, leaseUntil=None)
+            return
+        error = f"HTTP {r.status_code}: {r.text[:300]}"
+        permanent = 400 <= r.status_code < 500 and r.status_code not in (408, 409, 429)
+    except Exception as e:
+        error = f"{e.__class__.__name__}: {e}"
+    if permanent or attempts >= OUTBOX_MAX_ATTEMPTS:
+        logger.warning("Outbox entry %s dead-lettered after %s attempts: %s", entry["id"], attempts, error)
+        await store.update(entry["id"], status="dead", attempts=attempts, lastError=error, leaseUntil=None)
+    else:
+        next_at = datetime.utcnow() + timedelta(seconds=_outbox_backoff(attempts))
+        await store.update(entry["id"], status="queued", attempts=attempts, lastError=error, nextAttemptAt=next_at, leaseUntil=None)
+
+
+async def _outbox_worker():
+    store = outbox_store()
+    while True:
+        try:
+            entry = await store.claim()
+        except Exception:
+            logger.exception("Outbox claim failed")
+            entry = None
+        if entry is None:
+            outbox_wakeup.clear()
+            try:
+                await asyncio.wait_for(outbox_wakeup.wait(), timeout=OUTBOX_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _deliver_outbox_entry(entry)
+        except Exception:
+            logger.exception("Outbox delivery crashed for %s", entry.get("id"))
+
+
+async def start_outbox_workers():
+    try:
+        await outbox_store().ensure_indexes()
+    except Exception:
+        logger.exception("Creating outbox indexes failed")
+    for _ in range(OUTBOX_WORKERS):
+        outbox_workers.append(asyncio.create_task(_outbox_worker()))
+
+
+async def stop_outbox_workers():
+    for t in outbox_workers:
+        t.cancel()
+    await asyncio.gather(*outbox_workers, return_exceptions=True)
+    outbox_workers.clear()
+
 
 # ---------- Instagram → Make proxy ----------
 MAKE_IG_WEBHOOK = os.getenv(
@@ -897,6 +4340,7 @@ async def instagram_queue(request: Request):
             raise HTTPException(400, detail="Carousel requires at least 2 images.")
         files = [{"image_url": u, "media_type": "IMAGE"} for u in clean_images]
         payload = {"images": clean_images, "files": files, "caption": caption, "secret": IG_SECRET}
+        key = _outbox_idempotency_key(request, "make", data)
 
     else:
         form = await request.form()
@@ -908,23 +4352,30 @@ async def instagram_queue(request: Request):
         if not image_url:
             raise HTTPException(400, detail="missing image_url")
         payload = {"images": [image_url], "files": [{"URL": image_url}], "caption": caption, "secret": IG_SECRET}
+        key = _outbox_idempotency_key(request, "make", form)
 
-    # Forward to Make
-    try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            r = await client.post(MAKE_WEBHOOK_URL, json=payload)
-    except Exception as e:
-        raise HTTPException(502, detail=f"forward failed: {e!s}")
-    if r.status_code >= 300:
-        err_detail = r.text
-        try:
-            err_json = r.json()
-            err_detail = err_json.get("error") if isinstance(err_json, dict) else err_json
-        except Exception:
-            pass
-        raise HTTPException(r.status_code, detail=f"Make error ({r.status_code}): {err_detail}")
+    payload.pop("secret", None)  # added back at delivery time, never stored
+    entry, created = await outbox_store().add("make", payload, key)
+    outbox_wakeup.set()
+    body = {"ok": True, "id": entry["id"], "status": entry["status"], "duplicate": not created}
+    return JSONResponse(status_code=202 if created else 200, content=body)
+
+
+@api_router.get("/instagram/outbox")
+async def instagram_outbox(status_f: Optional[str] = None, limit: int = Query(50, ge=1, le=500), user: User = Depends(require_admin)):
+    if status_f and status_f not in OUTBOX_STATUSES:
+        raise HTTPException(400, detail=f"status_f must be one of {sorted(OUTBOX_STATUSES)}")
+    rows = await outbox_store().list(status_f, limit)
+    return {"items": [_outbox_public(r) for r in rows]}
+
+
+@api_router.post("/instagram/outbox/{entry_id}/retry")
+async def instagram_outbox_retry(entry_id: str, user: User = Depends(require_admin)):
+    if not await outbox_store().requeue(entry_id):
+        raise HTTPException(404, detail="No dead-lettered entry with that id")
+    outbox_wakeup.set()
     return {"ok": True}
-    
+
 @app.get("/api/instagram/diag")
 async def instagram_diag():
     hook = os.environ.get("MAKE_IG_WEBHOOK")
@@ -936,8 +4387,7 @@ async def instagram_diag():
         )
 
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            r = await client.post(hook, json={"ping": True, "secret": secret})
+        r = await outbound.post("make", hook, timeout=15, json={"ping": True, "secret": secret})
         return {"ok": True, "status": r.status_code, "body": (r.json() if r.headers.get("content-type","").startswith("application/json") else r.text[:500])}
     except httpx.RequestError as e:
         return JSONResponse(
@@ -950,6 +4400,20 @@ async def instagram_diag():
             content={"ok": False, "error": f"other: {str(e)}", "type": e.__class__.__name__}
         )
 
+@api_router.get("/diag/outbound")
+async def outbound_diag(user: User = Depends(require_admin)):
+    return {"http2": OUTBOUND_HTTP2, "upstreams": outbound.snapshot()}
+
+@api_router.get("/diag/cache")
+async def cache_diag(user: User = Depends(require_admin)):
+    return {
+        "catalog": catalog_cache.stats(),
+        "caption": caption_cache.stats(),
+        "normalizedImages": normalized_images.stats(),
+        "authClaims": auth_claims.stats(),
+        "authUsers": auth_users.stats(),
+    }
+
 # ---------- Router mount ----------
 app.include_router(api_router)
 
@@ -960,7 +4424,109 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+background_tasks: List[asyncio.Task] = []
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "0") == "1"
+startup_t0: Optional[float] = None
+
+@app.on_event("startup")
+async def open_clients():
+    global startup_t0
+    startup_t0 = time.perf_counter()
+    connect_mongo()
+
+async def warm_up():
+    """Opt-in (STARTUP_WARMUP=1): connects to Mongo and loads the provider SDKs after the worker is already serving."""
+    if client is not None:
+        await _run_logged(client.admin.command("ping"), "Mongo warm-up")
+    for build in (stripe_sdk, openai_client):
+        await run_in_threadpool(build)
+
+async def ensure_db_indexes():
+    await _run_logged(catalog_revision.seed(), "Seeding the catalog revision")
+    try:
+        await ensure_artwork_indexes()
+        await ensure_id_indexes()
+    except Exception:
+        logger.exception("Creating artwork indexes failed")
+    asyncio.create_task(_run_logged(backfill_search_tokens(), "searchTokens backfill"))
+    try:
+        await db.revoked_tokens.create_index("expiresAt", expireAfterSeconds=0)
+    except Exception:
+        logger.exception("Creating revoked token index failed")
+    if CAPTION_CACHE_MONGO:
+        try:
+            await db.caption_cache.create_index("expiresAt", expireAfterSeconds=0)
+        except Exception:
+            logger.exception("Creating caption cache index failed")
+    try:
+        await db.checkouts.create_index("expiresAt", expireAfterSeconds=0)
+        await db.artworks.create_index("reservation.expiresAt", name="art_reservation", sparse=True)
+    except Exception:
+        logger.exception("Creating checkout indexes failed")
+
+@app.on_event("startup")
+async def prepare_db():
+    # Index builds are idempotent and only speed queries up, so they run
+    # behind the first requests instead of holding up the worker's boot.
+    if db is None:
+        return
+    background_tasks.append(asyncio.create_task(ensure_db_indexes()))
+
+@app.on_event("startup")
+async def start_background_workers():
+    outbound.client  # open the shared outbound pool before traffic arrives
+    background_tasks.append(asyncio.create_task(watch_event_loop_lag()))
+    # The worker starters create indexes and resume jobs first; that waits on
+    # Mongo, so it happens after the worker is already answering requests.
+    background_tasks.append(asyncio.create_task(_run_logged(start_queue_workers(), "Starting queue workers")))
+    if db is not None and CATALOG_CHANGE_STREAMS:
+        background_tasks.append(asyncio.create_task(watch_catalog_changes()))
+    if db is not None:
+        catalog_snapshot.start()
+        background_tasks.append(asyncio.create_task(token_denylist.run()))
+        background_tasks.append(asyncio.create_task(gc_uploads()))
+        background_tasks.append(asyncio.create_task(run_reservation_release()))
+    if STARTUP_WARMUP:
+        background_tasks.append(asyncio.create_task(warm_up()))
+
+@app.on_event("startup")
+async def report_startup():
+    if not STARTUP_PROFILE:
+        return
+    builtins.__import__ = _builtin_import
+    now = time.perf_counter()
+    slowest = sorted(import_times.items(), key=lambda kv: kv[1], reverse=True)[:12]
+    logger.info(
+        "Startup profile: module load %.0f ms, startup hooks %.0f ms; slowest imports: %s",
+        (MODULE_LOADED_T - BOOT_T0) * 1000, (now - (startup_t0 or now)) * 1000,
+        ", ".join(f"{name} {t * 1000:.0f} ms" for name, t in slowest),
+    )
+
+async def start_queue_workers():
+    await start_stage_workers()
+    await start_outbox_workers()
+    if db is not None:
+        await start_stripe_event_workers()
+
+async def _run_logged(coro, what: str):
+    try:
+        await coro
+    except Exception:
+        logger.exception("%s failed", what)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await stop_stage_workers()
+    await stop_outbox_workers()
+    await stop_stripe_event_workers()
+    await catalog_snapshot.stop()
+    for t in background_tasks:
+        t.cancel()
+    await outbound.close()
+    shutdown_image_pool()
+    password_executor.shutdown(wait=False, cancel_futures=True)
+    stripe_executor.shutdown(wait=False, cancel_futures=True)
     if client:
         client.close()
+
+MODULE_LOADED_T = time.perf_counter()
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import server
+
+CREATED = datetime(2024, 3, 1, 12, 0, 0, 123000)
+
+
+def _row(**fields):
+    base = {
+        "_id": ObjectId(), "title": "Red Sun", "priceCents": 120000, "category": "Painting",
+        "imageUrl": "/api/media/" + "a" * 64 + ".jpg", "year": 2024, "medium": "Acrylic",
+        "dimensions": "60x80 cm", "status": "available", "createdAt": CREATED, "updatedAt": CREATED,
+    }
+    base.update(fields)
+    return {k: v for k, v in base.items() if v is not ...}
+
+
+def _model_dump(r):
+    return server._artwork_model({**r, "id": str(r["_id"])}).model_dump()
+
+
+@pytest.mark.parametrize("row", [
+    _row(),
+    _row(imageUrl=None, year=None, medium=None, dimensions=None),
+    _row(priceCents=1200.0),
+    _row(year="2019"),
+    _row(priceCents="500"),
+    _row(status=..., imageUrl=..., medium=..., dimensions=..., year=...),
+    _row(status=..., updatedAt=...),
+], ids=["current", "nulls", "float-price", "string-year", "string-price", "missing-optionals", "missing-defaults"])
+def test_artwork_row_matches_model(row):
+    got = server.artwork_row(row)
+    want = _model_dump(row)
+    if "updatedAt" not in row:  # default_factory: both sides stamp "now"
+        got.pop("updatedAt"), want.pop("updatedAt")
+    assert got == want
+    assert list(got) == list(want)
+    assert server.json_dumps(got) == server.json_dumps(want)
+
+
+def test_artwork_row_coerces_legacy_types():
+    got = server.artwork_row(_row(priceCents=1200.0, year="2019"))
+    assert type(got["priceCents"]) is int and got["priceCents"] == 1200
+    assert got["year"] == 2019
+
+
+def test_artwork_row_rejects_rows_the_model_rejects():
+    with pytest.raises(ValueError):
+        server.artwork_row(_row(category=...))
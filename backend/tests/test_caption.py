@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+BODY = {"title": "Dunes", "year": 2024, "medium": "acrylic", "imageUrl": "https://img.test/dunes.jpg"}
+
+
+@pytest.fixture
+def model(api, monkeypatch):
+    """Counts completions; each one waits on `gate` so callers can pile up behind it."""
+    state = {"calls": 0, "gate": asyncio.Event()}
+
+    async def fake_completion(system_prompt, content):
+        state["calls"] += 1
+        await state["gate"].wait()
+        return f"DESC: Warm light on sand, take {state['calls']}.\nTAGS: #dunes #sand"
+
+    monkeypatch.setattr(server, "openai_client", lambda: object())
+    monkeypatch.setattr(server, "_caption_completion", fake_completion)
+    server.caption_cache.clear()
+    return state
+
+
+async def _settle(state, calls):
+    for _ in range(200):
+        if state["calls"] >= calls:
+            return
+        await asyncio.sleep(0.005)
+
+
+async def test_concurrent_captions_share_one_completion(api, model):
+    reqs = [asyncio.create_task(api.post("/api/ai/caption", json=BODY)) for _ in range(8)]
+    await _settle(model, 1)
+    # The loop is free while the completion is in flight.
+    r = await asyncio.wait_for(api.get("/health"), timeout=2)
+    assert r.status_code == 200
+    model["gate"].set()
+    out = await asyncio.gather(*reqs)
+    assert model["calls"] == 1
+    assert all(r.status_code == 200 for r in out)
+    assert {r.json()["caption"].splitlines()[1] for r in out} == {"Warm light on sand, take 1."}
+
+
+async def test_cached_caption_is_reused_unless_forced(api, model):
+    model["gate"].set()
+    first = await api.post("/api/ai/caption", json=BODY)
+    again = await api.post("/api/ai/caption", json=BODY)
+    assert model["calls"] == 1
+    assert first.json()["caption"].splitlines()[1] == again.json()["caption"].splitlines()[1]
+    forced = await api.post("/api/ai/caption", json={**BODY, "force": True})
+    assert model["calls"] == 2
+    assert forced.json()["caption"].splitlines()[1] == "Warm light on sand, take 2."
+
+
+async def test_different_artworks_are_not_shared(api, model):
+    model["gate"].set()
+    await api.post("/api/ai/caption", json=BODY)
+    await api.post("/api/ai/caption", json={**BODY, "title": "Tides"})
+    assert model["calls"] == 2
@@ -0,0 +1,49 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+POST = {"images": ["https://img.test/a.jpg", "https://img.test/b.jpg"], "caption": "New work"}
+
+
+@pytest.fixture(params=["mongo", "sqlite"])
+async def outbox(request, api, monkeypatch, tmp_path):
+    store = server.MongoOutbox(server.db.ig_outbox) if request.param == "mongo" else server.SqliteOutbox(str(tmp_path / "outbox.sqlite3"))
+    await store.ensure_indexes()
+    monkeypatch.setattr(server, "_outbox", store)
+    return store
+
+
+async def _queue(api, key=None, body=POST):
+    headers = {"Idempotency-Key": key} if key else {}
+    return await api.post("/api/instagram/queue", json=body, headers=headers)
+
+
+async def test_same_payload_with_new_keys_is_two_posts(api, outbox):
+    first, second = await _queue(api, "k1"), await _queue(api, "k2")
+    assert first.status_code == second.status_code == 202
+    assert first.json()["id"] != second.json()["id"]
+    assert len(await outbox.list(None, 10)) == 2
+
+
+async def test_same_payload_without_a_key_is_two_posts(api, outbox):
+    first, second = await _queue(api), await _queue(api)
+    assert first.status_code == second.status_code == 202
+    assert len(await outbox.list(None, 10)) == 2
+
+
+async def test_replayed_key_is_one_post(api, outbox):
+    first = await _queue(api, "k1")
+    again = await _queue(api, "k1", {**POST, "caption": "edited"})
+    assert again.status_code == 200 and again.json()["duplicate"]
+    assert again.json()["id"] == first.json()["id"]
+    assert len(await outbox.list(None, 10)) == 1
+
+
+async def test_request_id_dedupes_per_artwork(api, outbox):
+    await _queue(api, body={**POST, "requestId": "r1", "artworkId": "a1"})
+    dup = await _queue(api, body={**POST, "requestId": "r1", "artworkId": "a1"})
+    other = await _queue(api, body={**POST, "requestId": "r1", "artworkId": "a2"})
+    assert dup.json()["duplicate"] and not other.json()["duplicate"]
+    assert len(await outbox.list(None, 10)) == 2
@@ -0,0 +1,69 @@
+import asyncio
+import base64
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Fake _gemini_stage that blocks until released and records starts and cancellations."""
+    state = {"started": 0, "cancelled": 0, "release": asyncio.Event()}
+
+    async def fake_stage(prompt, mime, img_b64):
+        state["started"] += 1
+        try:
+            await state["release"].wait()
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        return "image/png", base64.b64encode(b"png").decode()
+
+    async def fake_source(body):
+        return "image/png", base64.b64encode(b"src").decode()
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.setattr(server, "_gemini_stage", fake_stage)
+    monkeypatch.setattr(server, "_stage_source_image", fake_source)
+    return state
+
+
+class _Request:
+    async def is_disconnected(self):
+        return True
+
+
+async def _batch(scenes):
+    body = server.StageBatchIn(imageUrl="https://example.test/a.jpg", scenes=scenes)
+    return await server.ai_stage_batch(body, _Request(), format="dataurl")
+
+
+async def test_streams_every_scene(api, gemini):
+    gemini["release"].set()
+    r = await api.post("/api/ai/stage/batch?format=dataurl", json={"imageUrl": "https://example.test/a.jpg", "scenes": ["easel", "wall", "gallery"]})
+    events = [line.split(": ", 1)[1] for line in r.text.splitlines() if line.startswith("event: ")]
+    assert events == ["start", "scene", "scene", "scene", "done"]
+    assert gemini["started"] == 3
+
+
+async def test_no_scene_starts_when_the_body_is_never_sent(gemini):
+    response = await _batch(["easel", "wall"])
+    await asyncio.sleep(0.05)
+    assert gemini["started"] == 0
+    await response.background()
+    assert gemini["cancelled"] == 0
+
+
+async def test_scenes_are_cancelled_when_the_client_goes_away(gemini):
+    response = await _batch(["easel", "wall", "studio"])
+    first = await response.body_iterator.__anext__()
+    assert first.startswith("event: start")
+    await asyncio.sleep(0.05)
+    assert gemini["started"] == 3
+    await response.background()  # runs even when the stream was cut short
+    await asyncio.sleep(0.05)
+    assert gemini["cancelled"] == 3
+    await response.body_iterator.aclose()
@@ -0,0 +1,110 @@
+import asyncio
+import base64
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+SOURCE = b"\x89PNG not really"
+IMAGE_DATA = "data:image/png;base64," + base64.b64encode(SOURCE).decode()
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    state = {"fail": False, "gate": None}
+
+    async def fake_stage(prompt, mime, img_b64):
+        if state["gate"] is not None:
+            await state["gate"].wait()
+        if state["fail"]:
+            raise server.HTTPException(502, detail="upstream down")
+        return "image/png", base64.b64encode(b"staged").decode()
+
+    async def fake_normalize(data, mime, purpose):
+        return data, mime
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.setattr(server, "_gemini_stage", fake_stage)
+    monkeypatch.setattr(server, "normalize_image", fake_normalize)
+    yield state
+    while not server.stage_job_queue.empty():
+        server.stage_job_queue.get_nowait()
+        server.stage_job_queue.task_done()
+
+
+async def _create(api):
+    r = await api.post("/api/ai/stage/jobs", json={"imageData": IMAGE_DATA, "scene": "wall"})
+    assert r.status_code == 202
+    job_id = r.json()["id"]
+    key = (await server.db.stage_jobs.find_one({"_id": job_id}))["input"]["sourceKey"]
+    return job_id, key
+
+
+@pytest.mark.parametrize("fail", [False, True])
+async def test_source_is_deleted_when_the_job_finishes(api, gemini, fail):
+    gemini["fail"] = fail
+    job_id, key = await _create(api)
+    assert server.stage_source_store.exists(key)
+    await server._run_stage_job(job_id)
+    doc = await server.db.stage_jobs.find_one({"_id": job_id})
+    assert doc["status"] == ("failed" if fail else "done")
+    assert "input" not in doc
+    assert not server.stage_source_store.exists(key)
+
+
+async def test_shared_source_survives_until_the_last_job(api, gemini):
+    first, key = await _create(api)
+    second, same_key = await _create(api)
+    assert key == same_key
+    await server._run_stage_job(first)
+    assert server.stage_source_store.exists(key)
+    await server._run_stage_job(second)
+    assert not server.stage_source_store.exists(key)
+
+
+async def test_sweep_removes_orphans_but_not_queued_sources(api, gemini):
+    _, queued_key = await _create(api)
+    orphan_key = await server.stage_source_store.put(b"left behind", "image/png")
+    old = time.time() - 2 * server.STAGE_JOB_STALE_S
+    for key in (queued_key, orphan_key):
+        os.utime(server.stage_source_store.path(key), (old, old))
+    assert await server.sweep_stage_sources() == 1
+    assert server.stage_source_store.exists(queued_key)
+    assert not server.stage_source_store.exists(orphan_key)
+
+
+async def test_lease_is_renewed_while_a_job_waits(api, gemini, monkeypatch):
+    monkeypatch.setattr(server, "STAGE_JOB_STALE_S", 0.3)
+    gemini["gate"] = asyncio.Event()
+    job_id, _ = await _create(api)
+    run = asyncio.create_task(server._run_stage_job(job_id))
+    await asyncio.sleep(0.5)  # longer than the lease: only the heartbeat keeps it live
+    doc = await server.db.stage_jobs.find_one({"_id": job_id})
+    assert doc["status"] == "rendering"
+    assert doc["leaseUntil"] > datetime.utcnow()
+    await server._resume_stage_jobs()
+    assert (await server.db.stage_jobs.find_one({"_id": job_id}))["status"] == "rendering"
+    gemini["gate"].set()
+    await run
+    assert (await server.db.stage_jobs.find_one({"_id": job_id}))["status"] == "done"
+
+
+async def test_jobs_with_a_lapsed_lease_are_requeued(mongo):
+    past = datetime.utcnow() - timedelta(seconds=1)
+    await mongo.stage_jobs.insert_many([
+        {"_id": "dead", "status": "rendering", "leaseUntil": past, "updatedAt": past, "createdAt": past},
+        {"_id": "live", "status": "rendering", "leaseUntil": datetime.utcnow() + timedelta(minutes=5), "updatedAt": past, "createdAt": past},
+    ])
+    try:
+        await server._resume_stage_jobs()
+        assert (await mongo.stage_jobs.find_one({"_id": "dead"}))["status"] == "queued"
+        assert (await mongo.stage_jobs.find_one({"_id": "live"}))["status"] == "rendering"
+    finally:
+        while not server.stage_job_queue.empty():
+            server.stage_job_queue.get_nowait()
+            server.stage_job_queue.task_done()
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+IMPORT_S = 0.5
+
+
+@pytest.fixture
+def slow_stripe(api, monkeypatch):
+    """A stripe module whose import blocks its thread; records where the import and calls ran."""
+    seen = {}
+    real_lazy_module = server.lazy_module
+
+    def create(**params):
+        seen["create"] = threading.current_thread()
+        return SimpleNamespace(id="cs_1", url="https://checkout.test/pay")
+
+    def verify_header(*args, **kwargs):
+        raise ValueError("bad signature")
+
+    def lazy_module(name):
+        if name != "stripe":
+            return real_lazy_module(name)
+        seen["import"] = threading.current_thread()
+        time.sleep(IMPORT_S)
+        return SimpleNamespace(
+            new_default_http_client=lambda timeout: None,
+            checkout=SimpleNamespace(Session=SimpleNamespace(create=create)),
+            WebhookSignature=SimpleNamespace(verify_header=verify_header),
+        )
+
+    monkeypatch.setattr(server, "lazy_module", lazy_module)
+    monkeypatch.setattr(server, "STRIPE_SECRET_KEY", "sk_test_tests")
+    monkeypatch.setattr(server, "STRIPE_WEBHOOK_SECRET", "whsec_tests")
+    server.stripe_sdk.cache_clear()
+    server.checkout_sessions.clear()
+    yield seen
+    server.stripe_sdk.cache_clear()
+
+
+async def _health_while(api, call):
+    task = asyncio.create_task(call)
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+    r = await api.get("/health")
+    waited = time.perf_counter() - t0
+    assert r.status_code == 200
+    assert waited < IMPORT_S / 2, f"/health waited {waited:.2f}s behind the Stripe import"
+    return await task
+
+
+async def test_checkout_imports_and_calls_stripe_off_the_loop(api, slow_stripe):
+    art_id = ObjectId()
+    await server.db.artworks.insert_one({"_id": art_id, "title": "Dunes", "priceCents": 12000, "status": "available"})
+    r = await _health_while(api, api.post("/api/checkout/create-session", data={"artworkId": str(art_id), "buyerEmail": "b@example.com"}))
+    assert r.status_code == 200, r.text
+    loop_thread = threading.current_thread()
+    assert slow_stripe["import"] is not loop_thread
+    assert slow_stripe["create"] is not loop_thread
+
+
+async def test_webhook_imports_stripe_off_the_loop(api, slow_stripe):
+    r = await _health_while(api, api.post("/api/checkout/webhook", content=b"{}", headers={"stripe-signature": "t=1,v1=00"}))
+    assert r.status_code == 400
+    assert slow_stripe["import"] is not threading.current_thread()
@@ -0,0 +1,186 @@
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+SECRET = "whsec_tests"
+BUYER = "buyer@example.com"
+
+
+@pytest.fixture
+async def stripe_env(api, monkeypatch):
+    pytest.importorskip("stripe")
+    monkeypatch.setattr(server, "STRIPE_WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(server, "STRIPE_SECRET_KEY", "sk_test_tests")
+    server.stripe_seen_events.clear()
+    server.checkout_sessions.clear()
+    art_id = ObjectId()
+    await server.db.artworks.insert_one({"_id": art_id, "title": "Dunes", "priceCents": 12000, "status": "available"})
+    return str(art_id)
+
+
+def sign(payload: bytes, at: int) -> str:
+    mac = hmac.new(SECRET.encode(), f"{at}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={at},v1={mac}"
+
+
+async def deliver(api, event_id, etype, art_id, session_id, payment_status="paid"):
+    """Posts one signed event and applies everything queued, as the worker would."""
+    key = server.checkout_key(art_id, BUYER)
+    payload = json.dumps({
+        "id": event_id, "type": etype, "created": int(time.time()), "livemode": False,
+        "data": {"object": {
+            "id": session_id, "payment_status": payment_status, "amount_total": 12000, "currency": "eur",
+            "client_reference_id": art_id, "metadata": {"artworkId": art_id, "checkoutKey": key},
+        }},
+    }).encode()
+    r = await api.post("/api/checkout/webhook", content=payload, headers={"stripe-signature": sign(payload, int(time.time()))})
+    assert r.status_code == 200, r.text
+    while (ev := await server._claim_stripe_event()):
+        await server._process_stripe_event(ev)
+    return r.json()
+
+
+async def reserve(art_id, expires_in=timedelta(minutes=30)):
+    await server.db.artworks.update_one({"_id": ObjectId(art_id)}, {"$set": {
+        "status": "reserved",
+        "reservation": {"key": server.checkout_key(art_id, BUYER), "expiresAt": datetime.utcnow() + expires_in},
+    }})
+
+
+async def state(art_id, session_id="cs_1"):
+    art = await server.db.artworks.find_one({"_id": ObjectId(art_id)})
+    order = await server.db.orders.find_one({"_id": session_id})
+    return art, order
+
+
+async def test_bad_signature_is_rejected(api, stripe_env):
+    payload = b'{"id": "evt_x", "type": "checkout.session.completed"}'
+    r = await api.post("/api/checkout/webhook", content=payload, headers={"stripe-signature": "t=1,v1=00"})
+    assert r.status_code == 400
+
+
+async def test_paid_completion_sells_once(api, stripe_env):
+    art_id = stripe_env
+    await reserve(art_id)
+    await deliver(api, "evt_1", "checkout.session.completed", art_id, "cs_1")
+    dup = await deliver(api, "evt_1", "checkout.session.completed", art_id, "cs_1")
+    assert dup["duplicate"]
+    art, order = await state(art_id)
+    assert art["status"] == "sold" and "reservation" not in art
+    assert order["status"] == "paid"
+    assert await server.db.orders.count_documents({}) == 1
+
+
+@pytest.mark.parametrize("outcome, art_status, order_status", [
+    ("checkout.session.async_payment_succeeded", "sold", "paid"),
+    ("checkout.session.async_payment_failed", "available", "failed"),
+])
+async def test_delayed_payment(api, stripe_env, outcome, art_status, order_status):
+    art_id = stripe_env
+    await reserve(art_id)
+    await deliver(api, "evt_1", "checkout.session.completed", art_id, "cs_1", "unpaid")
+    art, order = await state(art_id)
+    assert art["status"] == "reserved" and order["status"] == "pending"
+    assert art["reservation"]["expiresAt"] > datetime.utcnow() + timedelta(days=1)
+    await deliver(api, "evt_2", outcome, art_id, "cs_1", "paid" if "succeeded" in outcome else "unpaid")
+    await deliver(api, "evt_2", outcome, art_id, "cs_1")
+    art, order = await state(art_id)
+    assert art["status"] == art_status and order["status"] == order_status
+
+
+@pytest.mark.parametrize("outcome, art_status, order_status", [
+    ("checkout.session.async_payment_succeeded", "sold", "paid"),
+    ("checkout.session.async_payment_failed", "available", "failed"),
+])
+async def test_settlement_before_completion_is_not_undone(api, stripe_env, outcome, art_status, order_status):
+    art_id = stripe_env
+    await reserve(art_id)
+    await deliver(api, "evt_2", outcome, art_id, "cs_1")
+    await deliver(api, "evt_1", "checkout.session.completed", art_id, "cs_1", "unpaid")
+    art, order = await state(art_id)
+    assert art["status"] == art_status and order["status"] == order_status
+
+
+async def test_expiry_releases_the_hold(api, stripe_env):
+    art_id = stripe_env
+    await reserve(art_id)
+    await deliver(api, "evt_1", "checkout.session.expired", art_id, "cs_1", "unpaid")
+    art, order = await state(art_id)
+    assert art["status"] == "available" and order is None
+
+
+async def test_late_expiry_keeps_a_clearing_payment_held(api, stripe_env):
+    art_id = stripe_env
+    await reserve(art_id)
+    await deliver(api, "evt_2", "checkout.session.completed", art_id, "cs_2", "unpaid")
+    await deliver(api, "evt_1", "checkout.session.expired", art_id, "cs_1", "unpaid")
+    art, _ = await state(art_id)
+    assert art["status"] == "reserved"
+
+
+@pytest.fixture
+def fake_checkout(monkeypatch):
+    """Stands in for stripe.checkout.Session.create with Stripe's expires_at limits."""
+    fake = SimpleNamespace(calls=[], fail=False)
+
+    def create(**params):
+        fake.calls.append(params)
+        if fake.fail:
+            raise RuntimeError("card network down")
+        now = time.time()
+        if not now + 1800 <= params["expires_at"] <= now + 86400:
+            raise ValueError("expires_at must be between 30 minutes and 24 hours out")
+        return SimpleNamespace(id=f"cs_new_{len(fake.calls)}", url="https://checkout.test/pay")
+
+    sdk = SimpleNamespace(
+        checkout=SimpleNamespace(Session=SimpleNamespace(create=create)),
+        WebhookSignature=pytest.importorskip("stripe").WebhookSignature,
+    )
+    monkeypatch.setattr(server, "stripe_sdk", lambda: sdk)
+    return fake
+
+
+async def checkout(api, art_id):
+    return await api.post("/api/checkout/create-session", data={"artworkId": art_id, "buyerEmail": BUYER})
+
+
+async def test_reclick_while_payment_clears_is_refused(api, stripe_env, fake_checkout):
+    art_id = stripe_env
+    await reserve(art_id)
+    await deliver(api, "evt_1", "checkout.session.completed", art_id, "cs_1", "unpaid")
+    r = await checkout(api, art_id)
+    assert r.status_code == 409
+    assert fake_checkout.calls == []
+    art, order = await state(art_id)
+    assert art["status"] == "reserved" and order["status"] == "pending"
+
+
+async def test_reused_hold_is_clamped_and_survives_a_stripe_error(api, stripe_env, fake_checkout):
+    art_id = stripe_env
+    await reserve(art_id, expires_in=timedelta(days=14))
+    fake_checkout.fail = True
+    assert (await checkout(api, art_id)).status_code == 502
+    art, _ = await state(art_id)
+    assert art["status"] == "reserved"
+    fake_checkout.fail = False
+    r = await checkout(api, art_id)
+    assert r.status_code == 200, r.text
+    assert fake_checkout.calls[-1]["expires_at"] <= time.time() + 86400
+
+
+async def test_new_hold_is_released_on_a_stripe_error(api, stripe_env, fake_checkout):
+    art_id = stripe_env
+    fake_checkout.fail = True
+    assert (await checkout(api, art_id)).status_code == 502
+    art, _ = await state(art_id)
+    assert art["status"] == "available"
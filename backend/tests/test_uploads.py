@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+DATA = b"0123456789abcdefghij"  # five 4-byte parts
+
+
+@pytest.fixture
+async def upload(api, monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_PART_SIZE", 4)
+    r = await api.post("/api/uploads/init", data={"filename": "a.png", "size": len(DATA), "type": "image/png"})
+    assert r.status_code == 200
+    return r.json()["uploadId"]
+
+
+async def _put(api, upload_id, n, body, sha=None):
+    headers = {"X-Content-SHA256": sha} if sha else {}
+    return await api.put(f"/api/uploads/{upload_id}/part", params={"partNumber": n}, content=body, headers=headers)
+
+
+def _chunk(n):
+    return DATA[(n - 1) * 4:n * 4]
+
+
+async def test_bad_checksum_keeps_the_stored_part(api, upload):
+    for n in range(1, 6):
+        assert (await _put(api, upload, n, _chunk(n))).status_code == 200
+    r = await _put(api, upload, 1, b"XXXX", sha=hashlib.sha256(_chunk(1)).hexdigest())
+    assert r.status_code == 400
+    r = await api.post(f"/api/uploads/{upload}/complete")
+    assert r.status_code == 200
+    assert r.json()["sha256"] == hashlib.sha256(DATA).hexdigest()
+
+
+async def test_concurrent_puts_of_one_part_keep_record_and_bytes_in_step(api, upload):
+    for n in range(2, 6):
+        await _put(api, upload, n, _chunk(n))
+    await asyncio.gather(*(_put(api, upload, 1, body) for body in (b"AAAA", b"BBBB", _chunk(1), b"CCCC")))
+    await _put(api, upload, 1, _chunk(1))
+    doc = await server.db.uploads.find_one({"_id": upload})
+    sha = doc["parts"]["1"]["sha256"]
+    assert server.upload_backend.part_path(upload, 1, sha).read_bytes() == _chunk(1)
+    r = await api.post(f"/api/uploads/{upload}/complete")
+    assert r.json()["sha256"] == hashlib.sha256(DATA).hexdigest()
+
+
+async def test_part_during_assembly_is_refused(api, upload, monkeypatch):
+    for n in range(1, 6):
+        await _put(api, upload, n, _chunk(n))
+    await server.db.uploads.update_one({"_id": upload}, {"$set": {"status": "assembling"}})
+    real = server._upload_doc
+
+    async def still_open(upload_id):  # the status check ran before complete flipped it
+        return {**await real(upload_id), "status": "open"}
+
+    monkeypatch.setattr(server, "_upload_doc", still_open)
+    r = await _put(api, upload, 1, b"LATE")
+    assert r.status_code == 409
+    doc = await server.db.uploads.find_one({"_id": upload})
+    assert doc["parts"]["1"]["sha256"] == hashlib.sha256(_chunk(1)).hexdigest()
+
+
+async def test_missing_part_file_is_a_409_and_is_forgotten(api, upload):
+    for n in range(1, 6):
+        await _put(api, upload, n, _chunk(n))
+    server.upload_backend.part_path(upload, 3, hashlib.sha256(_chunk(3)).hexdigest()).unlink()
+    r = await api.post(f"/api/uploads/{upload}/complete")
+    assert r.status_code == 409
+    status = (await api.get(f"/api/uploads/{upload}")).json()
+    assert status["status"] == "open"
+    assert 3 not in [p["partNumber"] for p in status["parts"]]
+    await _put(api, upload, 3, _chunk(3))
+    assert (await api.post(f"/api/uploads/{upload}/complete")).status_code == 200
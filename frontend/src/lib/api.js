@@ -28,6 +28,15 @@ const UPLOAD_ENDPOINT =
   (typeof window !== "undefined" && window.__UPLOAD_ENDPOINT__) ||
   "https://jpart.at/upload.php";
 
+// "1" routes image uploads through the backend's resumable /uploads API instead of upload.php.
+const UPLOAD_RESUMABLE =
+  String(
+    (typeof import.meta !== "undefined" && import.meta.env?.VITE_UPLOAD_RESUMABLE) ||
+    (typeof process !== "undefined" && process.env?.REACT_APP_UPLOAD_RESUMABLE) ||
+    (typeof window !== "undefined" && window.__UPLOAD_RESUMABLE__) ||
+    ""
+  ) === "1";
+
 const UPLOAD_KEY =
   (typeof import.meta !== "undefined" && import.meta.env?.VITE_UPLOAD_KEY) ||
   (typeof process !== "undefined" && process.env?.REACT_APP_UPLOAD_KEY) ||
@@ -143,7 +152,7 @@ function buildUrl(resourceOrPath, params = {}) {
   }
 }
 
-async function http(method, resourceOrPath, { params, body, headers } = {}) {
+async function http(method, resourceOrPath, { params, body, headers, onResponse } = {}) {
   const url = buildUrl(resourceOrPath, params);
   const isForm = body && typeof FormData !== "undefined" && body instanceof FormData;
 
@@ -167,6 +176,7 @@ async function http(method, resourceOrPath, { params, body, headers } = {}) {
     const msg = json?.detail || json?.error || `${res.status} ${res.statusText}`;
     throw new Error(msg);
   }
+  onResponse?.(res);
   return json;
 }
 
@@ -213,7 +223,43 @@ export async function listArtworks(params = {}) {
     if (params?.category) out = out.filter((a) => a.category === params.category);
     return devClone(out);
   }
-  return http("GET", "artworks", { params });
+  if (isPhp) return http("GET", "artworks", { params });
+  // The backend returns one page at a time and sends the next page's cursor
+  // in X-Next-Cursor; follow it so callers still get the whole list.
+  const out = [];
+  let cursor = params?.cursor;
+  do {
+    const page = await http("GET", "artworks", {
+      params: { ...params, cursor },
+      onResponse: (res) => { cursor = res.headers.get("X-Next-Cursor") || undefined; },
+    });
+    out.push(...page);
+  } while (cursor);
+  return out;
+}
+
+// Counts per category / year / status / price bucket for the given filters.
+export async function artworkFacets(params = {}) {
+  if (DEV_LOCAL || isPhp) throw new Error("facets not supported by this backend");
+  return http("GET", "artworks/facets", { params });
+}
+
+// Public gallery: one precompressed snapshot of the whole catalog. The small
+// /catalog/version probe lets a repeat visit skip refetching an unchanged one.
+let catalogSnapshot = null;
+
+export async function getCatalogSnapshot() {
+  if (DEV_LOCAL || isPhp) return { version: null, artworks: await listArtworks() };
+  const base = API_BASE.replace(/\/$/, "");
+  if (catalogSnapshot) {
+    const r = await fetch(`${base}/catalog/version`);
+    const j = await r.json().catch(() => ({}));
+    if (r.ok && j.version === catalogSnapshot.version) return catalogSnapshot;
+  }
+  const res = await fetch(`${base}/catalog/snapshot`);
+  if (!res.ok) throw new Error(`${res.status} ${res.statusText}`);
+  catalogSnapshot = await res.json();
+  return catalogSnapshot;
 }
 
 export async function createArtwork(payload) {
@@ -360,12 +406,53 @@ export async function createCheckoutSession({ artworkId, buyerEmail }) {
   return http("POST", "/checkout/create-session", { body: fd });
 }
 
+async function sha256Hex(buf) {
+  const digest = await crypto.subtle.digest("SHA-256", buf);
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+// Sends parts a few at a time; a retry only re-sends the parts the server is missing.
+async function uploadResumable(blob, filename, { concurrency = 3, retries = 3 } = {}) {
+  const base = RESOLVED_API_FAST.replace(/\/$/, "");
+  const fd = new FormData();
+  fd.append("filename", filename);
+  fd.append("size", String(blob.size));
+  fd.append("type", blob.type || "image/jpeg");
+  const init = await httpFast("/uploads/init", { body: fd });
+  const { uploadId, partSize } = init;
+
+  for (let attempt = 0; ; attempt++) {
+    const st = await httpFast(`/uploads/${uploadId}`, { method: "GET" });
+    const have = new Set(st.parts.map((p) => p.partNumber));
+    const todo = [];
+    for (let n = 1; n <= init.parts; n++) if (!have.has(n)) todo.push(n);
+    if (!todo.length) break;
+    if (attempt > retries) throw new Error("upload failed");
+    const sendPart = async (n) => {
+      const part = await blob.slice((n - 1) * partSize, n * partSize).arrayBuffer();
+      await fetch(`${base}/uploads/${uploadId}/part?partNumber=${n}`, {
+        method: "PUT",
+        credentials: "include",
+        headers: { "Content-Type": "application/octet-stream", "X-Content-SHA256": await sha256Hex(part) },
+        body: part,
+      }).catch(() => null);
+    };
+    const queue = [...todo];
+    await Promise.all(Array.from({ length: Math.min(concurrency, queue.length) }, async () => {
+      while (queue.length) await sendPart(queue.shift());
+    }));
+  }
+  const done = await httpFast(`/uploads/${uploadId}/complete`);
+  return new URL(done.fileUrl, base).toString();
+}
+
 export async function uploadImageBlob(blob, filename = "image.jpg") {
   if (DEV_LOCAL) {
     const url = URL.createObjectURL(blob);
     devDB.blobs.push(url);
     return url;
   }
+  if (UPLOAD_RESUMABLE) return uploadResumable(blob, filename);
   const fd = new FormData();
   fd.append("key", UPLOAD_KEY);
   fd.append("file", blob, filename);
@@ -407,7 +494,64 @@ export async function igStageScene({ imageUrl, imageData, scene = "easel", extra
     const msg = json.detail || json.error || `stage failed (${res.status})`;
     throw new Error(msg);
   }
-  return json.dataUrl;
+  if (json.dataUrl) return json.dataUrl;
+  // Staged images are served as binary; load them into a same-origin blob URL
+  // so the composer can keep drawing them onto a canvas.
+  const img = await fetch(new URL(json.url, RESOLVED_API_FAST).toString());
+  if (!img.ok) throw new Error(`stage image failed (${img.status})`);
+  return URL.createObjectURL(await img.blob());
+}
+
+// Stages one painting in several scenes with a single upload. The server
+// streams each scene as it finishes; onScene({ index, scene, ok, src, error })
+// fires per result and the full list (in request order) is returned at the end.
+export async function igStageScenes({ imageUrl, imageData, scenes, extraPrompt = "", lang = "en", onScene }) {
+  const base = RESOLVED_API_FAST.replace(/\/$/, "");
+  const res = await fetch(`${base}/ai/stage/batch`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+    body: JSON.stringify({ imageUrl, imageData, scenes, extraPrompt, lang }),
+  });
+  if (!res.ok || !res.body) {
+    const json = await res.json().catch(() => ({}));
+    throw new Error(json.detail || json.error || `stage failed (${res.status})`);
+  }
+
+  const results = new Array(scenes.length).fill(null);
+  const handle = async (event, data) => {
+    if (event !== "scene") return;
+    const r = JSON.parse(data);
+    let src = r.dataUrl || null;
+    if (r.ok && !src) {
+      const img = await fetch(new URL(r.url, RESOLVED_API_FAST).toString());
+      if (img.ok) src = URL.createObjectURL(await img.blob());
+    }
+    const item = { index: r.index, scene: r.scene, ok: Boolean(src), src, error: r.error };
+    results[r.index] = item;
+    onScene?.(item);
+  };
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buf.indexOf("\n\n")) >= 0) {
+      const block = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      let event = "message";
+      const data = [];
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data.push(line.slice(6));
+      }
+      if (data.length) await handle(event, data.join("\n"));
+    }
+  }
+  return results;
 }
 
 export async function generateAICaption({
@@ -16,6 +16,7 @@ import ArtworkDetail from "../components/ArtworkDetail";
 import {
   uploadImageBlob,
   listArtworks,
+  getCatalogSnapshot,
   createArtwork,
   updateArtwork as apiUpdateArtwork,
   deleteArtwork as apiDeleteArtwork,
@@ -166,13 +167,14 @@ export default function Gallery() {
 
   const refreshArtworks = async () => {
     try {
-      const data = await listArtworks();
+      // Admins read live data so their own edits show up before the snapshot is rebuilt.
+      const data = isAdmin ? await listArtworks() : (await getCatalogSnapshot()).artworks;
       setArtworks(Array.isArray(data) ? data.map(normalizeArt) : []);
     } catch {
       setArtworks([]);
     }
   };
-  useEffect(() => { refreshArtworks(); }, []);
+  useEffect(() => { refreshArtworks(); }, [isAdmin]);
 
   const derived = useMemo(() => {
     const prices = artworks.map((a) => a.priceCents || 0);